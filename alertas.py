@@ -0,0 +1,237 @@
+"""
+Alertas de stock crítico en segundo plano → outbox local (SQLite).
+
+Cada ciclo lee los movimientos nuevos (id > última marca), toma los SKUs tocados y
+re-evalúa SOLO esos con la RPC `sp_stock_critico` (umbrales por SKU en `umbrales_stock`).
+Cuando un SKU entra en crítico se escribe un evento en la outbox; cuando sale, se libera
+para que la próxima caída vuelva a alertar. Un notificador (correo, WhatsApp, etc.)
+consume `pendientes()` y llama `marcar_enviadas()`.
+
+Uso como sidecar:
+    python alertas.py run --intervalo 30
+    python alertas.py pendientes
+
+Dentro de la app se arranca una sola vez por proceso (ver `get_alertas` en app.py).
+
+El umbral por defecto (SKUs sin umbral propio) es uno solo para todo el proceso: se lee
+de `parametros_inventario` (clave 'umbral_default', UMBRAL_DEFAULT si no existe) y, si
+cambia, el siguiente ciclo re-evalúa todos los SKUs.
+"""
+
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from datetime import datetime, timezone
+from pathlib import Path
+
+OUTBOX_PATH = Path(os.getenv("ALERTAS_OUTBOX", "alertas_outbox.sqlite"))
+UMBRAL_DEFAULT = int(os.getenv("UMBRAL_DEFAULT", "5"))
+
+TBL_MOV = "movimientos"
+TBL_PARAMETROS = "parametros_inventario"
+_PAGINA = 1000
+
+_ESQUEMA = """
+create table if not exists alertas(
+  id integer primary key autoincrement,
+  creado_en text not null,
+  bodega text not null,
+  codigo text not null,
+  detalle text,
+  cantidad integer not null,
+  umbral integer not null,
+  enviada integer not null default 0
+);
+create index if not exists idx_alertas_pendientes on alertas(enviada, id);
+create table if not exists activos(
+  bodega text not null,
+  codigo text not null,
+  primary key (bodega, codigo)
+);
+create table if not exists estado(
+  clave text primary key,
+  valor text
+);
+"""
+
+
+# ==========================
+# Outbox (SQLite)
+# ==========================
+
+def _conectar(path: Path = OUTBOX_PATH) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=10)
+    conn.execute("pragma journal_mode=wal")
+    conn.executescript(_ESQUEMA)
+    return conn
+
+
+def _leer_estado(conn: sqlite3.Connection, clave: str) -> int | None:
+    row = conn.execute("select valor from estado where clave=?", (clave,)).fetchone()
+    return int(row[0]) if row else None
+
+
+def pendientes(path: Path = OUTBOX_PATH, limite: int = 100) -> list[dict]:
+    with closing(_conectar(path)) as conn:
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute("select * from alertas where enviada=0 order by id limit ?", (limite,)).fetchall()
+        return [dict(r) for r in rows]
+
+
+def contar_pendientes(path: Path = OUTBOX_PATH) -> int:
+    with closing(_conectar(path)) as conn:
+        return conn.execute("select count(*) from alertas where enviada=0").fetchone()[0]
+
+
+def marcar_enviadas(ids: list[int], path: Path = OUTBOX_PATH) -> None:
+    with closing(_conectar(path)) as conn, conn:
+        conn.executemany("update alertas set enviada=1 where id=?", [(i,) for i in ids])
+
+
+# ==========================
+# Evaluación incremental
+# ==========================
+
+def movimientos_nuevos(sb, desde_id: int) -> tuple[set[str], int]:
+    """Códigos tocados por movimientos con id > desde_id y nueva marca."""
+    codigos, marca = set(), desde_id
+    while True:
+        res = sb.table(TBL_MOV).select("id,codigo_barras").gt("id", marca).order("id").limit(_PAGINA).execute()
+        filas = res.data or []
+        if not filas:
+            break
+        codigos.update(f["codigo_barras"] for f in filas)
+        marca = max(int(f["id"]) for f in filas)
+        if len(filas) < _PAGINA:
+            break
+    return codigos, marca
+
+
+def ultimo_mov_id(sb) -> int:
+    res = sb.table(TBL_MOV).select("id").order("id", desc=True).limit(1).execute()
+    return int(res.data[0]["id"]) if res.data else 0
+
+
+def umbral_configurado(sb) -> int:
+    """Umbral por defecto compartido (parametros_inventario); UMBRAL_DEFAULT si no está definido."""
+    try:
+        res = sb.table(TBL_PARAMETROS).select("valor").eq("clave", "umbral_default").limit(1).execute()
+        return int(res.data[0]["valor"]) if res.data else UMBRAL_DEFAULT
+    except Exception:
+        return UMBRAL_DEFAULT
+
+
+def stock_critico(sb, umbral_default: int = UMBRAL_DEFAULT, codigos: list[str] | None = None) -> list[dict]:
+    params = {"p_umbral_default": int(umbral_default), "p_codigos": codigos}
+    return sb.rpc("sp_stock_critico", params).execute().data or []
+
+
+def evaluar(sb, umbral_default: int | None = None, path: Path = OUTBOX_PATH) -> int:
+    """Un ciclo: re-evalúa SKUs tocados desde la última corrida. Devuelve alertas nuevas.
+
+    Sin `umbral_default` se usa el configurado (`umbral_configurado`).
+    """
+    if umbral_default is None:
+        umbral_default = umbral_configurado(sb)
+    with closing(_conectar(path)) as conn:
+        marca = _leer_estado(conn, "ultimo_mov_id")
+        if marca is None or _leer_estado(conn, "umbral_default") != umbral_default:
+            # Primera corrida o cambió el umbral por defecto: evaluación completa
+            nueva_marca = ultimo_mov_id(sb)
+            tocados = None
+        else:
+            tocados, nueva_marca = movimientos_nuevos(sb, marca)
+            if not tocados:
+                return 0
+
+        criticos = stock_critico(sb, umbral_default, sorted(tocados) if tocados is not None else None)
+        claves_crit = {(c["bodega"], c["codigo_barras"]) for c in criticos}
+        ahora = datetime.now(timezone.utc).isoformat()
+
+        with conn:
+            activos = set(conn.execute("select bodega, codigo from activos").fetchall())
+            nuevas = [c for c in criticos if (c["bodega"], c["codigo_barras"]) not in activos]
+            conn.executemany(
+                "insert into alertas(creado_en, bodega, codigo, detalle, cantidad, umbral) values(?,?,?,?,?,?)",
+                [(ahora, c["bodega"], c["codigo_barras"], c.get("detalle"), int(c["cantidad"]), int(c["umbral"])) for c in nuevas],
+            )
+            conn.executemany("insert or ignore into activos(bodega, codigo) values(?,?)", [(c["bodega"], c["codigo_barras"]) for c in nuevas])
+
+            # SKUs evaluados que ya no están en crítico se liberan
+            if tocados is None:
+                liberar = activos - claves_crit
+            else:
+                liberar = {k for k in activos if k[1] in tocados} - claves_crit
+            conn.executemany("delete from activos where bodega=? and codigo=?", list(liberar))
+            conn.executemany("insert or replace into estado(clave, valor) values(?, ?)",
+                             [("ultimo_mov_id", str(nueva_marca)), ("umbral_default", str(umbral_default))])
+        return len(nuevas)
+
+
+class ProgramadorAlertas:
+    """Hilo daemon que corre `evaluar` cada `intervalo` segundos.
+
+    `umbral_default` fija el umbral; con None (por defecto) se lee el configurado en cada ciclo.
+    """
+
+    def __init__(self, sb, intervalo: float = 30, umbral_default: int | None = None, path: Path = OUTBOX_PATH):
+        self.sb = sb
+        self.intervalo = intervalo
+        self.umbral_default = umbral_default
+        self.path = path
+        self.ultimo_error: str | None = None
+        self.ultima_corrida: datetime | None = None
+        self._stop = threading.Event()
+        self._hilo = threading.Thread(target=self._loop, name="alertas-stock", daemon=True)
+
+    def start(self):
+        if not self._hilo.is_alive():
+            self._hilo.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                evaluar(self.sb, self.umbral_default, self.path)
+                self.ultimo_error = None
+            except Exception as e:
+                self.ultimo_error = str(e)
+            self.ultima_corrida = datetime.now(timezone.utc)
+            self._stop.wait(self.intervalo)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Alertas de stock crítico → outbox SQLite")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p_run = sub.add_parser("run", help="Evaluar en bucle (sidecar)")
+    p_run.add_argument("--intervalo", type=float, default=30)
+    p_run.add_argument("--umbral", type=int, help="Umbral fijo para SKUs sin umbral propio (default: parametros_inventario)")
+    sub.add_parser("pendientes", help="Listar alertas no enviadas")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "pendientes":
+        for a in pendientes():
+            print(f"{a['id']}\t{a['creado_en']}\t{a['bodega']}\t{a['codigo']}\t{a['cantidad']}<={a['umbral']}")
+        return
+
+    from inventario import get_client  # import diferido: inventario importa este módulo
+
+    sb = get_client()
+    while True:
+        try:
+            n = evaluar(sb, args.umbral)
+            if n:
+                print(f"{datetime.now():%Y-%m-%d %H:%M:%S} · {n} alertas nuevas")
+        except Exception as e:
+            print(f"Error evaluando alertas: {e}")
+        time.sleep(args.intervalo)
+
+
+if __name__ == "__main__":
+    main()
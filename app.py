@@ -5,13 +5,14 @@ Autor: ChatGPT (para Santi Correa)
 Tablas existentes (según tu esquema):
 - public.productos_crudos(codigo_crudo PK, detalle_crudo, cc, ff, tt, mm)
 - public.relacion_crudo_terminado(codigo_terminado PK, detalle, cc, ff, tt, aa, mm, codigo_crudo FK→productos_crudos)
+- public.bom_terminados(codigo_terminado FK, codigo_crudo FK, cantidad) — componentes crudos por terminado (ver SQL abajo)
 - public.bodega1_crudos(codigo_barras PK FK→productos_crudos.codigo_crudo, detalle, cantidad)
 - public.bodega2_terminados(codigo_barras PK FK→relacion_crudo_terminado.codigo_terminado, detalle, cantidad)
 - public.movimientos(id, fecha_hora, codigo_barras, movimiento ∈ {Entrada, Salida, Producción, Venta, Devolución}, cantidad>0, bodega ∈ {Bodega1, Bodega2}, usuario, observaciones)
 
 FUNCIONALIDADES
 1) Entrada a CRUDO (Bodega1)
-2) Ingresar TERMINADO (Bodega2) descontando CRUDO (Bodega1) usando relacion_crudo_terminado
+2) Ingresar TERMINADO (Bodega2) descontando CRUDOS (Bodega1) según la BOM (bom_terminados)
 3) Salida de TERMINADO (Bodega2)
 4) Devolución a TERMINADOS (Bodega2)
 5) Corrección TERMINADO→CRUDO (descuenta B2 y suma B1)
@@ -22,6 +23,7 @@ FUNCIONALIDADES
 REQUISITOS
 - Variables de entorno: SUPABASE_URL, SUPABASE_KEY
 - (Opcional) Bucket de Storage: "productos" + tabla auxiliar "fotos_productos" para manejar URLs de imágenes
+  (miniaturas WebP y caché local en fotos.py; FOTOS_LOCAL_DIR usa una carpeta local en lugar del bucket)
 
 ---
 SQL — FUNCIONES RPC (ejecutar en Supabase SQL Editor)
@@ -44,51 +46,116 @@ begin
   on conflict (codigo_barras) do nothing;
 end;$$;
 
+-- BOM (lista de materiales): N crudos por terminado con su cantidad por unidad
+create table if not exists public.bom_terminados(
+  codigo_terminado text not null references relacion_crudo_terminado(codigo_terminado) on delete cascade,
+  codigo_crudo text not null references productos_crudos(codigo_crudo),
+  cantidad numeric not null check (cantidad > 0),
+  primary key (codigo_terminado, codigo_crudo)
+);
+create index if not exists idx_bom_crudo on public.bom_terminados(codigo_crudo);
+
+-- Migración: la relación 1:1 existente pasa a ser un componente con cantidad 1
+insert into bom_terminados(codigo_terminado, codigo_crudo, cantidad)
+select codigo_terminado, codigo_crudo, 1 from relacion_crudo_terminado where codigo_crudo is not null
+on conflict do nothing;
+
+-- Alta / actualización de un componente de la BOM
+create or replace function sp_bom_set_componente(
+  p_codigo_terminado text,
+  p_codigo_crudo text,
+  p_cantidad numeric
+) returns void language plpgsql as $$
+begin
+  insert into bom_terminados(codigo_terminado, codigo_crudo, cantidad)
+  values(p_codigo_terminado, p_codigo_crudo, p_cantidad)
+  on conflict (codigo_terminado, codigo_crudo) do update set cantidad = excluded.cantidad;
+end;$$;
+
+create or replace function sp_bom_quitar_componente(
+  p_codigo_terminado text,
+  p_codigo_crudo text
+) returns void language plpgsql as $$
+begin
+  delete from bom_terminados where codigo_terminado=p_codigo_terminado and codigo_crudo=p_codigo_crudo;
+end;$$;
+
+-- FUNCIONES DE STOCK — sin carreras entre operadores concurrentes
+-- * Cada descuento es un UPDATE condicional (... where cantidad >= p): valida y escribe en
+--   la misma sentencia con bloqueo de fila, así dos operadores no pueden vender el mismo stock.
+-- * Las sumas son un INSERT ... ON CONFLICT DO UPDATE (crea la fila si falta; reemplaza ensure_b*_row).
+-- * Orden de bloqueo fijo: Bodega1 (por código) y luego Bodega2, para no generar deadlocks.
+-- * Devuelven una fila por stock tocado: cantidad nueva + el movimiento insertado (id, tipo,
+--   cantidad, fecha), para que el cliente actualice su estado local sin volver a leer.
+-- Cambia el tipo de retorno: borrar las versiones anteriores antes de crearlas.
+drop function if exists sp_entrada_crudo(text,int,text,text);
+drop function if exists sp_producir_terminado(text,int,text,text);
+drop function if exists sp_salida_terminado(text,int,text,text);
+drop function if exists sp_devolucion_terminado(text,int,text,text);
+drop function if exists sp_correccion_terminado_a_crudo(text,int,text,text);
+drop function if exists sp_correccion_crudo_descuento(text,int,text,text);
+
 -- 1) ENTRADA CRUDO → Bodega1
 create or replace function sp_entrada_crudo(
   p_codigo_crudo text,
   p_cantidad int,
   p_usuario text,
   p_obs text default 'Ingreso de crudo'
-) returns void language plpgsql as $$
-declare v_detalle text;
+) returns table(codigo_barras text, bodega text, cantidad int, mov_id bigint, mov_tipo text, mov_cantidad int, mov_fecha timestamptz)
+language plpgsql as $$
+#variable_conflict use_column
 begin
-  select detalle_crudo into v_detalle from productos_crudos where codigo_crudo=p_codigo_crudo;
-  if v_detalle is null then raise exception 'Código crudo % no existe', p_codigo_crudo; end if;
-  perform ensure_b1_row(p_codigo_crudo, v_detalle);
-  update bodega1_crudos set cantidad = cantidad + p_cantidad where codigo_barras=p_codigo_crudo;
-  insert into movimientos(codigo_barras, movimiento, cantidad, bodega, usuario, observaciones)
-  values(p_codigo_crudo,'Entrada',p_cantidad,'Bodega1',p_usuario,p_obs);
+  insert into bodega1_crudos as b(codigo_barras, detalle, cantidad)
+  select c.codigo_crudo, coalesce(c.detalle_crudo,'N/A'), p_cantidad from productos_crudos c where c.codigo_crudo=p_codigo_crudo
+  on conflict (codigo_barras) do update set cantidad = b.cantidad + excluded.cantidad
+  returning b.codigo_barras, 'Bodega1', b.cantidad into codigo_barras, bodega, cantidad;
+  if not found then raise exception 'Código crudo % no existe', p_codigo_crudo; end if;
+  insert into movimientos as m(codigo_barras, movimiento, cantidad, bodega, usuario, observaciones)
+  values(p_codigo_crudo,'Entrada',p_cantidad,'Bodega1',p_usuario,p_obs)
+  returning m.id, m.movimiento, m.cantidad, m.fecha_hora into mov_id, mov_tipo, mov_cantidad, mov_fecha;
+  return next;
 end;$$;
 
--- 2) PRODUCCIÓN TERMINADO: descuenta crudo (B1) y suma terminado (B2)
+-- 2) PRODUCCIÓN TERMINADO: descuenta cada componente de la BOM (B1) y suma terminado (B2)
 create or replace function sp_producir_terminado(
   p_codigo_terminado text,
   p_cantidad int,
   p_usuario text,
   p_obs text default 'Producción / Conversión crudo→terminado'
-) returns void language plpgsql as $$
-declare v_codigo_crudo text; v_det_crudo text; v_det_term text; v_stock int; begin
-  select codigo_crudo, detalle into v_codigo_crudo, v_det_term
-  from relacion_crudo_terminado where codigo_terminado=p_codigo_terminado;
-  if v_codigo_crudo is null then raise exception 'Terminado % no tiene crudo asociado', p_codigo_terminado; end if;
-  select detalle_crudo into v_det_crudo from productos_crudos where codigo_crudo=v_codigo_crudo;
-  if v_det_crudo is null then raise exception 'Crudo % no existe', v_codigo_crudo; end if;
-
-  perform ensure_b1_row(v_codigo_crudo, v_det_crudo);
-  perform ensure_b2_row(p_codigo_terminado, v_det_term);
-
-  select cantidad into v_stock from bodega1_crudos where codigo_barras=v_codigo_crudo;
-  if coalesce(v_stock,0) < p_cantidad then raise exception 'Stock insuficiente de crudo %', v_codigo_crudo; end if;
-
-  update bodega1_crudos set cantidad = cantidad - p_cantidad where codigo_barras=v_codigo_crudo;
-  update bodega2_terminados set cantidad = cantidad + p_cantidad where codigo_barras=p_codigo_terminado;
-
-  -- Log movimientos (dos filas)
-  insert into movimientos(codigo_barras, movimiento, cantidad, bodega, usuario, observaciones)
-  values(v_codigo_crudo,'Salida',p_cantidad,'Bodega1',p_usuario,'Salida por producción');
-  insert into movimientos(codigo_barras, movimiento, cantidad, bodega, usuario, observaciones)
-  values(p_codigo_terminado,'Producción',p_cantidad,'Bodega2',p_usuario,p_obs);
+) returns table(codigo_barras text, bodega text, cantidad int, mov_id bigint, mov_tipo text, mov_cantidad int, mov_fecha timestamptz)
+language plpgsql as $$
+#variable_conflict use_column
+declare v_det_term text; r record; begin
+  select detalle into v_det_term from relacion_crudo_terminado where codigo_terminado=p_codigo_terminado;
+  if not found then raise exception 'Terminado % no existe', p_codigo_terminado; end if;
+  if not exists (select 1 from bom_terminados where codigo_terminado=p_codigo_terminado) then
+    raise exception 'Terminado % no tiene componentes (BOM)', p_codigo_terminado;
+  end if;
+
+  for r in
+    select b.codigo_crudo, ceil(b.cantidad * p_cantidad)::int as requerido
+    from bom_terminados b
+    where b.codigo_terminado=p_codigo_terminado
+    order by b.codigo_crudo
+  loop
+    update bodega1_crudos b set cantidad = b.cantidad - r.requerido
+    where b.codigo_barras=r.codigo_crudo and b.cantidad >= r.requerido
+    returning b.codigo_barras, 'Bodega1', b.cantidad into codigo_barras, bodega, cantidad;
+    if not found then raise exception 'Stock insuficiente de crudo %', r.codigo_crudo; end if;
+    insert into movimientos as m(codigo_barras, movimiento, cantidad, bodega, usuario, observaciones)
+    values(r.codigo_crudo,'Salida',r.requerido,'Bodega1',p_usuario,'Salida por producción')
+    returning m.id, m.movimiento, m.cantidad, m.fecha_hora into mov_id, mov_tipo, mov_cantidad, mov_fecha;
+    return next;
+  end loop;
+
+  insert into bodega2_terminados as b(codigo_barras, detalle, cantidad)
+  values(p_codigo_terminado, coalesce(v_det_term,'N/A'), p_cantidad)
+  on conflict (codigo_barras) do update set cantidad = b.cantidad + excluded.cantidad
+  returning b.codigo_barras, 'Bodega2', b.cantidad into codigo_barras, bodega, cantidad;
+  insert into movimientos as m(codigo_barras, movimiento, cantidad, bodega, usuario, observaciones)
+  values(p_codigo_terminado,'Producción',p_cantidad,'Bodega2',p_usuario,p_obs)
+  returning m.id, m.movimiento, m.cantidad, m.fecha_hora into mov_id, mov_tipo, mov_cantidad, mov_fecha;
+  return next;
 end;$$;
 
 -- 3) SALIDA TERMINADO (venta / retiro)
@@ -97,13 +164,18 @@ create or replace function sp_salida_terminado(
   p_cantidad int,
   p_usuario text,
   p_obs text default 'Salida de terminado'
-) returns void language plpgsql as $$
-declare v_stock int; begin
-  select cantidad into v_stock from bodega2_terminados where codigo_barras=p_codigo_terminado;
-  if coalesce(v_stock,0) < p_cantidad then raise exception 'Stock insuficiente en Bodega2'; end if;
-  update bodega2_terminados set cantidad = cantidad - p_cantidad where codigo_barras=p_codigo_terminado;
-  insert into movimientos(codigo_barras, movimiento, cantidad, bodega, usuario, observaciones)
-  values(p_codigo_terminado,'Salida',p_cantidad,'Bodega2',p_usuario,p_obs);
+) returns table(codigo_barras text, bodega text, cantidad int, mov_id bigint, mov_tipo text, mov_cantidad int, mov_fecha timestamptz)
+language plpgsql as $$
+#variable_conflict use_column
+begin
+  update bodega2_terminados b set cantidad = b.cantidad - p_cantidad
+  where b.codigo_barras=p_codigo_terminado and b.cantidad >= p_cantidad
+  returning b.codigo_barras, 'Bodega2', b.cantidad into codigo_barras, bodega, cantidad;
+  if not found then raise exception 'Stock insuficiente en Bodega2'; end if;
+  insert into movimientos as m(codigo_barras, movimiento, cantidad, bodega, usuario, observaciones)
+  values(p_codigo_terminado,'Salida',p_cantidad,'Bodega2',p_usuario,p_obs)
+  returning m.id, m.movimiento, m.cantidad, m.fecha_hora into mov_id, mov_tipo, mov_cantidad, mov_fecha;
+  return next;
 end;$$;
 
 -- 4) DEVOLUCIÓN TERMINADO → regresa a Bodega2
@@ -112,37 +184,65 @@ create or replace function sp_devolucion_terminado(
   p_cantidad int,
   p_usuario text,
   p_obs text default 'Devolución cliente'
-) returns void language plpgsql as $$
-declare v_det text; begin
-  select detalle into v_det from relacion_crudo_terminado where codigo_terminado=p_codigo_terminado;
-  perform ensure_b2_row(p_codigo_terminado, v_det);
-  update bodega2_terminados set cantidad = cantidad + p_cantidad where codigo_barras=p_codigo_terminado;
-  insert into movimientos(codigo_barras, movimiento, cantidad, bodega, usuario, observaciones)
-  values(p_codigo_terminado,'Devolución',p_cantidad,'Bodega2',p_usuario,p_obs);
+) returns table(codigo_barras text, bodega text, cantidad int, mov_id bigint, mov_tipo text, mov_cantidad int, mov_fecha timestamptz)
+language plpgsql as $$
+#variable_conflict use_column
+begin
+  insert into bodega2_terminados as b(codigo_barras, detalle, cantidad)
+  values(
+    p_codigo_terminado,
+    coalesce((select r.detalle from relacion_crudo_terminado r where r.codigo_terminado=p_codigo_terminado),'N/A'),
+    p_cantidad
+  )
+  on conflict (codigo_barras) do update set cantidad = b.cantidad + excluded.cantidad
+  returning b.codigo_barras, 'Bodega2', b.cantidad into codigo_barras, bodega, cantidad;
+  insert into movimientos as m(codigo_barras, movimiento, cantidad, bodega, usuario, observaciones)
+  values(p_codigo_terminado,'Devolución',p_cantidad,'Bodega2',p_usuario,p_obs)
+  returning m.id, m.movimiento, m.cantidad, m.fecha_hora into mov_id, mov_tipo, mov_cantidad, mov_fecha;
+  return next;
 end;$$;
 
--- 5) CORRECCIÓN: TERMINADO→CRUDO (descuento B2, suma B1)
+-- 5) CORRECCIÓN: TERMINADO→CRUDO (descuento B2, devuelve a B1 cada componente de la BOM)
+--    Inversa de la producción: mismas cantidades por componente (ceil(cantidad_bom × p_cantidad)).
 create or replace function sp_correccion_terminado_a_crudo(
   p_codigo_terminado text,
   p_cantidad int,
   p_usuario text,
   p_obs text default 'Corrección terminado→crudo'
-) returns void language plpgsql as $$
-declare v_codigo_crudo text; v_stock int; v_det_crudo text; v_det_term text; begin
-  select codigo_crudo, detalle into v_codigo_crudo, v_det_term from relacion_crudo_terminado where codigo_terminado=p_codigo_terminado;
-  if v_codigo_crudo is null then raise exception 'No hay relación crudo para %', p_codigo_terminado; end if;
-  select cantidad into v_stock from bodega2_terminados where codigo_barras=p_codigo_terminado;
-  if coalesce(v_stock,0) < p_cantidad then raise exception 'Stock insuficiente en Bodega2'; end if;
-  select detalle_crudo into v_det_crudo from productos_crudos where codigo_crudo=v_codigo_crudo;
-  perform ensure_b1_row(v_codigo_crudo, v_det_crudo);
-
-  update bodega2_terminados set cantidad = cantidad - p_cantidad where codigo_barras=p_codigo_terminado;
-  update bodega1_crudos set cantidad = cantidad + p_cantidad where codigo_barras=v_codigo_crudo;
-
-  insert into movimientos(codigo_barras, movimiento, cantidad, bodega, usuario, observaciones)
-  values(p_codigo_terminado,'Salida',p_cantidad,'Bodega2',p_usuario,p_obs);
-  insert into movimientos(codigo_barras, movimiento, cantidad, bodega, usuario, observaciones)
-  values(v_codigo_crudo,'Entrada',p_cantidad,'Bodega1',p_usuario,p_obs);
+) returns table(codigo_barras text, bodega text, cantidad int, mov_id bigint, mov_tipo text, mov_cantidad int, mov_fecha timestamptz)
+language plpgsql as $$
+#variable_conflict use_column
+declare r record; begin
+  if not exists (select 1 from relacion_crudo_terminado where codigo_terminado=p_codigo_terminado) then
+    raise exception 'Terminado % no existe', p_codigo_terminado;
+  end if;
+
+  -- B1 primero, por código (orden de bloqueo); si B2 no alcanza, la excepción revierte todo
+  for r in
+    select b.codigo_crudo, ceil(b.cantidad * p_cantidad)::int as devuelto, c.detalle_crudo
+    from bom_terminados b left join productos_crudos c on c.codigo_crudo=b.codigo_crudo
+    where b.codigo_terminado=p_codigo_terminado
+    order by b.codigo_crudo
+  loop
+    insert into bodega1_crudos as b(codigo_barras, detalle, cantidad)
+    values(r.codigo_crudo, coalesce(r.detalle_crudo,'N/A'), r.devuelto)
+    on conflict (codigo_barras) do update set cantidad = b.cantidad + excluded.cantidad
+    returning b.codigo_barras, 'Bodega1', b.cantidad into codigo_barras, bodega, cantidad;
+    insert into movimientos as m(codigo_barras, movimiento, cantidad, bodega, usuario, observaciones)
+    values(r.codigo_crudo,'Entrada',r.devuelto,'Bodega1',p_usuario,p_obs)
+    returning m.id, m.movimiento, m.cantidad, m.fecha_hora into mov_id, mov_tipo, mov_cantidad, mov_fecha;
+    return next;
+  end loop;
+  if not found then raise exception 'Terminado % no tiene componentes (BOM)', p_codigo_terminado; end if;
+
+  update bodega2_terminados b set cantidad = b.cantidad - p_cantidad
+  where b.codigo_barras=p_codigo_terminado and b.cantidad >= p_cantidad
+  returning b.codigo_barras, 'Bodega2', b.cantidad into codigo_barras, bodega, cantidad;
+  if not found then raise exception 'Stock insuficiente en Bodega2'; end if;
+  insert into movimientos as m(codigo_barras, movimiento, cantidad, bodega, usuario, observaciones)
+  values(p_codigo_terminado,'Salida',p_cantidad,'Bodega2',p_usuario,p_obs)
+  returning m.id, m.movimiento, m.cantidad, m.fecha_hora into mov_id, mov_tipo, mov_cantidad, mov_fecha;
+  return next;
 end;$$;
 
 -- 6) CORRECCIÓN: CRUDO (solo descuento en B1)
@@ -151,13 +251,18 @@ create or replace function sp_correccion_crudo_descuento(
   p_cantidad int,
   p_usuario text,
   p_obs text default 'Corrección crudo (descuento)'
-) returns void language plpgsql as $$
-declare v_stock int; begin
-  select cantidad into v_stock from bodega1_crudos where codigo_barras=p_codigo_crudo;
-  if coalesce(v_stock,0) < p_cantidad then raise exception 'Stock insuficiente en Bodega1'; end if;
-  update bodega1_crudos set cantidad = cantidad - p_cantidad where codigo_barras=p_codigo_crudo;
-  insert into movimientos(codigo_barras, movimiento, cantidad, bodega, usuario, observaciones)
-  values(p_codigo_crudo,'Salida',p_cantidad,'Bodega1',p_usuario,p_obs);
+) returns table(codigo_barras text, bodega text, cantidad int, mov_id bigint, mov_tipo text, mov_cantidad int, mov_fecha timestamptz)
+language plpgsql as $$
+#variable_conflict use_column
+begin
+  update bodega1_crudos b set cantidad = b.cantidad - p_cantidad
+  where b.codigo_barras=p_codigo_crudo and b.cantidad >= p_cantidad
+  returning b.codigo_barras, 'Bodega1', b.cantidad into codigo_barras, bodega, cantidad;
+  if not found then raise exception 'Stock insuficiente en Bodega1'; end if;
+  insert into movimientos as m(codigo_barras, movimiento, cantidad, bodega, usuario, observaciones)
+  values(p_codigo_crudo,'Salida',p_cantidad,'Bodega1',p_usuario,p_obs)
+  returning m.id, m.movimiento, m.cantidad, m.fecha_hora into mov_id, mov_tipo, mov_cantidad, mov_fecha;
+  return next;
 end;$$;
 
 -- 7) Creación de productos (opcionales)
@@ -178,6 +283,10 @@ create or replace function sp_crear_producto_terminado(
 begin
   insert into relacion_crudo_terminado(codigo_terminado, detalle, codigo_crudo)
   values(p_codigo_terminado, p_detalle, p_codigo_crudo);
+  if p_codigo_crudo is not null then
+    insert into bom_terminados(codigo_terminado, codigo_crudo, cantidad)
+    values(p_codigo_terminado, p_codigo_crudo, 1);
+  end if;
   perform ensure_b2_row(p_codigo_terminado, p_detalle);
 end;$$;
 
@@ -191,6 +300,211 @@ create table if not exists public.fotos_productos(
 );
 create index if not exists idx_fotos_codigo on public.fotos_productos(codigo);
 
+-- 8) Umbrales por SKU y stock crítico (consulta en servidor)
+create table if not exists public.umbrales_stock(
+  codigo text not null,
+  bodega text not null check (bodega in ('Bodega1','Bodega2')),
+  umbral int not null check (umbral >= 0),
+  primary key (codigo, bodega)
+);
+-- Parámetros compartidos por todo el sistema (p. ej. 'umbral_default' para SKUs sin umbral propio)
+create table if not exists public.parametros_inventario(
+  clave text primary key,
+  valor text not null,
+  updated_at timestamptz default now()
+);
+
+create or replace function sp_set_parametro(p_clave text, p_valor text)
+returns void language plpgsql as $$
+begin
+  insert into parametros_inventario(clave, valor) values(p_clave, p_valor)
+  on conflict (clave) do update set valor = excluded.valor, updated_at = now();
+end;$$;
+
+create index if not exists idx_b1_cantidad on public.bodega1_crudos(cantidad);
+create index if not exists idx_b2_cantidad on public.bodega2_terminados(cantidad);
+
+create or replace function sp_set_umbral(p_codigo text, p_bodega text, p_umbral int)
+returns void language plpgsql as $$
+begin
+  insert into umbrales_stock(codigo, bodega, umbral) values(p_codigo, p_bodega, p_umbral)
+  on conflict (codigo, bodega) do update set umbral = excluded.umbral;
+end;$$;
+
+-- Críticos: cantidad <= umbral del SKU (o p_umbral_default). El tope "cantidad <= máx umbral"
+-- permite recorrer solo el rango bajo del índice por cantidad; p_codigos limita a SKUs tocados.
+create or replace function sp_stock_critico(p_umbral_default int default 5, p_codigos text[] default null)
+returns table(bodega text, codigo_barras text, detalle text, cantidad int, umbral int)
+language sql stable as $$
+  select 'Bodega1', b.codigo_barras, b.detalle, b.cantidad, coalesce(u.umbral, p_umbral_default)
+  from bodega1_crudos b
+  left join umbrales_stock u on u.codigo=b.codigo_barras and u.bodega='Bodega1'
+  where b.cantidad <= greatest(p_umbral_default, (select coalesce(max(umbral),0) from umbrales_stock where bodega='Bodega1'))
+    and b.cantidad <= coalesce(u.umbral, p_umbral_default)
+    and (p_codigos is null or b.codigo_barras = any(p_codigos))
+  union all
+  select 'Bodega2', b.codigo_barras, b.detalle, b.cantidad, coalesce(u.umbral, p_umbral_default)
+  from bodega2_terminados b
+  left join umbrales_stock u on u.codigo=b.codigo_barras and u.bodega='Bodega2'
+  where b.cantidad <= greatest(p_umbral_default, (select coalesce(max(umbral),0) from umbrales_stock where bodega='Bodega2'))
+    and b.cantidad <= coalesce(u.umbral, p_umbral_default)
+    and (p_codigos is null or b.codigo_barras = any(p_codigos));
+$$;
+
+-- 9) Evolución agregada en servidor (neto por hora/día y bodega; opcional por SKU)
+create or replace function sp_evolucion(
+  p_desde timestamptz,
+  p_hasta timestamptz,
+  p_codigo text default null,
+  p_bucket text default 'day'
+) returns table(fecha timestamptz, bodega text, neto bigint)
+language sql stable as $$
+  select date_trunc(p_bucket, fecha_hora), bodega,
+         sum(case when movimiento in ('Entrada','Devolución','Producción') then cantidad else -cantidad end)::bigint
+  from movimientos
+  where fecha_hora >= p_desde and fecha_hora < p_hasta
+    and (p_codigo is null or codigo_barras = p_codigo)
+  group by 1, 2
+  order by 1, 2;
+$$;
+
+-- 10) Historial de precios con fecha de vigencia (precios_productos, si existe, queda como copia del precio actual)
+create table if not exists public.precios_historial(
+  id bigint generated by default as identity primary key,
+  codigo text not null,
+  precio numeric not null check (precio >= 0),
+  moneda text not null default 'COP',
+  vigente_desde timestamptz not null default now(),
+  usuario text,
+  creado_en timestamptz not null default now()
+);
+create index if not exists idx_precios_hist_codigo_vig on public.precios_historial(codigo, vigente_desde);
+
+-- Migración: el precio actual de cada código pasa a ser su primer tramo
+-- (precios_productos es opcional: sin ella no hay nada que migrar)
+do $$
+begin
+  if to_regclass('public.precios_productos') is not null then
+    insert into public.precios_historial(codigo, precio, moneda, vigente_desde)
+    select p.codigo, p.precio, coalesce(p.moneda,'COP'), coalesce(p.updated_at, now())
+    from public.precios_productos p
+    where p.precio is not null
+      and not exists (select 1 from public.precios_historial h where h.codigo = p.codigo);
+  end if;
+end;$$;
+
+create or replace function sp_set_precio(
+  p_codigo text, p_precio numeric, p_vigente_desde timestamptz default now(),
+  p_usuario text default null, p_moneda text default 'COP'
+) returns void language plpgsql as $$
+begin
+  insert into precios_historial(codigo, precio, moneda, vigente_desde, usuario)
+  values(p_codigo, p_precio, p_moneda, coalesce(p_vigente_desde, now()), p_usuario);
+  -- precios_productos (opcional) = último tramo ya vigente (un precio futuro no lo pisa todavía)
+  if to_regclass('public.precios_productos') is not null then
+    insert into precios_productos(codigo, precio, moneda, updated_at)
+    select h.codigo, h.precio, h.moneda, h.vigente_desde from precios_historial h
+    where h.codigo = p_codigo and h.vigente_desde <= now()
+    order by h.vigente_desde desc, h.id desc limit 1
+    on conflict (codigo) do update set precio = excluded.precio, moneda = excluded.moneda, updated_at = excluded.updated_at;
+  end if;
+end;$$;
+
+-- Precio vigente al momento de leer: último tramo con vigente_desde <= now() por código.
+-- La app lee esta vista, así un precio programado a futuro entra en vigor solo al llegar su fecha
+-- (precios_productos queda como copia para clientes sin la vista)
+create or replace view public.precios_vigentes as
+select distinct on (h.codigo) h.codigo, h.precio, h.moneda, h.vigente_desde as updated_at
+from public.precios_historial h
+where h.vigente_desde <= now()
+order by h.codigo, h.vigente_desde desc, h.id desc;
+
+-- Neto por bucket, bodega y SKU (base de la valorización histórica)
+create or replace function sp_neto_sku(
+  p_desde timestamptz,
+  p_hasta timestamptz,
+  p_bucket text default 'day'
+) returns table(fecha timestamptz, bodega text, codigo_barras text, neto bigint)
+language sql stable as $$
+  select date_trunc(p_bucket, fecha_hora), bodega, codigo_barras,
+         sum(case when movimiento in ('Entrada','Devolución','Producción') then cantidad else -cantidad end)::bigint
+  from movimientos
+  where fecha_hora >= p_desde and fecha_hora < p_hasta
+  group by 1, 2, 3
+  order by 1, 2, 3;
+$$;
+
+-- 11) Historial de movimientos: filtros en servidor + paginación por cursor (keyset)
+-- Un índice por combinación de filtros, todos terminando en (fecha_hora, id) = orden de la página.
+-- En la tabla particionada se crean en cada partición.
+create index if not exists idx_mov_fecha_id on public.movimientos(fecha_hora, id);
+create index if not exists idx_mov_codigo_fecha_id on public.movimientos(codigo_barras, fecha_hora, id);
+create index if not exists idx_mov_bodega_tipo_fecha_id on public.movimientos(bodega, movimiento, fecha_hora, id);
+create index if not exists idx_mov_usuario_fecha_id on public.movimientos(usuario, fecha_hora, id);
+
+-- WHERE con solo los filtros presentes ($1..$6 = desde, hasta, codigo, bodega, movimiento, usuario),
+-- así cada consulta usa el índice de su combinación en lugar de un plan genérico "x is null or ..."
+create or replace function sp_mov_where(p_codigo text, p_bodega text, p_movimiento text, p_usuario text)
+returns text language sql immutable as $$
+  select concat_ws(' and ', 'fecha_hora >= $1 and fecha_hora < $2',
+    case when p_codigo is not null then 'codigo_barras = $3' end,
+    case when p_bodega is not null then 'bodega = $4' end,
+    case when p_movimiento is not null then 'movimiento = $5' end,
+    case when p_usuario is not null then 'usuario = $6' end);
+$$;
+
+-- Página (más recientes primero) estrictamente anterior al cursor (fecha_hora, id) de la página previa
+create or replace function sp_movimientos_pagina(
+  p_desde timestamptz default '-infinity',
+  p_hasta timestamptz default 'infinity',
+  p_codigo text default null,
+  p_bodega text default null,
+  p_movimiento text default null,
+  p_usuario text default null,
+  p_cursor_fecha timestamptz default null,
+  p_cursor_id bigint default null,
+  p_limite int default 50
+) returns setof movimientos language plpgsql stable as $$
+begin
+  return query execute format(
+    'select * from movimientos where %s %s order by fecha_hora desc, id desc limit $9',
+    sp_mov_where(p_codigo, p_bodega, p_movimiento, p_usuario),
+    case when p_cursor_id is not null then 'and (fecha_hora, id) < ($7, $8)' end
+  ) using p_desde, p_hasta, p_codigo, p_bodega, p_movimiento, p_usuario, p_cursor_fecha, p_cursor_id, least(greatest(p_limite, 1), 501);
+end;$$;
+
+-- Totales por bodega y tipo para los mismos filtros
+create or replace function sp_movimientos_resumen(
+  p_desde timestamptz default '-infinity',
+  p_hasta timestamptz default 'infinity',
+  p_codigo text default null,
+  p_bodega text default null,
+  p_movimiento text default null,
+  p_usuario text default null
+) returns table(bodega text, movimiento text, movimientos bigint, unidades bigint, primera timestamptz, ultima timestamptz)
+language plpgsql stable as $$
+begin
+  return query execute format(
+    'select bodega, movimiento, count(*), sum(cantidad)::bigint, min(fecha_hora), max(fecha_hora)
+     from movimientos where %s group by 1, 2 order by 1, 2',
+    sp_mov_where(p_codigo, p_bodega, p_movimiento, p_usuario)
+  ) using p_desde, p_hasta, p_codigo, p_bodega, p_movimiento, p_usuario;
+end;$$;
+
+-- 12) Demanda por período y SKU (salidas y ventas) para la clasificación ABC/XYZ
+create or replace function sp_demanda_sku(
+  p_desde timestamptz,
+  p_hasta timestamptz,
+  p_bucket text default 'week'
+) returns table(fecha timestamptz, bodega text, codigo_barras text, unidades bigint)
+language sql stable as $$
+  select date_trunc(p_bucket, fecha_hora), bodega, codigo_barras, sum(cantidad)::bigint
+  from movimientos
+  where fecha_hora >= p_desde and fecha_hora < p_hasta and movimiento in ('Salida','Venta')
+  group by 1, 2, 3
+  order by 1, 2, 3;
+$$;
+
 -------------------------------------------------------------------
 
 APP ERP: Inventario de 2 bodegas (Crudo / Terminado) con Supabase — Versión Avanzada (DASHBOARD PRO)
@@ -208,23 +522,36 @@ REQUISITOS
 - Funciones RPC ya provistas (recomendado para atomicidad):
   - sp_entrada_crudo, sp_producir_terminado, sp_salida_terminado,
     sp_devolucion_terminado, sp_correccion_terminado_a_crudo,
-    sp_correccion_crudo_descuento, sp_crear_producto_crudo, sp_crear_producto_terminado
+    sp_correccion_crudo_descuento, sp_crear_producto_crudo, sp_crear_producto_terminado,
+    sp_bom_set_componente, sp_bom_quitar_componente, sp_set_precio
 
 NOTA PRECIOS (opcional)
 - Si agregas precios, crea una tabla `precios_productos(codigo text primary key, precio numeric, moneda text default 'COP', updated_at timestamptz default now())`.
 - Esta app detecta automáticamente si existe y muestra valorizados; si no, los KPIs de dinero quedan ocultos.
+- Con `precios_historial` (sección 10) cada cambio de precio guarda su fecha de vigencia y el
+  dashboard valoriza el inventario a cualquier fecha (valorizacion.py). El precio actual sale de
+  la vista `precios_vigentes`, así que un precio programado a futuro se aplica al llegar su fecha.
 """
 
 import os
-from datetime import datetime, timedelta, date
+from datetime import datetime, timedelta, date, timezone
 
 import pandas as pd
 import streamlit as st
 import plotly.express as px
 from supabase import create_client, Client
 from dotenv import load_dotenv
-from io import BytesIO
-from datetime import date, timedelta
+
+import alertas
+import clasificacion
+import fotos
+import graficos
+import inventario as inv
+import valorizacion
+import mrp
+import particiones
+import snapshots
+from inventario import TBL_B1, TBL_B2, TBL_CRUDOS, TBL_RELA
 
 # ==========================
 # CARGA VARIABLES DE ENTORNO
@@ -266,16 +593,6 @@ hr { border: none; border-top: 1px solid var(--border); margin: 0.8rem 0 1rem 0;
 """
 st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
 
-# ==========================
-# Tablas
-# ==========================
-TBL_B1 = "bodega1_crudos"
-TBL_B2 = "bodega2_terminados"
-TBL_MOV = "movimientos"
-TBL_CRUDOS = "productos_crudos"
-TBL_RELA = "relacion_crudo_terminado"
-TBL_PRECIOS = "precios_productos"  # opcional
-
 # ==========================
 # Supabase Client
 # ==========================
@@ -285,6 +602,16 @@ def get_client() -> Client:
 
 sb = get_client()
 
+# Evaluador de alertas en segundo plano (uno por proceso, escribe en la outbox SQLite)
+@st.cache_resource
+def get_alertas() -> alertas.ProgramadorAlertas:
+    # Sin umbral fijo: cada ciclo lee el umbral configurado (parametros_inventario)
+    return alertas.ProgramadorAlertas(sb, intervalo=30).start()
+
+@st.cache_data(ttl=30)
+def load_umbral_default() -> int:
+    return alertas.umbral_configurado(sb)
+
 # ==========================
 # SESSION STATE (refresh immediate)
 # ==========================
@@ -293,37 +620,23 @@ if "refresh_key" not in st.session_state:
 
 def bump_refresh():
     st.session_state["refresh_key"] += 1
+    get_snapshots().invalidar()
 
 # ==========================
 # UTILIDADES / DATOS
 # ==========================
 @st.cache_data(ttl=60)
 def table_exists(table_name: str) -> bool:
-    try:
-        sb.table(table_name).select("count(*)").limit(1).execute()
-        return True
-    except Exception:
-        return False
+    return inv.table_exists(sb, table_name)
 
 @st.cache_data(ttl=60)
 def load_df(table: str, order_by: str | None = None, refresh_key: int = 0) -> pd.DataFrame:
-    q = sb.table(table).select("*")
-    if order_by:
-        q = q.order(order_by)
-    res = q.execute()
-    return pd.DataFrame(res.data) if res.data else pd.DataFrame()
+    return inv.cargar_tabla(sb, table, order_by)
 
 # **SIN CACHÉ** para vistas operativas
 
 def load_movimientos(fecha_desde: datetime | None = None, refresh_key: int = 0) -> pd.DataFrame:
-    q = sb.table(TBL_MOV).select("*")
-    if fecha_desde is not None:
-        q = q.gte("fecha_hora", fecha_desde.isoformat())
-    res = q.execute()
-    df = pd.DataFrame(res.data) if res.data else pd.DataFrame()
-    if not df.empty:
-        df["fecha_hora"] = pd.to_datetime(df["fecha_hora"])
-    return df
+    return inv.cargar_movimientos(sb, fecha_desde)
 
 
 def load_inventarios(refresh_key: int = 0):
@@ -337,32 +650,113 @@ def load_catalogs(refresh_key: int = 0):
     rela = load_df(TBL_RELA, "codigo_terminado", refresh_key)
     return crudos, rela
 
+@st.cache_data(max_entries=4)
+def load_precios(refresh_key: int = 0, version_precios: str = ""):
+    # Precio vigente ahora (vista precios_vigentes), o precios_productos sin historial.
+    # Una lectura por versión de precios: cambia con cada tramo nuevo o que entra en vigor
+    return inv.cargar_precios(sb)
+
+# Dimensión de productos: una por versión de catálogo (refresh_key) y de precios
+@st.cache_data(max_entries=4)
+def load_dim_productos(refresh_key: int, version_precios: str) -> pd.DataFrame:
+    crudos, rela = load_catalogs(refresh_key)
+    return inv.dimension_productos(crudos, rela, load_precios(refresh_key, version_precios))
+
+@st.cache_data(ttl=30)
+def load_version_precios() -> str:
+    return inv.version_precios(sb)
+
+# El historial solo se vuelve a leer cuando cambia la versión de precios
+@st.cache_data
+def load_historial_precios(version: str) -> pd.DataFrame:
+    return inv.cargar_historial_precios(sb)
+
+@st.cache_data(max_entries=16)
+def load_valor_tiempo(horizonte: int, version_precios: str, ultimo_mov_id: int, snap_creado_en: datetime, _b1: pd.DataFrame, _b2: pd.DataFrame) -> pd.DataFrame:
+    # _b1/_b2 no se hashean: el stock queda identificado por el último movimiento y la hora del
+    # snapshot (estables entre procesos y reinicios, a diferencia del contador de versión)
+    hoy = date.today()
+    desde, hasta = hoy - timedelta(days=horizonte), hoy + timedelta(days=1)
+    freq = "D" if horizonte <= 365 else "W"
+    neto = inv.cargar_neto_sku(sb, desde, hasta)
+    hist = load_historial_precios(version_precios)
+    return valorizacion.valor_en_el_tiempo({"Bodega1": _b1, "Bodega2": _b2}, neto, hist, desde, hasta, freq)
+
+# ABC/XYZ: una clasificación por versión de datos (último movimiento, catálogo y precios)
+@st.cache_data(max_entries=8)
+def load_abc_xyz(ventana: int, bucket: str, params: clasificacion.Parametros, version_mov: int, refresh_key: int, version_precios: str, _b1: pd.DataFrame, _b2: pd.DataFrame) -> pd.DataFrame:
+    # _b1/_b2 no se hashean: el stock cambia solo con movimientos nuevos (version_mov)
+    return inv.clasificar_abc_xyz(sb, _b1, _b2, load_dim_productos(refresh_key, version_precios), ventana, bucket, params)
+
 @st.cache_data(ttl=60)
-def load_precios(refresh_key: int = 0):
-    if table_exists(TBL_PRECIOS):
-        return load_df(TBL_PRECIOS, refresh_key=refresh_key)
-    return pd.DataFrame(columns=["codigo","precio","moneda","updated_at"])
+def load_bom(refresh_key: int = 0) -> pd.DataFrame:
+    return inv.cargar_bom(sb, load_catalogs(refresh_key)[1])
 
-# Consulta directa SIN caché del stock de un código
+# Evolución: neto por bucket calculado en el servidor
 
-def fetch_stock_live(bodega_table: str, codigo: str) -> int:
-    try:
-        res = sb.table(bodega_table).select("cantidad").eq("codigo_barras", codigo).single().execute()
-        if res.data and "cantidad" in res.data:
-            return int(res.data["cantidad"]) or 0
-    except Exception:
-        try:
-            res = sb.table(bodega_table).select("cantidad").eq("codigo_barras", codigo).execute()
-            if res.data:
-                return int(res.data[0]["cantidad"]) or 0
-        except Exception:
-            return 0
-    return 0
+@st.cache_data(ttl=60)
+def load_evolucion(desde: date, hasta: date, codigo: str | None = None, bucket: str = "day", refresh_key: int = 0) -> pd.DataFrame:
+    return inv.cargar_evolucion(sb, desde, hasta, codigo, bucket)
+
+# Historial de movimientos: cada página y el resumen se piden al servidor con sus filtros
+
+@st.cache_data(ttl=60, max_entries=64)
+def load_pagina_movimientos(desde: datetime, hasta: datetime, filtros: tuple, cursor: tuple | None, limite: int, refresh_key: int = 0):
+    return inv.pagina_movimientos(sb, desde, hasta, dict(filtros), cursor, limite)
+
+@st.cache_data(ttl=60, max_entries=16)
+def load_resumen_movimientos(desde: datetime, hasta: datetime, filtros: tuple, refresh_key: int = 0) -> pd.DataFrame:
+    return inv.resumen_movimientos(sb, desde, hasta, dict(filtros))
+
+# Fotos: pipeline de miniaturas (pool de hilos + caché LRU en disco), uno por proceso
+@st.cache_resource
+def get_fotos() -> fotos.PipelineFotos:
+    return fotos.PipelineFotos(sb)
 
-# RPC helper
+# KPIs precalculados en segundo plano (uno por proceso). Con SNAPSHOT_DIR el sidecar publica
+# sus claves; el refrescador local cubre las demás y los refrescos forzados (bump_refresh).
+@st.cache_resource
+def get_refrescador() -> snapshots.Refrescador:
+    almacen = snapshots.AlmacenSnapshots(snapshots.SNAPSHOT_DIR, escribir=snapshots.SNAPSHOT_DIR is None)
+    ref = snapshots.Refrescador(sb, almacen)
+    ref.start()
+    return ref
+
+def get_snapshots() -> snapshots.AlmacenSnapshots:
+    return get_refrescador().almacen
+
+# RPC helper (wrappers en inventario.py, compartidos con la CLI)
 
 def rpc(name: str, params: dict):
-    return sb.rpc(name, params).execute()
+    return inv.rpc(sb, name, params)
+
+# Las RPC de stock devuelven filas (codigo_barras, bodega, cantidad + movimiento insertado)
+stock_nuevo = inv.stock_nuevo
+
+# Estado local de inventario de la sesión: se lee una vez por refresh_key y luego se
+# parchea con las filas que devuelve cada RPC de stock (sin volver a leer las tablas)
+
+def inventario_local() -> dict:
+    rk = st.session_state["refresh_key"]
+    est = st.session_state.get("inv_local")
+    if est is None or est["refresh_key"] != rk:
+        b1, b2 = load_inventarios(rk)
+        est = {"refresh_key": rk, "b1": b1, "b2": b2}
+        st.session_state["inv_local"] = est
+    return est
+
+def stock_local(bodega: str, codigo: str | None) -> int:
+    df = inventario_local()["b1" if bodega == "Bodega1" else "b2"]
+    if codigo is None or df.empty:
+        return 0
+    s = df.loc[df["codigo_barras"] == codigo, "cantidad"]
+    return int(s.iloc[0]) if not s.empty else 0
+
+def aplicar_mutacion(res, dim: pd.DataFrame | None = None) -> pd.DataFrame:
+    est = inventario_local()
+    est["b1"], est["b2"] = inv.aplicar_stock(est["b1"], est["b2"], res.data, dim)
+    get_snapshots().invalidar()  # los KPIs del dashboard se recalculan en segundo plano
+    return inv.movimientos_de(res.data)
 
 # Rerun seguro
 
@@ -375,73 +769,41 @@ def safe_rerun():
         except Exception:
             pass
 
-# ==========================
-# Analytics helpers (KPIs avanzados)
-# ==========================
+# Fragmentos: un clic dentro de un formulario de stock re-ejecuta solo ese bloque
 
-def compute_totales(b1: pd.DataFrame, b2: pd.DataFrame):
-    t_b1 = int(b1["cantidad"].sum()) if not b1.empty else 0
-    t_b2 = int(b2["cantidad"].sum()) if not b2.empty else 0
-    t_all = t_b1 + t_b2
-    p_b1 = (t_b1 / t_all * 100) if t_all else 0
-    p_b2 = (t_b2 / t_all * 100) if t_all else 0
-    skus_b1 = b1.shape[0]; skus_b2 = b2.shape[0]
-    return t_b1, t_b2, t_all, p_b1, p_b2, skus_b1, skus_b2
-
-
-def join_precios(inv_df: pd.DataFrame, precios: pd.DataFrame) -> pd.DataFrame:
-    if inv_df.empty:
-        inv_df = pd.DataFrame(columns=["codigo","cantidad","valor","precio"])
-        return inv_df
-    if "codigo" not in inv_df.columns:
-        inv_df = inv_df.rename(columns={"codigo_barras":"codigo"})
-    out = inv_df.merge(precios[["codigo","precio"]], on="codigo", how="left")
-    out["precio"].fillna(0, inplace=True)
-    out["valor"] = out["cantidad"] * out["precio"]
-    return out
-
-
-def compute_rotacion_y_cobertura(mov: pd.DataFrame, ventana_dias=30):
-    """Rotación: unidades salidas/Venta en B2 en ventana.
-       Cobertura: días de stock (inventario_total / promedio diario de salidas).
-    """
-    if mov.empty:
-        return pd.DataFrame(columns=["codigo_barras","rotacion_30d","avg_diario","cobertura_dias"])  
-    desde = pd.Timestamp.utcnow() - pd.Timedelta(days=ventana_dias)
-    d = mov[(mov["fecha_hora"] >= desde) & (mov["bodega"]=="Bodega2") & (mov["movimiento"].isin(["Salida","Venta"]))]
-    rot = d.groupby("codigo_barras")["cantidad"].sum().reset_index().rename(columns={"cantidad":"rotacion_30d"})
-    rot["avg_diario"] = rot["rotacion_30d"] / ventana_dias
-    return rot
-
-
-def evolucion_inventario(mov: pd.DataFrame, dias=60) -> pd.DataFrame:
-    if mov.empty:
-        return pd.DataFrame(columns=["fecha","Bodega1","Bodega2"])
-    desde = pd.Timestamp.utcnow() - pd.Timedelta(days=dias)
-    df = mov[mov["fecha_hora"] >= desde].copy()
-    df["fecha"] = df["fecha_hora"].dt.date
-    df["signo"] = df["movimiento"].map({"Entrada":1,"Devolución":1,"Producción":1,"Salida":-1,"Venta":-1}).fillna(0)
-    df["ajuste"] = df["cantidad"] * df["signo"]
-    agg = df.groupby(["fecha","bodega"]).agg(total=("ajuste","sum")).reset_index()
-    pivot = agg.pivot(index="fecha", columns="bodega", values="total").fillna(0).reset_index()
-    pivot["Bodega1"] = pivot.get("Bodega1", 0).cumsum()
-    pivot["Bodega2"] = pivot.get("Bodega2", 0).cumsum()
-    return pivot
+fragmento = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda f: f)
+
+def rerun_fragmento():
+    try:
+        st.rerun(scope="fragment")
+    except Exception:
+        safe_rerun()
+
+# Aviso que sobrevive al rerun del fragmento (se muestra una vez)
+
+def avisar(clave: str, msg: str):
+    st.session_state[f"aviso_{clave}"] = msg
+
+def mostrar_aviso(clave: str):
+    msg = st.session_state.pop(f"aviso_{clave}", None)
+    if msg:
+        st.success(msg)
 
 # ==========================
 # SIDEBAR
 # ==========================
 with st.sidebar:
     st.markdown("### ⚙️ ERP — Navegación")
-    main_section = st.radio("Sección", ["📊 Dashboard","🧰 Gestión de Inventario"], index=0)
+    main_section = st.radio("Sección", ["📊 Dashboard","📜 Movimientos","🧰 Gestión de Inventario"], index=0)
     st.markdown("---")
     usuario = st.text_input("Usuario", value="system")
     st.caption("Se usa para registrar movimientos.")
     st.markdown("---")
     st.markdown("#### 🎯 Filtros del Dashboard")
     hoy = date.today()
-    rango = st.select_slider("Rango de análisis", options=[7,14,30,60,90], value=30, help="Ventana para KPIs de rotación y evolución")
-    umbral = st.number_input("Umbral stock crítico", min_value=0, value=5)
+    rango = st.select_slider("Rango de análisis", options=[7,14,30,60,90], value=30, help="Ventana de movimientos para rotación y cobertura (la evolución usa el horizonte de abajo)")
+    umbral = st.number_input("Umbral crítico (esta vista)", min_value=0, value=load_umbral_default(), help="Filtra los críticos del dashboard para SKUs sin umbral propio. El umbral de las alertas se guarda en 'Umbral por SKU'.")
+    horizonte_evo = st.select_slider("Horizonte evolución", options=[30,90,180,365,730,1095,1825], value=90, format_func=lambda d: f"{d} días" if d < 365 else f"{d // 365} años", help="Serie agregada en servidor y reducida a puntos fijos (WebGL)")
     ver_bodega = st.multiselect("Bodegas a mostrar", ["Bodega1","Bodega2"], default=["Bodega1","Bodega2"])    
     st.markdown("---")
     if st.button("🔄 Refrescar todo"):
@@ -453,35 +815,25 @@ with st.sidebar:
 if main_section == "📊 Dashboard":
     st.markdown("# 📊 Dashboard de Inventario (Poliartes)")
 
-    crudos, rela = load_catalogs(st.session_state["refresh_key"])
-    b1, b2 = load_inventarios(st.session_state["refresh_key"])
-    mov = load_movimientos(refresh_key=st.session_state["refresh_key"]) 
-    precios = load_precios(st.session_state["refresh_key"])
+    dim = load_dim_productos(st.session_state["refresh_key"], load_version_precios())
+
+    # KPIs desde el snapshot precalculado en segundo plano (solo se arma aquí la primera vez)
+    almacen = get_snapshots()
+    clave_snap = (int(rango), int(umbral), int(horizonte_evo))
+    snap = almacen.obtener(clave_snap)
+    if snap is None:
+        snap = snapshots.calcular(sb, clave_snap, almacen.siguiente_version())
+        almacen.publicar(snap)
+    b1, b2, precios = snap.b1, snap.b2, snap.precios
+    err_snap = get_refrescador().ultimo_error
+    st.caption(f"📸 Snapshot v{snap.version} · actualizado hace {snap.edad_s:.0f}s · calculado en {snap.duracion_s:.2f}s"
+               + (f" · ⚠️ refresco en segundo plano falló: {err_snap}" if err_snap else ""))
 
     # KPIs base
-    t_b1, t_b2, t_all, p_b1, p_b2, skus_b1, skus_b2 = compute_totales(b1, b2)
+    t_b1, t_b2, t_all, p_b1, p_b2, skus_b1, skus_b2 = snap.totales
     # ====== Exportar Excel: Bodega 2 (Inventario + Movimientos) ======
     st.markdown("### ⬇️ Exportar Excel — Bodega 2")
-    
-    # Helper: sanitizar DF para Excel (fechas sin tz y objetos como texto)
-    def sanitize_for_excel(df: pd.DataFrame) -> pd.DataFrame:
-        out = df.copy()
-        for col in out.columns:
-            # Normalizar datetimes
-            if pd.api.types.is_datetime64_any_dtype(out[col]):
-                out[col] = pd.to_datetime(out[col], errors="coerce")
-                # remover tz si la hay
-                try:
-                    out[col] = out[col].dt.tz_convert(None)
-                except Exception:
-                    try:
-                        out[col] = out[col].dt.tz_localize(None)
-                    except Exception:
-                        pass
-            # Serializar listas/dicts a texto
-            out[col] = out[col].apply(lambda x: json.dumps(x) if isinstance(x, (list, dict)) else x)
-        return out
-    
+
     # Filtros de fecha para movimientos (por defecto últimos 30 días)
     col_exp1, col_exp2, col_exp3 = st.columns([1,1,1])
     with col_exp1:
@@ -490,99 +842,32 @@ if main_section == "📊 Dashboard":
         fecha_hasta = st.date_input("Hasta", value=date.today(), min_value=fecha_desde)
     with col_exp3:
         st.write("")  # espaciador
-    
-    # INVENTARIO actual de Bodega2
-    inv_b2_xls = b2[["codigo_barras", "detalle", "cantidad"]].copy().sort_values("codigo_barras")
-    
-    # MOVIMIENTOS Bodega2 (ingresos/salidas con fecha)
-    mov_b2 = mov.copy()
-    if not mov_b2.empty:
-        mov_b2 = mov_b2[
-            (mov_b2["bodega"] == "Bodega2") &
-            (mov_b2["movimiento"].isin(["Producción", "Devolución", "Salida", "Venta"])) &
-            (mov_b2["fecha_hora"].dt.date >= fecha_desde) &
-            (mov_b2["fecha_hora"].dt.date <= fecha_hasta)
-        ].copy()
-    
-        # Añadir nombre/detalle del terminado
-        if not rela.empty:
-            det_term = rela.rename(columns={"codigo_terminado": "codigo_barras", "detalle": "detalle_terminado"})[
-                ["codigo_barras", "detalle_terminado"]
-            ]
-            mov_b2 = mov_b2.merge(det_term, on="codigo_barras", how="left")
-    
-        # Orden y columnas finales
-        mov_b2 = mov_b2.sort_values("fecha_hora")[
-            ["fecha_hora", "codigo_barras", "detalle_terminado", "movimiento", "cantidad", "usuario", "observaciones"]
-        ].rename(columns={
-            "fecha_hora": "fecha",
-            "detalle_terminado": "detalle"
-        })
-    else:
-        mov_b2 = pd.DataFrame(columns=["fecha","codigo_barras","detalle","movimiento","cantidad","usuario","observaciones"])
-    
-    # Normalizar columna fecha (quitar tz si la hay)
-    if not mov_b2.empty:
-        mov_b2["fecha"] = pd.to_datetime(mov_b2["fecha"], errors="coerce")
-        try:
-            mov_b2["fecha"] = mov_b2["fecha"].dt.tz_convert(None)
-        except Exception:
-            mov_b2["fecha"] = mov_b2["fecha"].dt.tz_localize(None)
-    
-    # Botón de descarga (Excel en memoria)
-    buffer = BytesIO()
+
+    # Botón de descarga (Excel en memoria; mismo libro que `python cli.py exportar`)
     if st.button("Generar Excel de Bodega 2"):
-        with pd.ExcelWriter(buffer, engine="xlsxwriter", datetime_format="yyyy-mm-dd hh:mm:ss") as writer:
-            inv_b2_xls_s = sanitize_for_excel(inv_b2_xls)
-            mov_b2_s     = sanitize_for_excel(mov_b2)
-    
-            # Sheet 1: Inventario actual
-            inv_b2_xls_s.to_excel(writer, index=False, sheet_name="Inventario_B2")
-            ws1 = writer.sheets["Inventario_B2"]
-    
-            # Sheet 2: Movimientos (ingresos/salidas)
-            mov_b2_s.to_excel(writer, index=False, sheet_name="Movimientos_B2")
-            ws2 = writer.sheets["Movimientos_B2"]
-    
-            # Autoajuste de columnas
-            def autosize(ws, df):
-                for idx, col in enumerate(df.columns):
-                    try:
-                        max_len = max(
-                            [len(str(col))] + [len(str(x)) for x in df[col].astype(str).values]
-                        )
-                    except Exception:
-                        max_len = len(str(col))
-                    ws.set_column(idx, idx, min(max_len + 2, 40))  # ancho máx 40
-    
-            autosize(ws1, inv_b2_xls_s)
-            autosize(ws2, mov_b2_s)
-    
-        buffer.seek(0)
+        # Movimientos solo al generar el Excel y solo desde la fecha pedida
+        mov = load_movimientos(datetime.combine(fecha_desde, datetime.min.time()), refresh_key=st.session_state["refresh_key"])
         st.download_button(
             label="⬇️ Descargar Excel",
-            data=buffer.getvalue(),
+            data=inv.excel_bodega2(b2, mov, dim, fecha_desde, fecha_hasta),
             file_name=f"Bodega2_{fecha_desde.isoformat()}_{fecha_hasta.isoformat()}.xlsx",
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
         )
 
     # Valor inventario
-    inv_b1 = b1.rename(columns={"codigo_barras":"codigo"})
-    inv_b2 = b2.rename(columns={"codigo_barras":"codigo"})
-    val_b1 = join_precios(inv_b1, precios)["valor"].sum()
-    val_b2 = join_precios(inv_b2, precios)["valor"].sum()
+    val_b1, val_b2 = snap.valor_b1, snap.valor_b2
 
     # Rotación & cobertura (30/60/90 según slider)
-    rot = compute_rotacion_y_cobertura(mov, ventana_dias=rango)
+    rot = snap.rotacion
 
     # Cobertura general (B2): inventario total B2 / avg diario salidas B2
     b2_tot = t_b2
     avg_diario_b2 = rot["avg_diario"].sum() if not rot.empty else 0
     cobertura_dias_b2 = (b2_tot / avg_diario_b2) if avg_diario_b2 else None
 
-    # Críticos
-    crit_b1 = b1[b1["cantidad"] <= umbral]
-    crit_b2 = b2[b2["cantidad"] <= umbral]
+    # Críticos (consulta en servidor) + evaluador de alertas en segundo plano
+    crit_all = snap.criticos
+    prog_alertas = get_alertas()
 
     # KPIs Cards
     c1, c2, c3, c4 = st.columns(4)
@@ -607,12 +892,27 @@ if main_section == "📊 Dashboard":
         fig_pie = px.pie(comp_df, names="Bodega", values="Unidades", hole=0.45)
         st.plotly_chart(fig_pie, use_container_width=True)
     with g2:
-        st.markdown("### 📈 Evolución (últimos {} días)".format(rango))
-        evo = evolucion_inventario(mov, dias=rango)
-        if not evo.empty:
-            evo_long = evo.melt(id_vars=["fecha"], value_vars=["Bodega1","Bodega2"], var_name="Bodega", value_name="Unidades Acum")
-            fig2 = px.line(evo_long, x="fecha", y="Unidades Acum", color="Bodega", markers=True)
+        st.markdown("### 📈 Evolución (últimos {} días)".format(horizonte_evo))
+        evo_desde = date.today() - timedelta(days=horizonte_evo)
+        evo_hasta = date.today() + timedelta(days=1)
+        codigos_evo = sorted(set(b1.get("codigo_barras", pd.Series(dtype=str))) | set(b2.get("codigo_barras", pd.Series(dtype=str))))
+        sel_evo = st.selectbox("Producto (drill-down)", ["Todos"] + codigos_evo, key="evo_cod")
+        cod_evo = None if sel_evo == "Todos" else sel_evo
+
+        neto_full = snap.evolucion if cod_evo is None else load_evolucion(evo_desde, evo_hasta, cod_evo, "day", st.session_state["refresh_key"])
+        if not neto_full.empty:
+            vis = st.slider("Rango visible", min_value=evo_desde, max_value=evo_hasta, value=(evo_desde, evo_hasta), key="evo_vis")
+            if tuple(vis) == (evo_desde, evo_hasta):
+                evo = graficos.acumular(neto_full)
+            else:
+                # Re-consulta solo el rango visible (más fino); la base es el acumulado previo
+                previo = neto_full[neto_full["fecha"] < pd.Timestamp(vis[0], tz="UTC")]
+                base = previo.drop(columns="fecha").sum().to_dict()
+                neto_vis = load_evolucion(vis[0], vis[1], cod_evo, graficos.bucket_para(*vis), st.session_state["refresh_key"])
+                evo = graficos.acumular(neto_vis, base) if not neto_vis.empty else pd.DataFrame(columns=["fecha","Bodega1","Bodega2"])
+            fig2 = graficos.figura_evolucion(evo, bodegas=ver_bodega)
             st.plotly_chart(fig2, use_container_width=True)
+            st.caption(f"{len(evo)} puntos · máx {graficos.PRESUPUESTO_PUNTOS} dibujados por bodega (LTTB, WebGL)")
         else:
             st.info("Sin datos suficientes para evolución.")
 
@@ -626,27 +926,8 @@ if main_section == "📊 Dashboard":
         if not rot.empty:
             top = rot.sort_values("rotacion_30d", ascending=False).head(5)
 
-            # Construir mapa de detalles SIN funciones raras en el concat
-            det_parts = []
-            if not rela.empty:
-                det_term = rela.rename(columns={"codigo_terminado": "codigo_barras", "detalle": "detalle"})[
-                    ["codigo_barras", "detalle"]
-                ]
-                det_parts.append(det_term)
-            if not crudos.empty:
-                det_cru = crudos.rename(columns={"codigo_crudo": "codigo_barras", "detalle_crudo": "detalle"})[
-                    ["codigo_barras", "detalle"]
-                ]
-                det_parts.append(det_cru)
-
-            det_map = (
-                pd.concat(det_parts, ignore_index=True)
-                if det_parts
-                else pd.DataFrame(columns=["codigo_barras", "detalle"])
-            )
-
-            # Unir detalles al top
-            top = top.merge(det_map, on="codigo_barras", how="left")
+            # Detalles desde la dimensión de productos
+            top = top.assign(detalle=top["codigo_barras"].map(inv.detalles(dim, "terminado")))
 
             # Gráfico y tabla
             fig_top = px.bar(top, x="rotacion_30d", y="detalle", orientation="h", text="rotacion_30d")
@@ -666,16 +947,105 @@ if main_section == "📊 Dashboard":
 
     with g4:
         st.markdown("### ⚠️ Críticos (<= umbral)")
-        if not crit_b1.empty or not crit_b2.empty:
-            crit_b1_v = crit_b1.assign(bodega="Bodega1")[ ["bodega","codigo_barras","detalle","cantidad"] ]
-            crit_b2_v = crit_b2.assign(bodega="Bodega2")[ ["bodega","codigo_barras","detalle","cantidad"] ]
-            crit_all = pd.concat([crit_b1_v, crit_b2_v], ignore_index=True)
+        if not crit_all.empty:
             st.dataframe(crit_all.sort_values(["bodega","cantidad"]), use_container_width=True, hide_index=True)
             csv = crit_all.to_csv(index=False).encode('utf-8')
             st.download_button("⬇️ Descargar críticos (CSV)", data=csv, file_name="criticos.csv", mime="text/csv")
         else:
             st.success("Sin críticos. 🎉")
 
+        n_pend = alertas.contar_pendientes()
+        st.caption(f"Alertas pendientes en outbox: {n_pend} · umbral por defecto de alertas: {load_umbral_default()}"
+                   + (f" · ⚠️ {prog_alertas.ultimo_error}" if prog_alertas.ultimo_error else ""))
+
+        with st.expander("Umbral por SKU"):
+            cu = st.columns([2,1,1])
+            with cu[0]:
+                u_cod = st.text_input("Código", key="umbral_cod")
+            with cu[1]:
+                u_bod = st.selectbox("Bodega", ["Bodega1","Bodega2"], key="umbral_bod")
+            with cu[2]:
+                u_val = st.number_input("Umbral", min_value=0, value=int(umbral), key="umbral_val")
+            if st.button("Guardar umbral", key="btn_umbral"):
+                if not u_cod:
+                    st.error("Código requerido")
+                else:
+                    try:
+                        inv.set_umbral(sb, u_cod, u_bod, u_val)
+                        st.success("Umbral guardado ✅")
+                        bump_refresh(); safe_rerun()
+                    except Exception as e:
+                        st.error(f"Error: {e}")
+            st.markdown("**Umbral por defecto (SKUs sin umbral propio, compartido por las alertas)**")
+            cd = st.columns([2,1])
+            with cd[0]:
+                u_def = st.number_input("Umbral por defecto", min_value=0, value=load_umbral_default(), key="umbral_def")
+            with cd[1]:
+                if st.button("Guardar por defecto", key="btn_umbral_def"):
+                    try:
+                        inv.set_umbral_default(sb, int(u_def))
+                        load_umbral_default.clear()
+                        st.success("Umbral por defecto guardado ✅ (las alertas se re-evalúan en el próximo ciclo)")
+                    except Exception as e:
+                        st.error(f"Error: {e}")
+
+    # Valor del inventario en el tiempo (historial de precios)
+    st.markdown("---")
+    st.markdown(f"### 💰 Valor del inventario (últimos {horizonte_evo} días)")
+    ver_precios = load_version_precios()
+    if load_historial_precios(ver_precios).empty:
+        st.info("Sin historial de precios: crea precios_historial (sección 10 del SQL) y registra precios.")
+    else:
+        valor_t = load_valor_tiempo(int(horizonte_evo), ver_precios, snap.ultimo_mov_id, snap.creado_en, b1, b2)
+        cols_val = [c for c in ["Bodega1","Bodega2"] if c in ver_bodega]
+        fig_val = px.area(valor_t, x="fecha", y=cols_val)
+        fig_val.update_layout(yaxis_title="Valor", xaxis_title="Fecha", legend_title="Bodega")
+        st.plotly_chart(fig_val, use_container_width=True)
+        fecha_val = st.date_input("Valorizar a fecha", value=date.today(), min_value=valor_t["fecha"].min().date(), max_value=date.today(), key="fecha_val")
+        fila_val = valor_t[valor_t["fecha"].dt.date <= fecha_val].tail(1)
+        if not fila_val.empty:
+            v1, v2 = float(fila_val["Bodega1"].iloc[0]), float(fila_val["Bodega2"].iloc[0])
+            st.caption(f"Al cierre de {fila_val['fecha'].iloc[0].date()}: B1 ${v1:,.0f} · B2 ${v2:,.0f} · Total ${v1 + v2:,.0f}")
+
+    # Clasificación ABC (valor consumido) × XYZ (variabilidad de la demanda)
+    st.markdown("---")
+    st.markdown("### 🧮 Clasificación ABC / XYZ")
+    ca1, ca2, ca3 = st.columns(3)
+    with ca1:
+        abc_ventana = st.select_slider("Ventana de demanda", options=[30,90,180,365], value=90, format_func=lambda d: f"{d} días", key="abc_ventana")
+    with ca2:
+        abc_bucket = st.radio("Período para la variabilidad", ["week","month"], format_func={"week": "Semana", "month": "Mes"}.get, horizontal=True, key="abc_bucket")
+    with ca3:
+        abc_medida = st.radio("Matriz por", ["SKUs","Valor"], horizontal=True, key="abc_medida")
+    with st.expander("Umbrales de clasificación"):
+        u1, u2, u3, u4 = st.columns(4)
+        corte_a = u1.number_input("A hasta (% valor)", min_value=1, max_value=99, value=80)
+        corte_b = u2.number_input("B hasta (% valor)", min_value=corte_a, max_value=100, value=max(95, corte_a))
+        cv_x = u3.number_input("X: CV ≤", min_value=0.0, value=0.5, step=0.1)
+        cv_y = u4.number_input("Y: CV ≤", min_value=cv_x, value=max(1.0, cv_x), step=0.1)
+    params_abc = clasificacion.Parametros(corte_a / 100, corte_b / 100, float(cv_x), float(cv_y))
+    clasif = load_abc_xyz(int(abc_ventana), abc_bucket, params_abc, snap.ultimo_mov_id, st.session_state["refresh_key"], load_version_precios(), b1, b2)
+    clasif = clasif[clasif["bodega"].isin(ver_bodega)]
+    if clasif.empty:
+        st.info("Sin SKUs para clasificar.")
+    else:
+        mat = clasificacion.matriz(clasif, "valor" if abc_medida == "Valor" else "skus")
+        fig_abc = px.imshow(mat, text_auto=".3s" if abc_medida == "Valor" else True, color_continuous_scale="Blues", aspect="auto",
+                            labels=dict(x="XYZ (variabilidad)", y="ABC (valor)", color=abc_medida))
+        st.plotly_chart(fig_abc, use_container_width=True)
+        st.caption(f"A: hasta {corte_a}% del valor consumido · B: hasta {corte_b}% · X: CV ≤ {cv_x:g} · Y: CV ≤ {cv_y:g} · Z: más variable o sin salidas")
+
+        # Drill-down: SKUs de una clase
+        conteo = clasif["clase"].value_counts()
+        clase_sel = st.selectbox("Ver SKUs de la clase", clasificacion.CLASES, format_func=lambda k: f"{k} ({conteo.get(k, 0):,} SKUs)", key="abc_clase")
+        det = clasif[clasif["clase"] == clase_sel]
+        st.dataframe(det[["bodega","codigo_barras","detalle","stock","demanda","precio","valor","participacion","cv"]].head(500),
+                     use_container_width=True, hide_index=True)
+        if len(det) > 500:
+            st.caption(f"Mostrando 500 de {len(det):,} SKUs (ordenados por valor); el CSV los incluye todos.")
+        st.download_button("⬇️ CSV de la clasificación", clasif.to_csv(index=False).encode("utf-8"),
+                           file_name=f"abc_xyz_{abc_ventana}d_{date.today().isoformat()}.csv", mime="text/csv")
+
     # Inventarios por bodega con búsqueda
     st.markdown("---")
     st.markdown("### 📦 Inventarios por Bodega (con búsqueda)")
@@ -695,6 +1065,83 @@ if main_section == "📊 Dashboard":
         st.markdown("**Bodega2 — Terminados**")
         st.dataframe(df2[["codigo_barras","detalle","cantidad"]].sort_values("codigo_barras"), use_container_width=True, hide_index=True)
 
+# ==========================
+# SECCIÓN: MOVIMIENTOS (filtros y paginación en el servidor)
+# ==========================
+elif main_section == "📜 Movimientos":
+    st.markdown("# 📜 Movimientos")
+    dim = load_dim_productos(st.session_state["refresh_key"], load_version_precios())
+
+    f1, f2, f3, f4 = st.columns(4)
+    with f1:
+        m_cod = st.text_input("Código", key="mov_cod").strip()
+    with f2:
+        m_bod = st.selectbox("Bodega", ["Todas","Bodega1","Bodega2"], key="mov_bod")
+    with f3:
+        m_tipo = st.selectbox("Tipo", ["Todos","Entrada","Salida","Producción","Venta","Devolución"], key="mov_tipo")
+    with f4:
+        m_usr = st.text_input("Usuario", key="mov_usr").strip()
+    f5, f6 = st.columns([3,1])
+    with f5:
+        m_rango = st.date_input("Rango de fechas", value=(date.today() - timedelta(days=30), date.today()), key="mov_rango")
+    with f6:
+        m_lim = st.selectbox("Filas por página", [25,50,100,200], index=1, key="mov_lim")
+
+    # Mientras se elige el rango el widget devuelve una sola fecha
+    m_desde, m_hasta = (tuple(m_rango) * 2)[:2] if len(m_rango) == 1 else m_rango
+    desde_dt = datetime.combine(m_desde, datetime.min.time(), tzinfo=timezone.utc)
+    hasta_dt = datetime.combine(m_hasta + timedelta(days=1), datetime.min.time(), tzinfo=timezone.utc)
+    filtros = tuple(sorted({
+        "codigo": m_cod or None,
+        "bodega": None if m_bod == "Todas" else m_bod,
+        "movimiento": None if m_tipo == "Todos" else m_tipo,
+        "usuario": m_usr or None,
+    }.items()))
+    if particiones.requiere_archivo(desde_dt):
+        st.caption("ℹ️ Parte del rango está archivada: esas filas y su resumen se leen del archivo Parquet.")
+
+    # Resumen agregado en SQL para los mismos filtros
+    resumen = load_resumen_movimientos(desde_dt, hasta_dt, filtros, st.session_state["refresh_key"])
+    if resumen.empty:
+        st.info("Sin movimientos para estos filtros (o falta sp_movimientos_resumen: sección 11 del SQL).")
+    else:
+        signo = resumen["movimiento"].map({"Entrada":1,"Devolución":1,"Producción":1,"Salida":-1,"Venta":-1}).fillna(0)
+        r1, r2, r3, r4 = st.columns(4)
+        r1.metric("Movimientos", f"{int(resumen['movimientos'].sum()):,}")
+        r2.metric("Unidades ingresadas", f"{int(resumen['unidades'].where(signo > 0, 0).sum()):,}")
+        r3.metric("Unidades egresadas", f"{int(resumen['unidades'].where(signo < 0, 0).sum()):,}")
+        r4.metric("Neto", f"{int((resumen['unidades'] * signo).sum()):,}")
+        st.dataframe(resumen, use_container_width=True, hide_index=True)
+
+    # Pila de cursores: la página actual es la última; se reinicia al cambiar los filtros
+    clave_mov = (desde_dt, hasta_dt, filtros, m_lim)
+    if st.session_state.get("mov_clave") != clave_mov:
+        st.session_state["mov_clave"] = clave_mov
+        st.session_state["mov_cursores"] = [None]
+    cursores = st.session_state["mov_cursores"]
+    pagina, siguiente = load_pagina_movimientos(desde_dt, hasta_dt, filtros, cursores[-1], int(m_lim), st.session_state["refresh_key"])
+
+    if pagina.empty:
+        st.caption("Sin filas en esta página.")
+    else:
+        pagina = pagina.assign(detalle=inv.detalle_por_bodega(dim, pagina["bodega"], pagina["codigo_barras"]))
+        cols_pag = [c for c in ["id","fecha_hora","codigo_barras","detalle","movimiento","cantidad","bodega","usuario","observaciones"] if c in pagina.columns]
+        st.dataframe(pagina[cols_pag], use_container_width=True, hide_index=True)
+        st.download_button("⬇️ CSV de esta página", pagina[cols_pag].to_csv(index=False).encode("utf-8"),
+                           file_name=f"movimientos_p{len(cursores)}.csv", mime="text/csv")
+
+    n1, n2, n3 = st.columns([1,2,1])
+    with n1:
+        if st.button("◀ Anterior", disabled=len(cursores) == 1):
+            cursores.pop()
+            safe_rerun()
+    with n2:
+        st.caption(f"Página {len(cursores)} · {len(pagina)} filas")
+    with n3:
+        if st.button("Siguiente ▶", disabled=siguiente is None):
+            cursores.append(siguiente)
+            safe_rerun()
+
 # ==========================
 # SECCIÓN: GESTIÓN DE INVENTARIO (sin cambios funcionales)
 # ==========================
@@ -710,223 +1157,266 @@ else:
     ])
 
     crudos, rela = load_catalogs(st.session_state["refresh_key"])
-    b1, b2 = load_inventarios(st.session_state["refresh_key"])
+    dim = load_dim_productos(st.session_state["refresh_key"], load_version_precios())
 
     # Maps
-    map_crudo = {f"{r['codigo_crudo']} — {r.get('detalle_crudo','')}": r['codigo_crudo'] for _, r in crudos.iterrows()} if not crudos.empty else {}
-    map_term = {f"{r['codigo_terminado']} — {r.get('detalle','')}": r['codigo_terminado'] for _, r in rela.iterrows()} if not rela.empty else {}
+    map_crudo = inv.etiquetas(dim, "crudo")
+    map_term = inv.etiquetas(dim, "terminado")
 
     # -------------------------
     # Entrada Crudo
     # -------------------------
-    with tabs[0]:
+    @fragmento
+    def form_entrada_crudo():
         st.markdown("### ➕ Entrada a Bodega1 (CRUDO)")
         if not map_crudo:
             st.warning("No hay productos crudos. Crea uno en la pestaña Productos.")
-        else:
-            col = st.columns([2,1,2])
-            with col[0]:
-                sel = st.selectbox("Producto crudo", list(map_crudo.keys()))
-            with col[1]:
-                cant = st.number_input("Cantidad", min_value=1, step=1)
-            with col[2]:
-                obs = st.text_input("Observaciones", "Ingreso de crudo")
-
-            codigo = map_crudo.get(sel)
-            stock_act = fetch_stock_live(TBL_B1, codigo)
-            st.markdown(f"**Stock actual Bodega1:** {stock_act} und")
-
-            if st.button("Registrar entrada", key="btn_ent_crudo"):
-                try:
-                    with st.spinner("Registrando entrada..."):
-                        rpc("sp_entrada_crudo", {"p_codigo_crudo": codigo, "p_cantidad": int(cant), "p_usuario": usuario, "p_obs": obs})
-                    st.success(f"Entrada registrada ✅ · Stock ahora: {fetch_stock_live(TBL_B1, codigo)}")
-                    bump_refresh(); safe_rerun()
-                except Exception as e:
-                    st.error(f"Error: {e}")
+            return
+        mostrar_aviso("ent_crudo")
+        col = st.columns([2,1,2])
+        with col[0]:
+            sel = st.selectbox("Producto crudo", list(map_crudo.keys()))
+        with col[1]:
+            cant = st.number_input("Cantidad", min_value=1, step=1)
+        with col[2]:
+            obs = st.text_input("Observaciones", "Ingreso de crudo")
+
+        codigo = map_crudo.get(sel)
+        st.markdown(f"**Stock actual Bodega1:** {stock_local('Bodega1', codigo)} und")
+
+        if st.button("Registrar entrada", key="btn_ent_crudo"):
+            try:
+                with st.spinner("Registrando entrada..."):
+                    res = rpc("sp_entrada_crudo", {"p_codigo_crudo": codigo, "p_cantidad": int(cant), "p_usuario": usuario, "p_obs": obs})
+                movs = aplicar_mutacion(res, dim)
+                avisar("ent_crudo", f"Entrada registrada ✅ · Stock ahora: {stock_nuevo(res, 'Bodega1', codigo)} · mov #{', #'.join(map(str, movs['id']))}")
+                rerun_fragmento()
+            except Exception as e:
+                st.error(f"Error: {e}")
+
+        st.markdown("#### Inventario del producto (Bodega1)")
+        b1_l = inventario_local()["b1"]
+        st.dataframe(b1_l[b1_l["codigo_barras"] == codigo], use_container_width=True, hide_index=True)
 
-            st.markdown("#### Inventario del producto (Bodega1)")
-            st.dataframe(load_inventarios(st.session_state["refresh_key"])[0].query("codigo_barras == @codigo"), use_container_width=True, hide_index=True)
+    with tabs[0]:
+        form_entrada_crudo()
 
     # -------------------------
     # Producción / Conversión
     # -------------------------
-    with tabs[1]:
+    def form_produccion():
         st.markdown("### ✅ Producir TERMINADO descontando CRUDO")
         if not map_term:
             st.warning("No hay productos terminados. Crea uno en la pestaña Productos.")
-        else:
-            col = st.columns([2,1,2])
-            with col[0]:
-                sel_t = st.selectbox("Producto terminado (destino)", list(map_term.keys()))
-            with col[1]:
-                cant = st.number_input("Cantidad a producir", min_value=1, step=1, key="cant_prod")
-            with col[2]:
-                obs = st.text_input("Observaciones", "Producción / Conversión", key="obs_prod")
-
-            cod_t = map_term.get(sel_t)
-            cod_crudo_row = rela[rela["codigo_terminado"]==cod_t]
-            cod_c = cod_crudo_row["codigo_crudo"].iloc[0] if not cod_crudo_row.empty else None
-
-            stock_c = fetch_stock_live(TBL_B1, cod_c) if cod_c else 0
-            stock_t = fetch_stock_live(TBL_B2, cod_t)
-            st.markdown(f"**Stock CRUDO (B1):** {stock_c} · **Stock TERMINADO (B2):** {stock_t}")
-
-            if st.button("Producir e ingresar", key="btn_prod"):
-                try:
-                    with st.spinner("Procesando producción..."):
-                        rpc("sp_producir_terminado", {"p_codigo_terminado": cod_t, "p_cantidad": int(cant), "p_usuario": usuario, "p_obs": obs})
-                    st.success("Producción registrada ✅")
-                    st.info(f"CRUDO (B1) ahora: {fetch_stock_live(TBL_B1, cod_c)} · TERMINADO (B2) ahora: {fetch_stock_live(TBL_B2, cod_t)}")
-                    bump_refresh(); safe_rerun()
-                except Exception as e:
-                    st.error(f"Error: {e}")
+            return
+        mostrar_aviso("prod")
+        col = st.columns([2,1,2])
+        with col[0]:
+            sel_t = st.selectbox("Producto terminado (destino)", list(map_term.keys()))
+        with col[1]:
+            cant = st.number_input("Cantidad a producir", min_value=1, step=1, key="cant_prod")
+        with col[2]:
+            obs = st.text_input("Observaciones", "Producción / Conversión", key="obs_prod")
+
+        cod_t = map_term.get(sel_t)
+        bom = load_bom(st.session_state["refresh_key"])
+        comp = bom[bom["codigo_terminado"]==cod_t] if not bom.empty else pd.DataFrame(columns=mrp.BOM_COLS)
+        cods_c = comp["codigo_crudo"].tolist()
+
+        b1_l, b2_l = inventario_local()["b1"], inventario_local()["b2"]
+        fact_t = mrp.factibilidad(comp, b1_l)
+        max_t = int(fact_t["max_producible"].iloc[0]) if not fact_t.empty else 0
+        st.markdown(f"**Stock TERMINADO (B2):** {stock_local('Bodega2', cod_t)} · **Máximo producible con stock B1:** {max_t} · **Componentes:** {len(cods_c)}")
+        if comp.empty:
+            st.warning("Este terminado no tiene componentes (BOM). Agrégalos en la pestaña Productos.")
+
+        if st.button("Producir e ingresar", key="btn_prod"):
+            try:
+                with st.spinner("Procesando producción..."):
+                    res = rpc("sp_producir_terminado", {"p_codigo_terminado": cod_t, "p_cantidad": int(cant), "p_usuario": usuario, "p_obs": obs})
+                movs = aplicar_mutacion(res, dim)
+                avisar("prod", f"Producción registrada ✅ · TERMINADO (B2) ahora: {stock_nuevo(res, 'Bodega2', cod_t)} · {len(movs)} movimientos")
+                rerun_fragmento()
+            except Exception as e:
+                st.error(f"Error: {e}")
+
+        st.markdown("#### Componentes (BOM) para la cantidad a producir")
+        req = mrp.faltantes_plan(comp, b1_l, pd.Series({cod_t: int(cant)}))
+        if not req.empty:
+            req["detalle_crudo"] = req["codigo_crudo"].map(inv.detalles(dim, "crudo"))
+        st.dataframe(req, use_container_width=True, hide_index=True)
 
-            st.markdown("#### Inventario del producto")
-            cA, cB = st.columns(2)
-            with cA:
-                st.markdown("**Bodega1 (Crudo base)**")
-                st.dataframe(load_inventarios(st.session_state["refresh_key"])[0].query("codigo_barras == @cod_c"), use_container_width=True, hide_index=True)
-            with cB:
-                st.markdown("**Bodega2 (Terminado)**")
-                st.dataframe(load_inventarios(st.session_state["refresh_key"])[1].query("codigo_barras == @cod_t"), use_container_width=True, hide_index=True)
+        cA, cB = st.columns(2)
+        with cA:
+            st.markdown("**Bodega1 (Crudos componentes)**")
+            st.dataframe(b1_l[b1_l["codigo_barras"].isin(cods_c)], use_container_width=True, hide_index=True)
+        with cB:
+            st.markdown("**Bodega2 (Terminado)**")
+            st.dataframe(b2_l[b2_l["codigo_barras"] == cod_t], use_container_width=True, hide_index=True)
+
+    # Factibilidad global (MRP) sobre el stock local de Bodega1
+    def panel_mrp():
+        st.markdown("---")
+        st.markdown("### 🏭 Factibilidad de producción (MRP)")
+        bom_all = load_bom(st.session_state["refresh_key"])
+        terminados_all = rela["codigo_terminado"] if not rela.empty else None
+        b1_l = inventario_local()["b1"]
+        fact = mrp.factibilidad(bom_all, b1_l, terminados=terminados_all)
+        if not fact.empty:
+            fact["detalle"] = fact["codigo_terminado"].map(inv.detalles(dim, "terminado"))
+        st.dataframe(fact.sort_values("max_producible", ascending=False), use_container_width=True, hide_index=True)
+
+        st.markdown("#### Plan de producción → faltantes de crudo")
+        plan_df = st.data_editor(
+            pd.DataFrame({"codigo_terminado": pd.Series(dtype=str), "cantidad": pd.Series(dtype=int)}),
+            num_rows="dynamic", use_container_width=True, key="plan_mrp",
+        )
+        plan = plan_df.dropna().set_index("codigo_terminado")["cantidad"] if not plan_df.empty else pd.Series(dtype=float)
+        falt = mrp.faltantes_plan(bom_all, b1_l, plan)
+        if not falt.empty:
+            st.dataframe(falt, use_container_width=True, hide_index=True)
+            if (falt["faltante"] > 0).any():
+                st.warning(f"Faltan {int(falt['faltante'].sum())} und de crudo en {int((falt['faltante'] > 0).sum())} códigos.")
+            else:
+                st.success("El plan es factible con el stock actual de Bodega1 ✅")
+
+    # Producción y MRP en un mismo fragmento: producir (o editar el plan) recalcula la
+    # factibilidad con el stock local ya parchado, sin esperar un rerun completo
+    @fragmento
+    def seccion_produccion():
+        form_produccion()
+        panel_mrp()
+
+    with tabs[1]:
+        seccion_produccion()
 
     # -------------------------
-    # Salida Terminado
+    # Salida / Devolución Terminado (mismo formulario, distinta RPC)
     # -------------------------
-    with tabs[2]:
-        st.markdown("### 📦 Salida de Terminados (Bodega2)")
+    @fragmento
+    def form_terminado(clave: str, titulo: str, rpc_name: str, etiqueta_sel: str, etiqueta_cant: str, obs_default: str, boton: str, hecho: str):
+        st.markdown(titulo)
         if not map_term:
             st.warning("No hay productos terminados.")
-        else:
-            col = st.columns([2,1,2])
-            with col[0]:
-                sel_t = st.selectbox("Producto terminado", list(map_term.keys()), key="sel_sal")
-            with col[1]:
-                cant = st.number_input("Cantidad a sacar", min_value=1, step=1, key="cant_sal")
-            with col[2]:
-                obs = st.text_input("Observaciones", "Venta / Retiro", key="obs_sal")
-
-            cod_t = map_term.get(sel_t)
-            stock_t = fetch_stock_live(TBL_B2, cod_t)
-            st.markdown(f"**Stock TERMINADO (B2):** {stock_t}")
-
-            if st.button("Registrar salida", key="btn_sal"):
-                try:
-                    with st.spinner("Registrando salida..."):
-                        rpc("sp_salida_terminado", {"p_codigo_terminado": cod_t, "p_cantidad": int(cant), "p_usuario": usuario, "p_obs": obs})
-                    st.success(f"Salida registrada ✅ · Stock B2 ahora: {fetch_stock_live(TBL_B2, cod_t)}")
-                    bump_refresh(); safe_rerun()
-                except Exception as e:
-                    st.error(f"Error: {e}")
+            return
+        mostrar_aviso(clave)
+        col = st.columns([2,1,2])
+        with col[0]:
+            sel_t = st.selectbox(etiqueta_sel, list(map_term.keys()), key=f"sel_{clave}")
+        with col[1]:
+            cant = st.number_input(etiqueta_cant, min_value=1, step=1, key=f"cant_{clave}")
+        with col[2]:
+            obs = st.text_input("Observaciones", obs_default, key=f"obs_{clave}")
+
+        cod_t = map_term.get(sel_t)
+        st.markdown(f"**Stock TERMINADO (B2):** {stock_local('Bodega2', cod_t)}")
+
+        if st.button(boton, key=f"btn_{clave}"):
+            try:
+                with st.spinner(f"{boton}..."):
+                    res = rpc(rpc_name, {"p_codigo_terminado": cod_t, "p_cantidad": int(cant), "p_usuario": usuario, "p_obs": obs})
+                movs = aplicar_mutacion(res, dim)
+                avisar(clave, f"{hecho} ✅ · Stock B2 ahora: {stock_nuevo(res, 'Bodega2', cod_t)} · mov #{', #'.join(map(str, movs['id']))}")
+                rerun_fragmento()
+            except Exception as e:
+                st.error(f"Error: {e}")
+
+        st.markdown("#### Inventario del producto (Bodega2)")
+        b2_l = inventario_local()["b2"]
+        st.dataframe(b2_l[b2_l["codigo_barras"] == cod_t], use_container_width=True, hide_index=True)
 
-            st.markdown("#### Inventario del producto (Bodega2)")
-            st.dataframe(load_inventarios(st.session_state["refresh_key"])[1].query("codigo_barras == @cod_t"), use_container_width=True, hide_index=True)
+    with tabs[2]:
+        form_terminado("sal", "### 📦 Salida de Terminados (Bodega2)", "sp_salida_terminado", "Producto terminado",
+                       "Cantidad a sacar", "Venta / Retiro", "Registrar salida", "Salida registrada")
+
+    with tabs[3]:
+        form_terminado("dev", "### ♻️ Devolución a Terminados (Bodega2)", "sp_devolucion_terminado", "Producto devuelto (terminado)",
+                       "Cantidad devuelta", "Devolución cliente / Corrección", "Registrar devolución", "Devolución registrada")
 
     # -------------------------
-    # Devolución Terminado
+    # Correcciones
     # -------------------------
-    with tabs[3]:
-        st.markdown("### ♻️ Devolución a Terminados (Bodega2)")
+    @fragmento
+    def form_correccion_terminado():
+        st.markdown("#### 🛠️ Corrección: descontar TERMINADO y regresar a CRUDO")
         if not map_term:
             st.warning("No hay productos terminados.")
-        else:
-            col = st.columns([2,1,2])
-            with col[0]:
-                sel_t = st.selectbox("Producto devuelto (terminado)", list(map_term.keys()), key="sel_dev")
-            with col[1]:
-                cant = st.number_input("Cantidad devuelta", min_value=1, step=1, key="cant_dev")
-            with col[2]:
-                obs = st.text_input("Observaciones", "Devolución cliente / Corrección", key="obs_dev")
-
-            cod_t = map_term.get(sel_t)
-            stock_t = fetch_stock_live(TBL_B2, cod_t)
-            st.markdown(f"**Stock TERMINADO (B2):** {stock_t}")
-
-            if st.button("Registrar devolución", key="btn_dev"):
-                try:
-                    with st.spinner("Registrando devolución..."):
-                        rpc("sp_devolucion_terminado", {"p_codigo_terminado": cod_t, "p_cantidad": int(cant), "p_usuario": usuario, "p_obs": obs})
-                    st.success(f"Devolución registrada ✅ · Stock B2 ahora: {fetch_stock_live(TBL_B2, cod_t)}")
-                    bump_refresh(); safe_rerun()
-                except Exception as e:
-                    st.error(f"Error: {e}")
+            return
+        mostrar_aviso("cor_t")
+        col = st.columns([2,1,2])
+        with col[0]:
+            sel_t = st.selectbox("Producto TERMINADO", list(map_term.keys()), key="sel_cor_t")
+        with col[1]:
+            cant = st.number_input("Cantidad a corregir", min_value=1, step=1, key="cant_cor_t")
+        with col[2]:
+            obs = st.text_input("Observaciones", "Corrección / Reproceso", key="obs_cor_t")
+
+        cod_t = map_term.get(sel_t)
+        bom = load_bom(st.session_state["refresh_key"])
+        comp = bom[bom["codigo_terminado"]==cod_t] if not bom.empty else pd.DataFrame(columns=mrp.BOM_COLS)
+        cods_c = comp["codigo_crudo"].tolist()
+        st.markdown(f"**Stock TERMINADO (B2):** {stock_local('Bodega2', cod_t)} · **Componentes que vuelven a B1:** {len(cods_c)}")
+        if comp.empty:
+            st.warning("Este terminado no tiene componentes (BOM): no hay crudo al cual devolver.")
+
+        if st.button("Aplicar corrección", key="btn_cor_t"):
+            try:
+                with st.spinner("Aplicando corrección..."):
+                    res = rpc("sp_correccion_terminado_a_crudo", {"p_codigo_terminado": cod_t, "p_cantidad": int(cant), "p_usuario": usuario, "p_obs": obs})
+                aplicar_mutacion(res, dim)
+                b1_txt = ", ".join(f"{c}: {stock_nuevo(res, 'Bodega1', c)}" for c in cods_c)
+                avisar("cor_t", f"Corrección aplicada ✅ · B2 ahora: {stock_nuevo(res, 'Bodega2', cod_t)} · B1 ahora: {b1_txt}")
+                rerun_fragmento()
+            except Exception as e:
+                st.error(f"Error: {e}")
+
+        est = inventario_local()
+        cA, cB = st.columns(2)
+        with cA:
+            st.markdown("**Bodega2 (Terminado)**")
+            st.dataframe(est["b2"][est["b2"]["codigo_barras"] == cod_t], use_container_width=True, hide_index=True)
+        with cB:
+            st.markdown("**Bodega1 (Crudos devueltos)**")
+            st.dataframe(est["b1"][est["b1"]["codigo_barras"].isin(cods_c)], use_container_width=True, hide_index=True)
 
-            st.markdown("#### Inventario del producto (Bodega2)")
-            st.dataframe(load_inventarios(st.session_state["refresh_key"])[1].query("codigo_barras == @cod_t"), use_container_width=True, hide_index=True)
+    @fragmento
+    def form_correccion_crudo():
+        st.markdown("#### 🛠️ Corrección: solo descuento en CRUDO (Bodega1)")
+        if not map_crudo:
+            st.warning("No hay productos crudos.")
+            return
+        mostrar_aviso("cor_c")
+        col = st.columns([2,1,2])
+        with col[0]:
+            sel_c = st.selectbox("Producto CRUDO", list(map_crudo.keys()), key="sel_cor_c")
+        with col[1]:
+            cant = st.number_input("Cantidad a descontar", min_value=1, step=1, key="cant_cor_c")
+        with col[2]:
+            obs = st.text_input("Observaciones", "Ajuste inventario / Merma", key="obs_cor_c")
+
+        cod_c = map_crudo.get(sel_c)
+        st.markdown(f"**Stock CRUDO (B1):** {stock_local('Bodega1', cod_c)}")
+
+        if st.button("Aplicar descuento", key="btn_cor_c"):
+            try:
+                with st.spinner("Aplicando corrección..."):
+                    res = rpc("sp_correccion_crudo_descuento", {"p_codigo_crudo": cod_c, "p_cantidad": int(cant), "p_usuario": usuario, "p_obs": obs})
+                aplicar_mutacion(res, dim)
+                avisar("cor_c", f"Corrección aplicada ✅ · B1 ahora: {stock_nuevo(res, 'Bodega1', cod_c)}")
+                rerun_fragmento()
+            except Exception as e:
+                st.error(f"Error: {e}")
+
+        st.markdown("**Inventario (Bodega1)**")
+        b1_l = inventario_local()["b1"]
+        st.dataframe(b1_l[b1_l["codigo_barras"] == cod_c], use_container_width=True, hide_index=True)
 
-    # -------------------------
-    # Correcciones
-    # -------------------------
     with tabs[4]:
         sub1, sub2 = st.tabs(["Terminado → Crudo","Crudo (descuento)"])
-
         with sub1:
-            st.markdown("#### 🛠️ Corrección: descontar TERMINADO y regresar a CRUDO")
-            if not map_term:
-                st.warning("No hay productos terminados.")
-            else:
-                col = st.columns([2,1,2])
-                with col[0]:
-                    sel_t = st.selectbox("Producto TERMINADO", list(map_term.keys()), key="sel_cor_t")
-                with col[1]:
-                    cant = st.number_input("Cantidad a corregir", min_value=1, step=1, key="cant_cor_t")
-                with col[2]:
-                    obs = st.text_input("Observaciones", "Corrección / Reproceso", key="obs_cor_t")
-
-                cod_t = map_term.get(sel_t)
-                row = rela[rela["codigo_terminado"]==cod_t]
-                cod_c = row["codigo_crudo"].iloc[0] if not row.empty else None
-                stock_t = fetch_stock_live(TBL_B2, cod_t)
-                stock_c = fetch_stock_live(TBL_B1, cod_c) if cod_c else 0
-                st.markdown(f"**Stock TERMINADO (B2):** {stock_t} · **Stock CRUDO (B1):** {stock_c}")
-
-                if st.button("Aplicar corrección", key="btn_cor_t"):
-                    try:
-                        with st.spinner("Aplicando corrección..."):
-                            rpc("sp_correccion_terminado_a_crudo", {"p_codigo_terminado": cod_t, "p_cantidad": int(cant), "p_usuario": usuario, "p_obs": obs})
-                        st.success("Corrección aplicada ✅")
-                        st.info(f"B2 ahora: {fetch_stock_live(TBL_B2, cod_t)} · B1 ahora: {fetch_stock_live(TBL_B1, cod_c)}")
-                        bump_refresh(); safe_rerun()
-                    except Exception as e:
-                        st.error(f"Error: {e}")
-
-                cA, cB = st.columns(2)
-                with cA:
-                    st.markdown("**Bodega2 (Terminado)**")
-                    st.dataframe(load_inventarios(st.session_state["refresh_key"])[1].query("codigo_barras == @cod_t"), use_container_width=True, hide_index=True)
-                with cB:
-                    st.markdown("**Bodega1 (Crudo devuelto)**")
-                    st.dataframe(load_inventarios(st.session_state["refresh_key"])[0].query("codigo_barras == @cod_c"), use_container_width=True, hide_index=True)
-
+            form_correccion_terminado()
         with sub2:
-            st.markdown("#### 🛠️ Corrección: solo descuento en CRUDO (Bodega1)")
-            if not map_crudo:
-                st.warning("No hay productos crudos.")
-            else:
-                col = st.columns([2,1,2])
-                with col[0]:
-                    sel_c = st.selectbox("Producto CRUDO", list(map_crudo.keys()), key="sel_cor_c")
-                with col[1]:
-                    cant = st.number_input("Cantidad a descontar", min_value=1, step=1, key="cant_cor_c")
-                with col[2]:
-                    obs = st.text_input("Observaciones", "Ajuste inventario / Merma", key="obs_cor_c")
-
-                cod_c = map_crudo.get(sel_c)
-                stock_c = fetch_stock_live(TBL_B1, cod_c)
-                st.markdown(f"**Stock CRUDO (B1):** {stock_c}")
-
-                if st.button("Aplicar descuento", key="btn_cor_c"):
-                    try:
-                        with st.spinner("Aplicando corrección..."):
-                            rpc("sp_correccion_crudo_descuento", {"p_codigo_crudo": cod_c, "p_cantidad": int(cant), "p_usuario": usuario, "p_obs": obs})
-                        st.success(f"Corrección aplicada ✅ · B1 ahora: {fetch_stock_live(TBL_B1, cod_c)}")
-                        bump_refresh(); safe_rerun()
-                    except Exception as e:
-                        st.error(f"Error: {e}")
-
-                st.markdown("**Inventario (Bodega1)")
-                st.dataframe(load_inventarios(st.session_state["refresh_key"])[0].query("codigo_barras == @cod_c"), use_container_width=True, hide_index=True)
+            form_correccion_crudo()
 
     # -------------------------
     # Productos
@@ -945,7 +1435,7 @@ else:
                 else:
                     try:
                         with st.spinner("Creando crudo..."):
-                            rpc("sp_crear_producto_crudo", {"p_codigo_crudo": codigo_c, "p_detalle_crudo": detalle_c})
+                            inv.crear_producto_crudo(sb, codigo_c, detalle_c)
                         st.success("CRUDO creado ✅")
                         bump_refresh(); safe_rerun()
                     except Exception as e:
@@ -963,12 +1453,122 @@ else:
                 else:
                     try:
                         with st.spinner("Creando terminado..."):
-                            rpc("sp_crear_producto_terminado", {"p_codigo_terminado": codigo_t, "p_detalle": detalle_t, "p_codigo_crudo": cod_base})
+                            inv.crear_producto_terminado(sb, codigo_t, detalle_t, cod_base)
                         st.success("TERMINADO creado ✅")
                         bump_refresh(); safe_rerun()
                     except Exception as e:
                         st.error(f"Error: {e}")
 
+        st.markdown("---")
+        st.subheader("🧾 Componentes del TERMINADO (BOM)")
+        if not map_term or not map_crudo:
+            st.info("Necesitas al menos un crudo y un terminado para definir la BOM.")
+        else:
+            cb = st.columns([2,2,1,1])
+            with cb[0]:
+                bom_t = st.selectbox("Terminado", list(map_term.keys()), key="bom_t")
+            with cb[1]:
+                bom_c = st.selectbox("Crudo componente", list(map_crudo.keys()), key="bom_c")
+            with cb[2]:
+                bom_q = st.number_input("Cantidad por unidad", min_value=0.001, value=1.0, step=0.5, format="%.3f", key="bom_q")
+            with cb[3]:
+                st.write("")
+                quitar = st.checkbox("Quitar", key="bom_quitar")
+            if st.button("Guardar componente", key="btn_bom"):
+                try:
+                    if quitar:
+                        inv.bom_quitar_componente(sb, map_term[bom_t], map_crudo[bom_c])
+                    else:
+                        inv.bom_set_componente(sb, map_term[bom_t], map_crudo[bom_c], bom_q)
+                    st.success("BOM actualizada ✅")
+                    bump_refresh(); safe_rerun()
+                except Exception as e:
+                    st.error(f"Error: {e}")
+            bom_sel = load_bom(st.session_state["refresh_key"])
+            if not bom_sel.empty:
+                bom_sel = bom_sel[bom_sel["codigo_terminado"]==map_term[bom_t]]
+            st.dataframe(bom_sel, use_container_width=True, hide_index=True)
+
+        st.markdown("---")
+        st.subheader("💲 Precio (con fecha de vigencia)")
+        todos_cod = {**map_crudo, **map_term}
+        if not todos_cod:
+            st.info("Crea productos para asignarles precio.")
+        else:
+            cpz = st.columns([2,1,1])
+            with cpz[0]:
+                pr_sel = st.selectbox("Producto", list(todos_cod.keys()), key="precio_prod")
+            with cpz[1]:
+                pr_val = st.number_input("Precio", min_value=0.0, value=0.0, step=100.0, key="precio_val")
+            with cpz[2]:
+                pr_desde = st.date_input("Vigente desde", value=date.today(), key="precio_desde")
+            if st.button("Guardar precio", key="btn_precio"):
+                try:
+                    vig = datetime.now(timezone.utc) if pr_desde == date.today() else datetime.combine(pr_desde, datetime.min.time(), timezone.utc)
+                    inv.set_precio(sb, todos_cod[pr_sel], pr_val, vig, usuario)
+                    st.success("Precio guardado ✅")
+                    load_version_precios.clear()
+                    bump_refresh(); safe_rerun()
+                except Exception as e:
+                    st.error(f"Error: {e}")
+            hist_sel = load_historial_precios(load_version_precios())
+            hist_sel = hist_sel[hist_sel["codigo"] == todos_cod[pr_sel]]
+            if not hist_sel.empty:
+                st.dataframe(hist_sel.sort_values("vigente_desde", ascending=False), use_container_width=True, hide_index=True)
+
+        st.markdown("---")
+        st.subheader("🖼️ Fotos de productos")
+        pipe = get_fotos()
+        cf = st.columns([1,2,2])
+        with cf[0]:
+            tipo_f = st.radio("Tipo", ["crudo","terminado"], horizontal=True, key="foto_tipo")
+        mapa_f = map_crudo if tipo_f == "crudo" else map_term
+        with cf[1]:
+            sel_f = st.selectbox("Producto", ["Todos"] + list(mapa_f.keys()), key="foto_prod")
+        cod_f = mapa_f.get(sel_f)
+        with cf[2]:
+            archivo = st.file_uploader("Subir foto", type=["jpg","jpeg","png","webp"], key="foto_up", disabled=cod_f is None)
+            if archivo is not None and cod_f and st.button("Guardar foto", key="btn_foto"):
+                try:
+                    with st.spinner("Subiendo foto..."):
+                        pipe.subir(cod_f, tipo_f, archivo.getvalue(), archivo.name, archivo.type or "image/jpeg")
+                    st.success("Foto guardada ✅ · la miniatura se genera en segundo plano")
+                except Exception as e:
+                    st.error(f"Error: {e}")
+
+        # Galería paginada: solo se piden (y se bajan miniaturas de) las fotos de la página visible
+        por_pagina = 12
+        pag_key = f"foto_pag_{tipo_f}_{cod_f}"
+        pagina = st.session_state.get(pag_key, 0)
+        try:
+            fotos_pag, total_f = fotos.pagina_fotos(sb, tipo_f, pagina, por_pagina, cod_f)
+        except Exception:
+            fotos_pag, total_f = [], 0
+            st.info("Crea la tabla fotos_productos (ver SQL en app.py y fotos.py) para usar la galería.")
+        if fotos_pag:
+            grid = st.columns(4)
+            for i, f in enumerate(fotos_pag):
+                with grid[i % 4]:
+                    mini = pipe.miniatura(f)
+                    if mini:
+                        st.image(mini, caption=f["codigo"], use_container_width=True)
+                    elif pipe.error(f):
+                        st.caption(f"⚠️ {f['codigo']} — no se pudo generar la miniatura", help=pipe.error(f))
+                    else:
+                        st.caption(f"⏳ {f['codigo']} — generando miniatura")
+            n_pags = max(1, -(-total_f // por_pagina))
+            cp = st.columns([1,2,1])
+            with cp[0]:
+                if st.button("⬅️ Anterior", key="foto_prev", disabled=pagina == 0):
+                    st.session_state[pag_key] = pagina - 1; safe_rerun()
+            with cp[1]:
+                st.caption(f"Página {pagina + 1} de {n_pags} · {total_f} fotos")
+            with cp[2]:
+                if st.button("Siguiente ➡️", key="foto_next", disabled=pagina + 1 >= n_pags):
+                    st.session_state[pag_key] = pagina + 1; safe_rerun()
+        elif total_f == 0:
+            st.caption("Sin fotos para este filtro.")
+
         st.markdown("---")
         c1, c2 = st.columns(2)
         with c1:
@@ -0,0 +1,260 @@
+"""
+Prueba de carga de las 8 RPC de inventario con N operadores simulados.
+
+Cada operador abre su propia conexión a un Postgres local (esquema + funciones del
+docstring de app.py, ver concurrencia.preparar_bd) y ejecuta una mezcla ponderada de:
+sp_entrada_crudo, sp_producir_terminado, sp_salida_terminado, sp_devolucion_terminado,
+sp_correccion_terminado_a_crudo, sp_correccion_crudo_descuento,
+sp_crear_producto_crudo, sp_crear_producto_terminado.
+
+Reporta throughput, latencia p50/p95/p99, tasa de error de negocio (stock insuficiente),
+errores inesperados y deadlocks, y guarda cada corrida en SQLite para comparar en el tiempo.
+
+Uso:
+    INVENTARIO_TEST_DATABASE_URL=postgresql://postgres@localhost/inventario_test python carga.py --usuarios 8 16 32 --duracion 20
+    python carga.py --historial
+
+⚠️ Recrea el esquema `public` de esa base: misma variable y misma protección que
+concurrencia.py (la base debe terminar en `_test`, o pasar --destruir-esquema).
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import closing
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import psycopg
+
+import concurrencia
+
+RESULTADOS_PATH = Path(os.getenv("CARGA_RESULTADOS", "resultados_carga.sqlite"))
+
+# Mezcla por defecto (peso relativo): mostrador con ventas dominantes
+MEZCLA_DEFAULT = {
+    "sp_salida_terminado": 35,
+    "sp_entrada_crudo": 20,
+    "sp_producir_terminado": 15,
+    "sp_devolucion_terminado": 10,
+    "sp_correccion_terminado_a_crudo": 5,
+    "sp_correccion_crudo_descuento": 5,
+    "sp_crear_producto_crudo": 5,
+    "sp_crear_producto_terminado": 5,
+}
+
+_ESQUEMA_RESULTADOS = """
+create table if not exists corridas(
+  id integer primary key autoincrement,
+  fecha text not null,
+  etiqueta text,
+  usuarios integer not null,
+  duracion_s real not null,
+  mezcla text not null,
+  ops integer not null,
+  ops_s real not null,
+  p50_ms real, p95_ms real, p99_ms real,
+  tasa_negocio real, tasa_error real, tasa_deadlock real
+);
+create table if not exists corridas_rpc(
+  corrida_id integer not null references corridas(id),
+  rpc text not null,
+  ops integer not null,
+  ops_s real not null,
+  p50_ms real, p95_ms real, p99_ms real,
+  tasa_negocio real, tasa_error real, tasa_deadlock real
+);
+"""
+
+
+class Operador(threading.Thread):
+    """Un usuario simulado: elige RPC según la mezcla y registra (rpc, latencia, resultado)."""
+
+    def __init__(self, n: int, url: str, mezcla: dict, catalogo: dict, fin: float, barrera: threading.Barrier,
+                 pausa_ms: float = 0, calientes: float = 0.2, semilla: int | None = None):
+        super().__init__(name=f"operador-{n}", daemon=True)
+        self.n = n
+        self.url = url
+        self.rpcs = list(mezcla)
+        self.pesos = list(mezcla.values())
+        self.catalogo = catalogo
+        self.fin = fin
+        self.barrera = barrera
+        self.pausa = pausa_ms / 1000
+        self.calientes = calientes
+        self.rng = random.Random(semilla if semilla is None else semilla + n)
+        self.registros: list[tuple[str, float, str]] = []
+        self._nuevos = 0
+
+    def _codigo(self, tipo: str) -> str:
+        # 80% de las operaciones caen en el 20% "caliente" del catálogo → contención realista
+        cods = self.catalogo[tipo]
+        corte = max(1, int(len(cods) * self.calientes))
+        return self.rng.choice(cods[:corte] if self.rng.random() < 0.8 else cods)
+
+    def _params(self, rpc: str) -> tuple:
+        cant = self.rng.randint(1, 5)
+        u = f"carga-{self.n}"
+        if rpc in ("sp_entrada_crudo", "sp_correccion_crudo_descuento"):
+            return (self._codigo("crudos"), cant, u)
+        if rpc == "sp_crear_producto_crudo":
+            self._nuevos += 1
+            return (f"NC{self.n}_{self._nuevos}", "Crudo carga")
+        if rpc == "sp_crear_producto_terminado":
+            self._nuevos += 1
+            return (f"NT{self.n}_{self._nuevos}", "Terminado carga", self._codigo("crudos"))
+        return (self._codigo("terminados"), cant, u)
+
+    def run(self):
+        with psycopg.connect(self.url, autocommit=True) as conn:
+            self.barrera.wait()
+            while time.perf_counter() < self.fin:
+                rpc = self.rng.choices(self.rpcs, self.pesos)[0]
+                params = self._params(rpc)
+                marcas = ", ".join(["%s"] * len(params))
+                t0 = time.perf_counter()
+                try:
+                    conn.execute(f"select * from {rpc}({marcas})", params)
+                    res = "ok"
+                except psycopg.errors.DeadlockDetected:
+                    res = "deadlock"
+                except psycopg.errors.RaiseException:
+                    res = "negocio"
+                except psycopg.Error:
+                    res = "error"
+                self.registros.append((rpc, (time.perf_counter() - t0) * 1000, res))
+                if self.pausa:
+                    time.sleep(self.rng.expovariate(1 / self.pausa))
+
+
+def resumir(df: pd.DataFrame, duracion: float) -> dict:
+    lat = df["latencia_ms"].to_numpy()
+    p50, p95, p99 = np.percentile(lat, [50, 95, 99]) if len(lat) else (np.nan,) * 3
+    n = len(df)
+    return {
+        "ops": n,
+        "ops_s": n / duracion if duracion else 0.0,
+        "p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99),
+        "tasa_negocio": float((df["resultado"] == "negocio").mean()) if n else 0.0,
+        "tasa_error": float((df["resultado"] == "error").mean()) if n else 0.0,
+        "tasa_deadlock": float((df["resultado"] == "deadlock").mean()) if n else 0.0,
+    }
+
+
+def correr(url: str, usuarios: int, duracion: float, mezcla: dict = MEZCLA_DEFAULT, pausa_ms: float = 0,
+           n_crudos: int = 200, n_terminados: int = 500, semilla: int | None = None,
+           destruir_esquema: bool = False) -> tuple[dict, pd.DataFrame]:
+    with psycopg.connect(url) as conn:
+        concurrencia.preparar_bd(conn, destruir_esquema)
+        concurrencia.sembrar(conn, n_crudos=n_crudos, n_terminados=n_terminados, stock=10_000)
+        catalogo = {
+            "crudos": [r[0] for r in conn.execute("select codigo_crudo from productos_crudos order by 1")],
+            "terminados": [r[0] for r in conn.execute("select codigo_terminado from relacion_crudo_terminado order by 1")],
+        }
+
+    barrera = threading.Barrier(usuarios + 1)
+    fin = time.perf_counter() + duracion + 60  # se ajusta al pasar la barrera
+    ops = [Operador(i, url, mezcla, catalogo, fin, barrera, pausa_ms, semilla=semilla) for i in range(usuarios)]
+    for o in ops:
+        o.start()
+    barrera.wait()
+    t0 = time.perf_counter()
+    for o in ops:
+        o.fin = t0 + duracion
+    for o in ops:
+        o.join()
+    real = time.perf_counter() - t0
+
+    df = pd.DataFrame([r for o in ops for r in o.registros], columns=["rpc", "latencia_ms", "resultado"])
+    total = {"usuarios": usuarios, "duracion_s": real, **resumir(df, real)}
+    por_rpc = pd.DataFrame([{"rpc": rpc, **resumir(g, real)} for rpc, g in df.groupby("rpc")])
+    return total, por_rpc
+
+
+def guardar(total: dict, por_rpc: pd.DataFrame, mezcla: dict, etiqueta: str | None, path: Path = RESULTADOS_PATH) -> int:
+    with closing(sqlite3.connect(path)) as conn, conn:
+        conn.executescript(_ESQUEMA_RESULTADOS)
+        cur = conn.execute(
+            "insert into corridas(fecha, etiqueta, usuarios, duracion_s, mezcla, ops, ops_s, p50_ms, p95_ms, p99_ms, tasa_negocio, tasa_error, tasa_deadlock) "
+            "values(?,?,?,?,?,?,?,?,?,?,?,?,?)",
+            (datetime.now(timezone.utc).isoformat(), etiqueta, total["usuarios"], total["duracion_s"], json.dumps(mezcla),
+             total["ops"], total["ops_s"], total["p50_ms"], total["p95_ms"], total["p99_ms"],
+             total["tasa_negocio"], total["tasa_error"], total["tasa_deadlock"]),
+        )
+        corrida_id = cur.lastrowid
+        conn.executemany(
+            "insert into corridas_rpc(corrida_id, rpc, ops, ops_s, p50_ms, p95_ms, p99_ms, tasa_negocio, tasa_error, tasa_deadlock) values(?,?,?,?,?,?,?,?,?,?)",
+            [(corrida_id, r.rpc, r.ops, r.ops_s, r.p50_ms, r.p95_ms, r.p99_ms, r.tasa_negocio, r.tasa_error, r.tasa_deadlock) for r in por_rpc.itertuples()],
+        )
+    return corrida_id
+
+
+def historial(path: Path = RESULTADOS_PATH, limite: int = 20) -> pd.DataFrame:
+    if not path.exists():
+        return pd.DataFrame()
+    with closing(sqlite3.connect(path)) as conn:
+        return pd.read_sql_query(
+            "select id, fecha, etiqueta, usuarios, ops, round(ops_s,1) ops_s, round(p50_ms,2) p50_ms, round(p95_ms,2) p95_ms, "
+            "round(p99_ms,2) p99_ms, round(tasa_error,4) tasa_error, round(tasa_deadlock,4) tasa_deadlock "
+            "from corridas order by id desc limit ?", conn, params=(limite,),
+        )
+
+
+def _parse_mezcla(txt: str | None) -> dict:
+    if not txt:
+        return MEZCLA_DEFAULT
+    mezcla = {}
+    for parte in txt.split(","):
+        nombre, peso = parte.split("=")
+        nombre = nombre.strip() if nombre.strip().startswith("sp_") else f"sp_{nombre.strip()}"
+        if nombre not in MEZCLA_DEFAULT:
+            raise ValueError(f"RPC desconocida en --mezcla: {nombre}")
+        mezcla[nombre] = float(peso)
+    return mezcla
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Prueba de carga de las RPC de inventario")
+    ap.add_argument("--url", default=os.getenv(concurrencia.URL_ENV), help=f"Postgres de pruebas (default: {concurrencia.URL_ENV})")
+    ap.add_argument("--destruir-esquema", action="store_true", help="Permitir recrear `public` en una base que no termina en _test")
+    ap.add_argument("--usuarios", type=int, nargs="+", default=[8], help="Uno o varios niveles de concurrencia")
+    ap.add_argument("--duracion", type=float, default=15, help="Segundos por nivel")
+    ap.add_argument("--pausa-ms", type=float, default=0, help="Tiempo medio entre operaciones por operador")
+    ap.add_argument("--mezcla", help="p. ej. salida_terminado=50,entrada_crudo=30,producir_terminado=20")
+    ap.add_argument("--etiqueta", help="Nombre de la corrida (commit, cambio probado, …)")
+    ap.add_argument("--semilla", type=int)
+    ap.add_argument("--historial", action="store_true", help="Solo mostrar corridas guardadas")
+    args = ap.parse_args(argv)
+
+    if args.historial:
+        print(historial().to_string(index=False))
+        return 0
+    if not args.url:
+        ap.error(f"Falta --url o {concurrencia.URL_ENV}")
+
+    mezcla = _parse_mezcla(args.mezcla)
+    for n in args.usuarios:
+        try:
+            total, por_rpc = correr(args.url, n, args.duracion, mezcla, args.pausa_ms, semilla=args.semilla,
+                                    destruir_esquema=args.destruir_esquema)
+        except RuntimeError as e:
+            ap.error(str(e))
+        corrida_id = guardar(total, por_rpc, mezcla, args.etiqueta)
+        print(
+            f"\n#{corrida_id} · {n} usuarios · {total['ops']} ops en {total['duracion_s']:.1f}s → {total['ops_s']:.0f} ops/s · "
+            f"p50 {total['p50_ms']:.2f}ms p95 {total['p95_ms']:.2f}ms p99 {total['p99_ms']:.2f}ms · "
+            f"negocio {total['tasa_negocio']:.1%} error {total['tasa_error']:.2%} deadlock {total['tasa_deadlock']:.2%}"
+        )
+        print(por_rpc.round(3).to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
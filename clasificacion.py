@@ -0,0 +1,135 @@
+"""
+Clasificación ABC/XYZ de SKUs por bodega para priorizar el inventario.
+
+- ABC (valor): unidades de salida de la ventana × precio. Orden descendente y
+  participación acumulada: A mientras lo anterior no llega a `corte_a`, B hasta
+  `corte_b`, C el resto (y todo SKU sin valor consumido).
+- XYZ (variabilidad): coeficiente de variación de la demanda por período (semana o
+  mes), contando como 0 los períodos sin salidas. X ≤ `cv_x`, Y ≤ `cv_y`, Z mayor o
+  sin demanda. La ventana se alinea a períodos completos (`ventana_alineada`): un
+  período parcial contado como uno entero de demanda baja inflaría el CV.
+
+Media y desvío salen de Σx y Σx² por SKU (np.bincount sobre códigos enteros), sin
+bucles por SKU ni matriz SKU × período.
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+ABC = ["A","B","C"]
+XYZ = ["X","Y","Z"]
+CLASES = [a + x for a in ABC for x in XYZ]
+COLS = ["bodega","codigo_barras","stock","demanda","precio","valor","participacion","acumulado",
+        "media","cv","abc","xyz","clase"]
+
+
+@dataclass(frozen=True)
+class Parametros:
+    corte_a: float = 0.80
+    corte_b: float = 0.95
+    cv_x: float = 0.5
+    cv_y: float = 1.0
+
+
+def ventana_alineada(hoy, ventana_dias: int, bucket: str = "week") -> tuple:
+    """[desde, hasta) con solo períodos completos dentro de los últimos `ventana_dias`.
+
+    hasta es el inicio del período en curso (aún parcial) y desde el primer inicio de
+    período dentro de la ventana; siempre queda al menos un período.
+    """
+    freq = {"week": "W", "month": "M"}.get(bucket, "D")
+    actual = pd.Period(pd.Timestamp(hoy), freq)
+    limite = pd.Timestamp(hoy) - pd.Timedelta(days=ventana_dias)
+    primero = pd.Period(limite, freq)
+    if primero.start_time < limite:
+        primero += 1
+    primero = min(primero, actual - 1)
+    return primero.start_time.date(), actual.start_time.date()
+
+
+def n_periodos(desde, hasta, bucket: str = "week") -> int:
+    """Períodos (como los agrupa date_trunc) que toca el rango [desde, hasta)."""
+    ini = pd.Timestamp(desde)
+    fin = pd.Timestamp(hasta) - pd.Timedelta(1, "ns")
+    return max(len(pd.period_range(ini, fin, freq={"week": "W", "month": "M"}.get(bucket, "D"))), 1)
+
+
+def clasificar(stocks: dict, demanda: pd.DataFrame, precios: pd.Series, periodos: int,
+               params: Parametros = Parametros()) -> pd.DataFrame:
+    """Una fila por (bodega, SKU) con stock, demanda, valor y sus clases ABC / XYZ.
+
+    stocks:  {"Bodega1": df, "Bodega2": df} con el stock actual (codigo_barras, cantidad).
+    demanda: unidades de salida por período (fecha, bodega, codigo_barras, unidades).
+    precios: precio actual por código.
+    """
+    partes = [df[["codigo_barras","cantidad"]].assign(bodega=b) for b, df in stocks.items() if not df.empty]
+    stock = pd.concat(partes, ignore_index=True) if partes else pd.DataFrame(columns=["codigo_barras","cantidad","bodega"])
+    dem = demanda if not demanda.empty else pd.DataFrame(columns=["bodega","codigo_barras","unidades"])
+
+    # Clave entera (bodega, código) común a stock y demanda: factorizar cada columna una vez
+    # y combinar enteros es mucho más barato que factorizar pares de strings
+    cod_k, cod_u = pd.factorize(pd.concat([stock["codigo_barras"], dem["codigo_barras"]], ignore_index=True))
+    bod_k, bod_u = pd.factorize(pd.concat([stock["bodega"], dem["bodega"]], ignore_index=True))
+    k, uniq = pd.factorize(bod_k.astype(np.int64) * len(cod_u) + cod_k)
+    n, ns = len(uniq), len(stock)
+    if n == 0:
+        return pd.DataFrame(columns=COLS)
+    ks, kd = k[:ns], k[ns:]
+
+    x = pd.to_numeric(dem["unidades"], errors="coerce").fillna(0).to_numpy(dtype=float)
+    suma = np.bincount(kd, weights=x, minlength=n)
+    suma2 = np.bincount(kd, weights=x * x, minlength=n)
+    media = suma / periodos
+    desvio = np.sqrt(np.maximum(suma2 / periodos - media ** 2, 0.0))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cv = np.where(media > 0, desvio / media, np.inf)
+
+    b_cod = uniq // max(len(cod_u), 1)
+    codigos = pd.Index(cod_u[uniq % max(len(cod_u), 1)])
+    bodegas = np.asarray(bod_u)[b_cod]
+    precio = precios.reindex(codigos).fillna(0.0).to_numpy(dtype=float)
+    valor = suma * precio
+
+    # ABC dentro de cada bodega: orden (bodega, valor desc) y acumulado por tramos
+    orden = np.lexsort((-valor, b_cod))
+    v_ord, b_ord = valor[orden], b_cod[orden]
+    total = np.bincount(b_cod, weights=valor, minlength=len(bod_u))[b_ord]
+    acum = np.cumsum(v_ord)
+    inicio = np.r_[0, np.flatnonzero(np.diff(b_ord)) + 1]  # primera fila de cada bodega
+    acum -= np.repeat(acum[inicio] - v_ord[inicio], np.diff(np.r_[inicio, len(b_ord)]))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        part = np.where(total > 0, v_ord / total, 0.0)
+        acum = np.where(total > 0, acum / total, 0.0)
+    previo = acum - part
+    abc = np.where(v_ord <= 0, "C", np.select([previo < params.corte_a, previo < params.corte_b], ["A","B"], "C"))
+    cv_ord = cv[orden]
+    xyz = np.select([cv_ord <= params.cv_x, cv_ord <= params.cv_y], ["X","Y"], "Z")
+
+    cantidad = np.bincount(ks, weights=pd.to_numeric(stock["cantidad"], errors="coerce").fillna(0).to_numpy(dtype=float), minlength=n)
+    out = pd.DataFrame({
+        "bodega": bodegas[orden],
+        "codigo_barras": codigos.to_numpy()[orden],
+        "stock": cantidad[orden],
+        "demanda": suma[orden],
+        "precio": precio[orden],
+        "valor": v_ord,
+        "participacion": part,
+        "acumulado": acum,
+        "media": media[orden],
+        "cv": np.where(np.isfinite(cv_ord), cv_ord, np.nan),
+        "abc": pd.Categorical(abc, categories=ABC, ordered=True),
+        "xyz": pd.Categorical(xyz, categories=XYZ, ordered=True),
+    })
+    out["clase"] = pd.Categorical(np.char.add(abc.astype(str), xyz.astype(str)), categories=CLASES, ordered=True)
+    return out[COLS]
+
+
+def matriz(clasif: pd.DataFrame, medida: str = "skus") -> pd.DataFrame:
+    """Tabla 3×3 (ABC × XYZ) con la cantidad de SKUs o el valor consumido de cada clase."""
+    if medida == "valor":
+        m = clasif.pivot_table(index="abc", columns="xyz", values="valor", aggfunc="sum", observed=False)
+    else:
+        m = pd.crosstab(clasif["abc"], clasif["xyz"], dropna=False)
+    return m.reindex(index=ABC, columns=XYZ, fill_value=0).fillna(0)
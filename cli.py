@@ -0,0 +1,186 @@
+"""
+CLI del inventario (sin Streamlit): movimientos por lote, exportaciones y KPIs.
+
+Usa el mismo núcleo que la app (inventario.py / snapshots.py) y las credenciales
+SUPABASE_URL / SUPABASE_KEY (.env incluido).
+
+Uso:
+    python cli.py movimientos lote.csv --usuario escaner-1
+        (CSV con columnas operacion,codigo,cantidad[,obs]; operacion ∈ inventario.OPERACIONES)
+    python cli.py exportar --desde 2025-01-01 --hasta 2025-01-31 --salida bodega2.xlsx
+    python cli.py kpis --ventana 30 --umbral 5 --salida kpis.json
+    python cli.py clasificar --ventana 90 --periodo week --salida abc_xyz.csv
+    python cli.py bench --repeticiones 3
+        (tiempo de los mismos KPIs por la CLI vs. una ejecución completa del script de la app)
+"""
+
+import argparse
+import csv
+import json
+import statistics
+import sys
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import clasificacion
+import inventario as inv
+import snapshots
+
+APP_PATH = Path(__file__).with_name("app.py")
+
+
+def movimientos_lote(sb, filas: list[dict], usuario: str, detener: bool = False) -> tuple[int, list[str]]:
+    """Aplica cada fila como una RPC independiente; devuelve (ok, errores)."""
+    ok, errores = 0, []
+    for n, f in enumerate(filas, start=2):  # línea 1 = encabezado
+        try:
+            op = f["operacion"].strip()
+            if op not in inv.OPERACIONES:
+                raise ValueError(f"operación desconocida '{op}'")
+            nuevo = inv.registrar_movimiento(sb, op, f["codigo"].strip(), int(f["cantidad"]), f.get("usuario") or usuario, f.get("obs") or None)
+            ok += 1
+            print(f"{n}\t{op}\t{f['codigo']}\t{f['cantidad']}\t→ stock {nuevo}")
+        except Exception as e:
+            errores.append(f"línea {n}: {e}")
+            if detener:
+                break
+    return ok, errores
+
+
+def exportar(sb, desde: date, hasta: date, salida: Path) -> Path:
+    b2 = inv.cargar_tabla(sb, inv.TBL_B2, "codigo_barras")
+    crudos, rela = inv.cargar_catalogos(sb)
+    mov = inv.cargar_movimientos(sb, datetime.combine(desde, datetime.min.time()))
+    salida.write_bytes(inv.excel_bodega2(b2, mov, inv.dimension_productos(crudos, rela), desde, hasta))
+    return salida
+
+
+def kpis(sb, ventana: int, umbral: int, horizonte: int, top: int = 10) -> dict:
+    """Los mismos KPIs del dashboard (snapshots.calcular) en un dict serializable."""
+    snap = snapshots.calcular(sb, (ventana, umbral, horizonte))
+    t_b1, t_b2, t_all, p_b1, p_b2, skus_b1, skus_b2 = snap.totales
+    avg_b2 = float(snap.rotacion["avg_diario"].sum()) if not snap.rotacion.empty else 0.0
+    return {
+        "generado_en": snap.creado_en.isoformat(),
+        "ultimo_mov_id": snap.ultimo_mov_id,
+        "ventana_dias": ventana,
+        "totales": {"bodega1": t_b1, "bodega2": t_b2, "total": t_all, "pct_b1": p_b1, "pct_b2": p_b2, "skus_b1": skus_b1, "skus_b2": skus_b2},
+        "valor": {"bodega1": snap.valor_b1, "bodega2": snap.valor_b2, "total": snap.valor_b1 + snap.valor_b2},
+        "cobertura_dias_b2": t_b2 / avg_b2 if avg_b2 else None,
+        "top_rotacion": snap.rotacion.sort_values("rotacion_30d", ascending=False).head(top).to_dict("records"),
+        "criticos": snap.criticos.to_dict("records"),
+        "duracion_s": snap.duracion_s,
+    }
+
+
+def clasificar(sb, ventana: int, bucket: str, params: clasificacion.Parametros):
+    """Clasificación ABC/XYZ del dashboard (todas las bodegas, ordenada por bodega y valor)."""
+    b1, b2 = inv.cargar_inventarios(sb)
+    crudos, rela = inv.cargar_catalogos(sb)
+    dim = inv.dimension_productos(crudos, rela, inv.cargar_precios(sb))
+    return inv.clasificar_abc_xyz(sb, b1, b2, dim, ventana, bucket, params)
+
+
+def bench(sb, repeticiones: int, clave: tuple) -> dict:
+    """Mediana de segundos: KPIs por la CLI vs. el script de la app (primera carga y rerun)."""
+    from streamlit.testing.v1 import AppTest
+
+    cli_s = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        snapshots.calcular(sb, clave)
+        cli_s.append(time.perf_counter() - t0)
+
+    at = AppTest.from_file(str(APP_PATH), default_timeout=300)
+    ui_s = []
+    for _ in range(repeticiones + 1):
+        t0 = time.perf_counter()
+        at.run()
+        ui_s.append(time.perf_counter() - t0)
+    if at.exception:
+        raise RuntimeError(f"La app falló: {at.exception[0].value}")
+    return {
+        "cli_kpis_s": statistics.median(cli_s),
+        "ui_primera_carga_s": ui_s[0],
+        "ui_rerun_s": statistics.median(ui_s[1:]),
+    }
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Operaciones y reportes de inventario sin la UI")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    p_mov = sub.add_parser("movimientos", help="Aplicar movimientos desde un CSV")
+    p_mov.add_argument("archivo", type=Path)
+    p_mov.add_argument("--usuario", default="cli")
+    p_mov.add_argument("--detener", action="store_true", help="Parar en el primer error")
+
+    p_exp = sub.add_parser("exportar", help="Excel de Bodega 2 (inventario + movimientos)")
+    p_exp.add_argument("--desde", type=date.fromisoformat, default=date.today() - timedelta(days=30))
+    p_exp.add_argument("--hasta", type=date.fromisoformat, default=date.today())
+    p_exp.add_argument("--salida", type=Path)
+
+    p_kpi = sub.add_parser("kpis", help="KPIs del dashboard en JSON")
+    p_kpi.add_argument("--ventana", type=int, default=30)
+    p_kpi.add_argument("--umbral", type=int, default=5)
+    p_kpi.add_argument("--horizonte", type=int, default=90)
+    p_kpi.add_argument("--salida", type=Path, help="Archivo JSON (default: stdout)")
+
+    p_abc = sub.add_parser("clasificar", help="Clasificación ABC/XYZ en CSV")
+    p_abc.add_argument("--ventana", type=int, default=90, help="Días de demanda")
+    p_abc.add_argument("--periodo", choices=["week","month"], default="week", help="Período para la variabilidad (XYZ)")
+    p_abc.add_argument("--corte-a", type=float, default=0.80)
+    p_abc.add_argument("--corte-b", type=float, default=0.95)
+    p_abc.add_argument("--cv-x", type=float, default=0.5)
+    p_abc.add_argument("--cv-y", type=float, default=1.0)
+    p_abc.add_argument("--salida", type=Path, help="Archivo CSV (default: stdout)")
+
+    p_bench = sub.add_parser("bench", help="Comparar la CLI con el script de la app")
+    p_bench.add_argument("--repeticiones", type=int, default=3)
+    args = ap.parse_args(argv)
+
+    sb = inv.get_client()
+
+    if args.cmd == "movimientos":
+        with open(args.archivo, newline="", encoding="utf-8") as f:
+            filas = list(csv.DictReader(f))
+        t0 = time.perf_counter()
+        ok, errores = movimientos_lote(sb, filas, args.usuario, args.detener)
+        print(f"{ok} movimientos aplicados, {len(errores)} con error en {time.perf_counter() - t0:.2f}s")
+        for e in errores:
+            print(e, file=sys.stderr)
+        return 1 if errores else 0
+
+    if args.cmd == "exportar":
+        salida = args.salida or Path(f"Bodega2_{args.desde.isoformat()}_{args.hasta.isoformat()}.xlsx")
+        print(exportar(sb, args.desde, args.hasta, salida))
+        return 0
+
+    if args.cmd == "kpis":
+        txt = json.dumps(kpis(sb, args.ventana, args.umbral, args.horizonte), ensure_ascii=False, indent=2, default=str)
+        if args.salida:
+            args.salida.write_text(txt, encoding="utf-8")
+        else:
+            print(txt)
+        return 0
+
+    if args.cmd == "clasificar":
+        t0 = time.perf_counter()
+        params = clasificacion.Parametros(args.corte_a, args.corte_b, args.cv_x, args.cv_y)
+        clasif = clasificar(sb, args.ventana, args.periodo, params)
+        clasif.to_csv(args.salida or sys.stdout, index=False)
+        resumen = clasif["clase"].value_counts().reindex(clasificacion.CLASES, fill_value=0)
+        print(" · ".join(f"{k} {v}" for k, v in resumen.items()) + f" ({time.perf_counter() - t0:.2f}s)", file=sys.stderr)
+        return 0
+
+    r = bench(sb, args.repeticiones, (30, 5, 90))
+    print(
+        f"KPIs CLI {r['cli_kpis_s']:.3f}s · app primera carga {r['ui_primera_carga_s']:.3f}s · "
+        f"app rerun {r['ui_rerun_s']:.3f}s ({r['ui_rerun_s'] / r['cli_kpis_s']:.1f}x la CLI)"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
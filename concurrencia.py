@@ -0,0 +1,197 @@
+"""
+Prueba de concurrencia de las funciones de stock contra un Postgres local.
+
+Carga el esquema base + las funciones RPC del docstring de app.py y lanza N operadores
+que venden el mismo terminado a la vez. Compara la versión anterior
+(select cantidad → if → update) con la actual (update condicional de una sentencia):
+- stock final nunca negativo
+- stock inicial − salidas registradas = stock final
+- throughput (operaciones/s)
+
+Uso:
+    INVENTARIO_TEST_DATABASE_URL=postgresql://postgres@localhost/inventario_test python concurrencia.py --hilos 16 --stock 500
+
+⚠️ Borra y recrea el esquema `public` de esa base. Por eso usa su propia variable (nunca
+DATABASE_URL, que particiones.py apunta a producción) y se niega a correr si el nombre de
+la base no termina en `_test`, salvo con --destruir-esquema.
+
+Las mismas invariantes corren en la suite:
+`INVENTARIO_TEST_DATABASE_URL=... pytest tests/test_concurrencia.py` (se omite sin esa variable).
+"""
+
+import argparse
+import ast
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+import psycopg
+
+APP_PATH = Path(__file__).with_name("app.py")
+URL_ENV = "INVENTARIO_TEST_DATABASE_URL"  # base desechable de pruebas, distinta de DATABASE_URL
+
+# Tablas base tal como las describe el docstring de app.py (en Supabase ya existen)
+ESQUEMA_BASE = """
+create table productos_crudos(
+  codigo_crudo text primary key, detalle_crudo text, cc text, ff text, tt text, mm text
+);
+create table relacion_crudo_terminado(
+  codigo_terminado text primary key, detalle text, cc text, ff text, tt text, aa text, mm text,
+  codigo_crudo text references productos_crudos(codigo_crudo)
+);
+create table bodega1_crudos(
+  codigo_barras text primary key references productos_crudos(codigo_crudo), detalle text, cantidad int not null default 0
+);
+create table bodega2_terminados(
+  codigo_barras text primary key references relacion_crudo_terminado(codigo_terminado), detalle text, cantidad int not null default 0
+);
+create table movimientos(
+  id bigint generated by default as identity primary key,
+  fecha_hora timestamptz not null default now(),
+  codigo_barras text not null,
+  movimiento text not null check (movimiento in ('Entrada','Salida','Producción','Venta','Devolución')),
+  cantidad int not null check (cantidad > 0),
+  bodega text not null check (bodega in ('Bodega1','Bodega2')),
+  usuario text,
+  observaciones text
+);
+"""
+
+# Versión anterior de sp_salida_terminado (lee, valida y luego actualiza sin bloqueo)
+SALIDA_LEGACY = """
+drop function if exists sp_salida_terminado(text,int,text,text);
+create or replace function sp_salida_terminado(
+  p_codigo_terminado text, p_cantidad int, p_usuario text, p_obs text default 'Salida de terminado'
+) returns void language plpgsql as $$
+declare v_stock int; begin
+  select cantidad into v_stock from bodega2_terminados where codigo_barras=p_codigo_terminado;
+  if coalesce(v_stock,0) < p_cantidad then raise exception 'Stock insuficiente en Bodega2'; end if;
+  update bodega2_terminados set cantidad = cantidad - p_cantidad where codigo_barras=p_codigo_terminado;
+  insert into movimientos(codigo_barras, movimiento, cantidad, bodega, usuario, observaciones)
+  values(p_codigo_terminado,'Salida',p_cantidad,'Bodega2',p_usuario,p_obs);
+end;$$;
+"""
+
+_SEPARADOR = "\n-------------------------------------------------------------------"
+
+
+def sql_funciones(ruta_app: Path = APP_PATH) -> str:
+    """Bloque 'SQL — FUNCIONES RPC' del docstring de app.py."""
+    doc = ast.get_docstring(ast.parse(ruta_app.read_text(encoding="utf-8")), clean=False)
+    ini = doc.index("SQL — FUNCIONES RPC")
+    cuerpo = doc[ini:].split("\n", 2)[2]
+    return cuerpo[: cuerpo.index(_SEPARADOR)]
+
+
+def preparar_bd(conn: psycopg.Connection, destruir_esquema: bool = False) -> None:
+    """Recrea `public` con el esquema base + funciones del docstring.
+
+    Solo en una base cuyo nombre termina en `_test`, salvo `destruir_esquema=True`.
+    """
+    base = conn.execute("select current_database()").fetchone()[0]
+    if not base.endswith("_test") and not destruir_esquema:
+        raise RuntimeError(
+            f"La base {base!r} no parece de pruebas (no termina en _test): no se borra su esquema. "
+            "Usa una base *_test o pasa --destruir-esquema si de verdad es desechable."
+        )
+    conn.execute("drop schema if exists public cascade")
+    conn.execute("create schema public")
+    conn.execute(ESQUEMA_BASE)
+    conn.execute(sql_funciones())
+    conn.commit()
+
+
+def sembrar(conn: psycopg.Connection, n_crudos: int = 20, n_terminados: int = 50, stock: int = 1000) -> None:
+    """Catálogo sintético: cada terminado usa 1–3 crudos; stock inicial en ambas bodegas."""
+    crudos = [(f"C{i:04d}", f"Crudo {i}") for i in range(n_crudos)]
+    terms = [(f"T{i:04d}", f"Terminado {i}", f"C{i % n_crudos:04d}") for i in range(n_terminados)]
+    with conn.cursor() as cur:
+        cur.executemany("insert into productos_crudos(codigo_crudo, detalle_crudo) values(%s,%s)", crudos)
+        cur.executemany("insert into relacion_crudo_terminado(codigo_terminado, detalle, codigo_crudo) values(%s,%s,%s)", terms)
+        cur.execute("insert into bom_terminados(codigo_terminado, codigo_crudo, cantidad) select codigo_terminado, codigo_crudo, 1 from relacion_crudo_terminado")
+        cur.executemany(
+            "insert into bom_terminados(codigo_terminado, codigo_crudo, cantidad) values(%s,%s,%s) on conflict do nothing",
+            [(t, f"C{(i * 7 + k) % n_crudos:04d}", k) for i, (t, _, _) in enumerate(terms) for k in range(1, i % 3 + 1)],
+        )
+        cur.executemany("insert into bodega1_crudos(codigo_barras, detalle, cantidad) values(%s,%s,%s)", [(c, d, stock) for c, d in crudos])
+        cur.executemany("insert into bodega2_terminados(codigo_barras, detalle, cantidad) values(%s,%s,%s)", [(t, d, stock) for t, d, _ in terms])
+    conn.commit()
+
+
+def _vender(url: str, codigo: str, intentos: int, barrera: threading.Barrier, ok: list, errores: list) -> None:
+    n_ok = n_err = 0
+    with psycopg.connect(url, autocommit=True) as conn:
+        barrera.wait()
+        for _ in range(intentos):
+            try:
+                conn.execute("select * from sp_salida_terminado(%s, 1, 'concurrencia')", (codigo,))
+                n_ok += 1
+            except psycopg.errors.RaiseException:
+                n_err += 1
+    ok.append(n_ok)
+    errores.append(n_err)
+
+
+def correr(url: str, version: str, hilos: int, stock: int, intentos: int, destruir_esquema: bool = False) -> dict:
+    codigo = "T0000"
+    with psycopg.connect(url) as conn:
+        preparar_bd(conn, destruir_esquema)
+        if version == "anterior":
+            conn.execute(SALIDA_LEGACY)
+        sembrar(conn, n_crudos=1, n_terminados=1, stock=stock)
+
+    ok, errores = [], []
+    barrera = threading.Barrier(hilos + 1)
+    ths = [threading.Thread(target=_vender, args=(url, codigo, intentos, barrera, ok, errores)) for _ in range(hilos)]
+    for t in ths:
+        t.start()
+    barrera.wait()
+    t0 = time.perf_counter()
+    for t in ths:
+        t.join()
+    dur = time.perf_counter() - t0
+
+    with psycopg.connect(url) as conn:
+        final = conn.execute("select cantidad from bodega2_terminados where codigo_barras=%s", (codigo,)).fetchone()[0]
+        salidas = conn.execute("select coalesce(sum(cantidad),0) from movimientos where codigo_barras=%s and movimiento='Salida'", (codigo,)).fetchone()[0]
+    return {
+        "version": version,
+        "ops": hilos * intentos,
+        "ok": sum(ok),
+        "rechazadas": sum(errores),
+        "stock_final": final,
+        "consistente": final >= 0 and stock - salidas == final and salidas == sum(ok),
+        "ops_s": hilos * intentos / dur if dur else 0.0,
+    }
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Prueba de concurrencia de sp_salida_terminado")
+    ap.add_argument("--url", default=os.getenv(URL_ENV), help=f"Postgres de pruebas (default: {URL_ENV})")
+    ap.add_argument("--destruir-esquema", action="store_true", help="Permitir recrear `public` en una base que no termina en _test")
+    ap.add_argument("--hilos", type=int, default=16)
+    ap.add_argument("--stock", type=int, default=500, help="Stock inicial del terminado")
+    ap.add_argument("--por-hilo", type=int, default=50, help="Salidas de 1 und por operador")
+    args = ap.parse_args(argv)
+    if not args.url:
+        ap.error(f"Falta --url o {URL_ENV}")
+
+    try:
+        resultados = [correr(args.url, v, args.hilos, args.stock, args.por_hilo, args.destruir_esquema) for v in ("anterior", "actual")]
+    except RuntimeError as e:
+        ap.error(str(e))
+    for r in resultados:
+        print(
+            f"{r['version']:<9} ops={r['ops']} ok={r['ok']} rechazadas={r['rechazadas']} "
+            f"stock_final={r['stock_final']} consistente={'sí' if r['consistente'] else 'NO'} {r['ops_s']:.0f} ops/s"
+        )
+    anterior, actual = resultados
+    if anterior["ops_s"]:
+        print(f"throughput actual/anterior: {actual['ops_s'] / anterior['ops_s']:.2f}x")
+    return 0 if actual["consistente"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
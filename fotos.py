@@ -0,0 +1,268 @@
+"""
+Fotos de productos: subida, miniaturas WebP en segundo plano y caché local LRU.
+
+- Almacenamiento: bucket "productos" de Supabase Storage o, si FOTOS_LOCAL_DIR está
+  definido, una carpeta local con la misma interfaz (para desarrollo / sin Storage).
+- Al subir: se guarda el original, se registra en `fotos_productos` y la miniatura
+  (WebP, lado mayor MINI_LADO px) se genera en un pool de hilos sin frenar la app.
+- Lectura: las miniaturas se sirven desde una caché en disco con desalojo LRU por tamaño;
+  si faltan en la caché se bajan del almacenamiento una sola vez.
+- Fallas (imagen corrupta, formato no soportado, Storage caído): se registran con su error
+  y no se reintentan hasta pasado un backoff exponencial (REINTENTO_BASE_S … REINTENTO_MAX_S).
+
+- `fotos_productos.url` guarda la ruta dentro del bucket; las filas anteriores guardaban la URL
+  pública completa y se convierten a ruta con `ruta_en_bucket` antes de bajar o derivar nada.
+
+SQL — (ejecutar una vez) columna para la ruta de la miniatura
+-------------------------------------------------------------------
+alter table public.fotos_productos add column if not exists miniatura text;
+create index if not exists idx_fotos_tipo_id on public.fotos_productos(tipo, id desc);
+-------------------------------------------------------------------
+"""
+
+import io
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import unquote, urlsplit
+
+from PIL import Image, ImageOps
+
+TBL_FOTOS = "fotos_productos"
+BUCKET = "productos"
+
+FOTOS_LOCAL_DIR = os.getenv("FOTOS_LOCAL_DIR")
+CACHE_DIR = Path(os.getenv("FOTOS_CACHE_DIR", ".cache_miniaturas"))
+CACHE_MAX_MB = float(os.getenv("FOTOS_CACHE_MAX_MB", "200"))
+MINI_LADO = 256
+MINI_CALIDAD = 80
+REINTENTO_BASE_S = 60
+REINTENTO_MAX_S = 3600
+
+log = logging.getLogger(__name__)
+
+_RE_URL_STORAGE = re.compile(r"/storage/v1/object/(?:public|sign|authenticated)/([^/]+)/(.+)$")
+
+
+def ruta_en_bucket(url: str, bucket: str = BUCKET) -> str:
+    """Ruta dentro del bucket: tal cual si ya lo es, o extraída de una URL pública de Storage."""
+    if not url.startswith(("http://", "https://")):
+        return url
+    m = _RE_URL_STORAGE.search(urlsplit(url).path)
+    if not m or m.group(1) != bucket:
+        raise ValueError(f"URL fuera del bucket {bucket!r}: {url}")
+    return unquote(m.group(2))
+
+
+# ==========================
+# Almacenamiento (Supabase Storage o carpeta local)
+# ==========================
+
+class AlmacenSupabase:
+    def __init__(self, sb, bucket: str = BUCKET):
+        self.sb = sb
+        self.bucket = bucket
+
+    def subir(self, ruta: str, data: bytes, content_type: str) -> None:
+        self.sb.storage.from_(self.bucket).upload(ruta, data, {"content-type": content_type, "upsert": "true"})
+
+    def descargar(self, ruta: str) -> bytes:
+        return self.sb.storage.from_(self.bucket).download(ruta_en_bucket(ruta, self.bucket))
+
+    def url_publica(self, ruta: str) -> str:
+        return self.sb.storage.from_(self.bucket).get_public_url(ruta)
+
+
+class AlmacenLocal:
+    """Sustituto del bucket en disco: mismas rutas, mismos métodos."""
+
+    def __init__(self, base: str | Path, bucket: str = BUCKET):
+        self.base = Path(base) / bucket
+
+    def _path(self, ruta: str) -> Path:
+        p = (self.base / ruta).resolve()
+        if self.base.resolve() not in p.parents:
+            raise ValueError(f"Ruta fuera del bucket: {ruta}")
+        return p
+
+    def subir(self, ruta: str, data: bytes, content_type: str) -> None:
+        p = self._path(ruta)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        tmp = p.with_suffix(p.suffix + ".tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, p)
+
+    def descargar(self, ruta: str) -> bytes:
+        return self._path(ruta).read_bytes()
+
+    def url_publica(self, ruta: str) -> str:
+        return self._path(ruta).as_uri()
+
+
+def get_almacen(sb):
+    return AlmacenLocal(FOTOS_LOCAL_DIR) if FOTOS_LOCAL_DIR else AlmacenSupabase(sb)
+
+
+# ==========================
+# Caché local de miniaturas (LRU por bytes)
+# ==========================
+
+class CacheMiniaturas:
+    def __init__(self, directorio: str | Path = CACHE_DIR, max_mb: float = CACHE_MAX_MB):
+        self.dir = Path(directorio)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        # clave → tamaño, en orden de uso (el más viejo primero)
+        self._lru: OrderedDict[str, int] = OrderedDict()
+        self._total = 0
+        for p in sorted(self.dir.glob("*.webp"), key=lambda x: x.stat().st_mtime):
+            self._lru[p.stem] = p.stat().st_size
+            self._total += self._lru[p.stem]
+
+    @staticmethod
+    def clave(ruta: str) -> str:
+        return ruta.replace("/", "__").rsplit(".", 1)[0]
+
+    def get(self, ruta: str) -> bytes | None:
+        k = self.clave(ruta)
+        with self._lock:
+            if k not in self._lru:
+                return None
+            self._lru.move_to_end(k)
+        try:
+            return (self.dir / f"{k}.webp").read_bytes()
+        except FileNotFoundError:
+            with self._lock:
+                self._total -= self._lru.pop(k, 0)
+            return None
+
+    def put(self, ruta: str, data: bytes) -> None:
+        k = self.clave(ruta)
+        p = self.dir / f"{k}.webp"
+        tmp = p.with_suffix(f".tmp{threading.get_ident()}")
+        tmp.write_bytes(data)
+        os.replace(tmp, p)
+        with self._lock:
+            self._total += len(data) - self._lru.pop(k, 0)
+            self._lru[k] = len(data)
+            while self._total > self.max_bytes and len(self._lru) > 1:
+                viejo, tam = self._lru.popitem(last=False)
+                self._total -= tam
+                (self.dir / f"{viejo}.webp").unlink(missing_ok=True)
+
+
+# ==========================
+# Miniaturas
+# ==========================
+
+def generar_miniatura(data: bytes, lado: int = MINI_LADO, calidad: int = MINI_CALIDAD) -> bytes:
+    with Image.open(io.BytesIO(data)) as im:
+        im.draft("RGB", (lado * 2, lado * 2))  # JPEG: decodifica ya reducido
+        im = ImageOps.exif_transpose(im)
+        im = im.convert("RGBA" if im.mode in ("RGBA", "LA", "P") else "RGB")
+        im.thumbnail((lado, lado), Image.Resampling.LANCZOS)
+        out = io.BytesIO()
+        im.save(out, format="WEBP", quality=calidad, method=4)
+        return out.getvalue()
+
+
+def ruta_miniatura(ruta_original: str) -> str:
+    ruta = ruta_en_bucket(ruta_original).removeprefix("originales/")
+    return "miniaturas/" + ruta.rsplit(".", 1)[0] + ".webp"
+
+
+class PipelineFotos:
+    """Sube originales y genera miniaturas en un pool de hilos."""
+
+    def __init__(self, sb, almacen=None, cache: CacheMiniaturas | None = None, hilos: int = 2):
+        self.sb = sb
+        self.almacen = almacen or get_almacen(sb)
+        self.cache = cache or CacheMiniaturas()
+        self.pool = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="miniaturas")
+        self._en_curso: set[str] = set()
+        self._fallas: dict[str, tuple[int, float, str]] = {}  # ruta → (intentos, próximo intento, error)
+        self._lock = threading.Lock()
+
+    def subir(self, codigo: str, tipo: str, data: bytes, nombre: str, content_type: str = "image/jpeg") -> dict:
+        ext = (nombre.rsplit(".", 1)[-1] if "." in nombre else "jpg").lower()
+        ruta = f"originales/{tipo}/{codigo}/{uuid.uuid4().hex}.{ext}"
+        self.almacen.subir(ruta, data, content_type)
+        fila = self.sb.table(TBL_FOTOS).insert({"codigo": codigo, "tipo": tipo, "url": ruta}).execute().data[0]
+        self.encolar(fila["id"], ruta, data)
+        return fila
+
+    def encolar(self, foto_id: int, ruta: str, data: bytes | None = None):
+        with self._lock:
+            if ruta in self._en_curso:
+                return None
+            falla = self._fallas.get(ruta)
+            if falla and time.monotonic() < falla[1] and data is None:
+                return None  # en backoff: no volver a bajar una imagen que acaba de fallar
+            self._en_curso.add(ruta)
+        return self.pool.submit(self._procesar, foto_id, ruta, data)
+
+    def error(self, foto: dict) -> str | None:
+        """Último error de la miniatura de esta foto (None si no falló)."""
+        try:
+            falla = self._fallas.get(ruta_en_bucket(foto["url"]))
+        except ValueError as e:
+            return str(e)
+        return falla[2] if falla else None
+
+    def _procesar(self, foto_id: int, ruta: str, data: bytes | None) -> str | None:
+        try:
+            mini = generar_miniatura(data if data is not None else self.almacen.descargar(ruta))
+            ruta_mini = ruta_miniatura(ruta)
+            self.almacen.subir(ruta_mini, mini, "image/webp")
+            self.cache.put(ruta_mini, mini)
+            self.sb.table(TBL_FOTOS).update({"miniatura": ruta_mini}).eq("id", foto_id).execute()
+            with self._lock:
+                self._fallas.pop(ruta, None)
+            return ruta_mini
+        except Exception as e:
+            with self._lock:
+                intentos = self._fallas.get(ruta, (0, 0.0, ""))[0] + 1
+                espera = min(REINTENTO_BASE_S * 2 ** (intentos - 1), REINTENTO_MAX_S)
+                self._fallas[ruta] = (intentos, time.monotonic() + espera, f"{type(e).__name__}: {e}")
+            log.warning("Miniatura de foto %s (%s) falló (intento %d, reintento en %ds): %s", foto_id, ruta, intentos, espera, e)
+            return None
+        finally:
+            with self._lock:
+                self._en_curso.discard(ruta)
+
+    def miniatura(self, foto: dict) -> bytes | None:
+        """Bytes WebP de la miniatura (caché → almacenamiento); None si aún se está generando."""
+        try:
+            ruta = ruta_en_bucket(foto["url"])
+        except ValueError:
+            return None  # imagen externa al bucket: error() lo explica
+        ruta_mini = foto.get("miniatura")
+        if not ruta_mini:
+            self.encolar(foto["id"], ruta)
+            return None
+        data = self.cache.get(ruta_mini)
+        if data is None:
+            try:
+                data = self.almacen.descargar(ruta_mini)
+            except Exception:
+                self.encolar(foto["id"], ruta)
+                return None
+            self.cache.put(ruta_mini, data)
+        return data
+
+
+def pagina_fotos(sb, tipo: str, pagina: int, por_pagina: int = 12, codigo: str | None = None) -> tuple[list[dict], int]:
+    """Una página de fotos (más recientes primero) y el total, sin traer el resto de la tabla."""
+    q = sb.table(TBL_FOTOS).select("*", count="exact").eq("tipo", tipo)
+    if codigo:
+        q = q.eq("codigo", codigo)
+    ini = pagina * por_pagina
+    res = q.order("id", desc=True).range(ini, ini + por_pagina - 1).execute()
+    return res.data or [], res.count or 0
@@ -0,0 +1,81 @@
+"""
+Series de tiempo largas: reducción a un presupuesto fijo de puntos (LTTB) y render WebGL.
+
+La agregación por día/hora la hace el servidor (RPC sp_evolucion); aquí solo se acumula,
+se reduce con Largest-Triangle-Three-Buckets y se dibuja con Scattergl.
+"""
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+PRESUPUESTO_PUNTOS = 600
+COLORES = {"Bodega1": "#2563eb", "Bodega2": "#059669"}
+
+
+def bucket_para(desde, hasta) -> str:
+    """Resolución de agregación según el largo del rango visible."""
+    dias = (pd.Timestamp(hasta) - pd.Timestamp(desde)).days
+    return "hour" if dias <= 14 else "day"
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n: int) -> np.ndarray:
+    """Índices de los n puntos que conserva LTTB (siempre incluye primero y último)."""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    m = len(x)
+    if n >= m or n < 3:
+        return np.arange(m)
+
+    bordes = np.linspace(1, m - 1, n - 1).astype(np.int64)
+    idx = np.empty(n, dtype=np.int64)
+    idx[0], idx[-1] = 0, m - 1
+    a = 0
+    for i in range(n - 2):
+        lo, hi = bordes[i], bordes[i + 1]
+        sig_lo = bordes[i + 1]
+        sig_hi = bordes[i + 2] if i + 2 < len(bordes) else m
+        prom_x = x[sig_lo:sig_hi].mean()
+        prom_y = y[sig_lo:sig_hi].mean()
+        area = np.abs((x[a] - prom_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (prom_y - y[a]))
+        a = lo + int(np.argmax(area))
+        idx[i + 1] = a
+    return idx
+
+
+def acumular(neto: pd.DataFrame, base: dict | None = None) -> pd.DataFrame:
+    """Neto por bucket (fecha, Bodega1, Bodega2) → unidades acumuladas desde `base`."""
+    out = neto.sort_values("fecha").reset_index(drop=True)
+    for bod in ("Bodega1", "Bodega2"):
+        if bod not in out.columns:
+            out[bod] = 0
+        out[bod] = out[bod].cumsum() + (base or {}).get(bod, 0)
+    return out[["fecha", "Bodega1", "Bodega2"]]
+
+
+def reducir(evo: pd.DataFrame, presupuesto: int = PRESUPUESTO_PUNTOS) -> dict[str, pd.DataFrame]:
+    """Por bodega, la serie reducida con LTTB a `presupuesto` puntos."""
+    x = pd.to_datetime(evo["fecha"]).to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    out = {}
+    for bod in ("Bodega1", "Bodega2"):
+        if bod not in evo.columns:
+            continue
+        keep = lttb(x, evo[bod].to_numpy(), presupuesto)
+        out[bod] = evo.iloc[keep][["fecha", bod]]
+    return out
+
+
+def figura_evolucion(evo: pd.DataFrame, bodegas=("Bodega1", "Bodega2"), presupuesto: int = PRESUPUESTO_PUNTOS) -> go.Figure:
+    fig = go.Figure()
+    for bod, serie in reducir(evo, presupuesto).items():
+        if bod not in bodegas:
+            continue
+        fig.add_trace(go.Scattergl(
+            x=serie["fecha"], y=serie[bod], mode="lines", name=bod,
+            line=dict(color=COLORES.get(bod), width=2),
+        ))
+    fig.update_layout(
+        xaxis_title="Fecha", yaxis_title="Unidades Acum", legend_title="Bodega",
+        margin=dict(l=10, r=10, t=10, b=10), hovermode="x unified",
+    )
+    return fig
@@ -0,0 +1,644 @@
+"""
+Núcleo del inventario SIN Streamlit: lectura de tablas vía Supabase, operaciones (RPC),
+KPIs y exportación a Excel.
+
+Lo usan la app (envuelto en st.cache_data), los procesos de fondo (snapshots de KPIs,
+alertas) y la CLI (cli.py), que no pueden importar app.py.
+"""
+
+import json
+import os
+from datetime import date, datetime
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+import alertas
+import clasificacion
+import mrp
+import particiones
+import valorizacion
+
+# ==========================
+# Tablas
+# ==========================
+TBL_B1 = "bodega1_crudos"
+TBL_B2 = "bodega2_terminados"
+TBL_MOV = "movimientos"
+TBL_CRUDOS = "productos_crudos"
+TBL_RELA = "relacion_crudo_terminado"
+TBL_PRECIOS = "precios_productos"  # opcional
+TBL_PRECIOS_HIST = "precios_historial"  # precio por código con fecha de vigencia
+TBL_PRECIOS_VIG = "precios_vigentes"  # vista: último tramo del historial ya vigente
+TBL_BOM = "bom_terminados"  # BOM multi-componente
+TBL_UMBRALES = "umbrales_stock"  # umbral crítico por SKU/bodega
+
+_PAGINA = 1000  # PostgREST corta en 1000 filas por respuesta
+
+
+def get_client():
+    """Cliente Supabase desde SUPABASE_URL / SUPABASE_KEY (.env incluido)."""
+    from dotenv import load_dotenv
+    from supabase import create_client
+
+    load_dotenv()
+    url, key = os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY")
+    if not url or not key:
+        raise RuntimeError("Faltan variables de entorno SUPABASE_URL o SUPABASE_KEY")
+    return create_client(url, key)
+
+
+# ==========================
+# Lectura
+# ==========================
+
+def table_exists(sb, table_name: str) -> bool:
+    try:
+        sb.table(table_name).select("count(*)").limit(1).execute()
+        return True
+    except Exception:
+        return False
+
+
+def cargar_tabla(sb, table: str, order_by: str | None = None) -> pd.DataFrame:
+    q = sb.table(table).select("*")
+    if order_by:
+        q = q.order(order_by)
+    res = q.execute()
+    return pd.DataFrame(res.data) if res.data else pd.DataFrame()
+
+
+def cargar_movimientos(sb, fecha_desde: datetime | None = None) -> pd.DataFrame:
+    # Con fecha_desde la consulta solo toca las particiones mensuales recientes;
+    # si el rango cae antes del horizonte se completa con el archivo Parquet local.
+    q = sb.table(TBL_MOV).select("*")
+    if fecha_desde is not None:
+        q = q.gte("fecha_hora", fecha_desde.isoformat())
+    res = q.execute()
+    df = pd.DataFrame(res.data) if res.data else pd.DataFrame()
+    if not df.empty:
+        df["fecha_hora"] = pd.to_datetime(df["fecha_hora"], utc=True)
+    if particiones.requiere_archivo(fecha_desde):
+        arch = particiones.leer_archivo(desde=fecha_desde)
+        if not arch.empty:
+            df = pd.concat([arch, df], ignore_index=True) if not df.empty else arch
+            df = df.drop_duplicates(subset="id", keep="last").sort_values("fecha_hora", ignore_index=True)
+    return df
+
+
+def cargar_inventarios(sb):
+    return cargar_tabla(sb, TBL_B1, "codigo_barras"), cargar_tabla(sb, TBL_B2, "codigo_barras")
+
+
+def cargar_catalogos(sb):
+    return cargar_tabla(sb, TBL_CRUDOS, "codigo_crudo"), cargar_tabla(sb, TBL_RELA, "codigo_terminado")
+
+
+def cargar_precios(sb) -> pd.DataFrame:
+    """Precio actual por código: el vigente hoy según el historial, o precios_productos sin la vista."""
+    for tabla in (TBL_PRECIOS_VIG, TBL_PRECIOS):
+        if table_exists(sb, tabla):
+            return cargar_tabla(sb, tabla)
+    return pd.DataFrame(columns=["codigo","precio","moneda","updated_at"])
+
+
+def cargar_bom(sb, rela: pd.DataFrame | None = None) -> pd.DataFrame:
+    # Sin tabla BOM se usa la relación 1:1 de relacion_crudo_terminado
+    if table_exists(sb, TBL_BOM):
+        return cargar_tabla(sb, TBL_BOM, "codigo_terminado")
+    if rela is None:
+        rela = cargar_tabla(sb, TBL_RELA, "codigo_terminado")
+    return mrp.bom_desde_relacion(rela)
+
+
+def _rpc_paginado(sb, nombre: str, params: dict) -> list[dict]:
+    filas = []
+    while True:
+        res = sb.rpc(nombre, params).range(len(filas), len(filas) + _PAGINA - 1).execute()
+        filas += res.data or []
+        if len(res.data or []) < _PAGINA:
+            return filas
+
+
+def _agregar_neto(mov: pd.DataFrame, bucket: str, por_sku: bool) -> pd.DataFrame:
+    """Misma agregación que las RPC de neto (date_trunc por hora o día) sobre movimientos ya filtrados."""
+    cols = ["fecha","bodega","codigo_barras","neto"] if por_sku else ["fecha","bodega","neto"]
+    if mov.empty:
+        return pd.DataFrame(columns=cols)
+    signo = mov["movimiento"].map({"Entrada":1,"Devolución":1,"Producción":1,"Salida":-1,"Venta":-1}).fillna(0)
+    return pd.DataFrame({
+        "fecha": mov["fecha_hora"].dt.floor("h" if bucket == "hour" else "D"),
+        "bodega": mov["bodega"],
+        "codigo_barras": mov["codigo_barras"],
+        "neto": mov["cantidad"] * signo,
+    }).groupby(cols[:-1], as_index=False)["neto"].sum()
+
+
+def _neto_local(sb, desde: date, hasta: date, codigo: str | None, bucket: str, por_sku: bool) -> pd.DataFrame:
+    """Neto sobre los movimientos del rango (fallback sin RPC; incluye el archivo Parquet)."""
+    mov = cargar_movimientos(sb, datetime.combine(desde, datetime.min.time()))
+    if not mov.empty:
+        mov = mov[mov["fecha_hora"] < pd.Timestamp(hasta, tz="UTC")]
+        if codigo:
+            mov = mov[mov["codigo_barras"] == codigo]
+    return _agregar_neto(mov, bucket, por_sku)
+
+
+def _corte_archivo(desde: date) -> date | None:
+    """Fin del último mes archivado en Parquet si el rango que empieza en `desde` lo necesita."""
+    if not particiones.requiere_archivo(desde):
+        return None
+    return (pd.Timestamp(particiones.meses_archivados()[-1]) + pd.offsets.MonthBegin(1)).date()
+
+
+def _neto_con_archivo(sb, nombre: str, desde: date, hasta: date, codigo: str | None, bucket: str, por_sku: bool) -> pd.DataFrame:
+    """Neto por bucket: la RPC para lo que sigue en la base y el archivo Parquet para lo anterior.
+
+    Las particiones archivadas ya no están en la base, así que sin esta parte todo lo previo al
+    horizonte saldría en cero. Sin la RPC se agrega localmente (cargar_movimientos ya lee el archivo).
+    """
+    cols = ["fecha","bodega","codigo_barras","neto"] if por_sku else ["fecha","bodega","neto"]
+    corte = _corte_archivo(desde)
+    desde_bd = max(desde, corte) if corte else desde
+    params = {"p_desde": desde_bd.isoformat(), "p_hasta": hasta.isoformat(), "p_bucket": bucket}
+    if not por_sku:
+        params["p_codigo"] = codigo
+    try:
+        neto = pd.DataFrame(_rpc_paginado(sb, nombre, params) if desde_bd < hasta else [], columns=cols)
+    except Exception:
+        neto, corte = _neto_local(sb, desde, hasta, codigo, bucket, por_sku), None
+    neto["fecha"] = pd.to_datetime(neto["fecha"], utc=True)
+    if corte:
+        fin = pd.Timestamp(min(corte, hasta), tz="UTC")
+        arch = particiones.leer_archivo(desde=datetime.combine(desde, datetime.min.time()), hasta=fin)
+        arch = arch[arch["fecha_hora"] < fin]
+        if codigo:
+            arch = arch[arch["codigo_barras"] == codigo]
+        if not arch.empty:
+            neto = (pd.concat([_agregar_neto(arch, bucket, por_sku), neto], ignore_index=True)
+                    .groupby(cols[:-1], as_index=False)["neto"].sum())
+    return neto.astype({"neto": "int64"})
+
+
+def cargar_evolucion(sb, desde: date, hasta: date, codigo: str | None = None, bucket: str = "day") -> pd.DataFrame:
+    """Neto por bucket y bodega (fecha, Bodega1, Bodega2) calculado en el servidor (y en el archivo)."""
+    neto = _neto_con_archivo(sb, "sp_evolucion", desde, hasta, codigo, bucket, por_sku=False)
+    if neto.empty:
+        return pd.DataFrame(columns=["fecha","Bodega1","Bodega2"])
+    wide = neto.pivot_table(index="fecha", columns="bodega", values="neto", aggfunc="sum", fill_value=0).reset_index()
+    wide.columns.name = None
+    return wide
+
+
+def cargar_neto_sku(sb, desde: date, hasta: date, bucket: str = "day") -> pd.DataFrame:
+    """Neto por bucket, bodega y SKU (fecha, bodega, codigo_barras, neto) para valorizar en el tiempo.
+
+    Incluye el archivo Parquet: sin él, todo corte anterior al horizonte quedaría con el stock
+    del inicio del horizonte.
+    """
+    return _neto_con_archivo(sb, "sp_neto_sku", desde, hasta, None, bucket, por_sku=True)
+
+
+def cargar_demanda_sku(sb, desde: date, hasta: date, bucket: str = "week") -> pd.DataFrame:
+    """Unidades de salida (Salida + Venta) por bucket, bodega y SKU (fecha, bodega, codigo_barras, unidades)."""
+    cols = ["fecha","bodega","codigo_barras","unidades"]
+    params = {"p_desde": desde.isoformat(), "p_hasta": hasta.isoformat(), "p_bucket": bucket}
+    try:
+        dem = pd.DataFrame(_rpc_paginado(sb, "sp_demanda_sku", params), columns=cols)
+    except Exception:
+        # Sin la RPC: misma agregación sobre los movimientos del rango
+        mov = cargar_movimientos(sb, datetime.combine(desde, datetime.min.time()))
+        if mov.empty:
+            return pd.DataFrame(columns=cols)
+        mov = mov[(mov["fecha_hora"] < pd.Timestamp(hasta, tz="UTC")) & mov["movimiento"].isin(["Salida","Venta"])]
+        periodo = mov["fecha_hora"].dt.tz_localize(None).dt.to_period({"week": "W", "month": "M"}.get(bucket, "D"))
+        dem = (mov.assign(fecha=periodo.dt.start_time, unidades=mov["cantidad"])
+               .groupby(cols[:-1], as_index=False)["unidades"].sum())
+    dem["fecha"] = pd.to_datetime(dem["fecha"], utc=True)
+    return dem
+
+
+def version_precios(sb) -> str:
+    """Identificador barato del estado de precios: cambia con cada tramo nuevo del historial
+    y cuando un tramo programado entra en vigor (último vigente_desde <= now())."""
+    try:
+        res = sb.table(TBL_PRECIOS_HIST).select("id").order("id", desc=True).limit(1).execute()
+        version = f"h{res.data[0]['id']}" if res.data else "h0"
+        try:
+            vig = sb.table(TBL_PRECIOS_VIG).select("updated_at").order("updated_at", desc=True).limit(1).execute()
+            return f"{version}.{vig.data[0]['updated_at']}" if vig.data else version
+        except Exception:
+            return version
+    except Exception:
+        try:
+            res = sb.table(TBL_PRECIOS).select("updated_at").order("updated_at", desc=True).limit(1).execute()
+            return f"p{res.data[0]['updated_at']}" if res.data else "p0"
+        except Exception:
+            return "sin_precios"
+
+
+def cargar_historial_precios(sb, precios: pd.DataFrame | None = None) -> pd.DataFrame:
+    """Historial (codigo, precio, vigente_desde) ordenado; sin la tabla, cada precio actual es un tramo."""
+    try:
+        filas = []
+        while True:
+            res = (sb.table(TBL_PRECIOS_HIST).select("codigo,precio,vigente_desde").order("id")
+                   .range(len(filas), len(filas) + _PAGINA - 1).execute())
+            filas += res.data or []
+            if len(res.data or []) < _PAGINA:
+                break
+        return valorizacion.normalizar_historial(pd.DataFrame(filas, columns=valorizacion.HIST_COLS))
+    except Exception:
+        return valorizacion.historial_desde_precios(cargar_precios(sb) if precios is None else precios)
+
+
+def cargar_criticos(sb, umbral_default: int, b1: pd.DataFrame | None = None, b2: pd.DataFrame | None = None) -> pd.DataFrame:
+    """Críticos calculados en el servidor (umbral por SKU o el umbral por defecto)."""
+    cols = ["bodega","codigo_barras","detalle","cantidad","umbral"]
+    try:
+        return pd.DataFrame(alertas.stock_critico(sb, umbral_default), columns=cols)
+    except Exception:
+        # Sin la RPC sp_stock_critico: filtro local con el umbral global
+        if b1 is None or b2 is None:
+            b1, b2 = cargar_inventarios(sb)
+        parts = [
+            df[df["cantidad"] <= umbral_default].assign(bodega=bod, umbral=umbral_default)[cols]
+            for bod, df in (("Bodega1", b1), ("Bodega2", b2)) if not df.empty
+        ]
+        return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=cols)
+
+
+# ==========================
+# Historial de movimientos (filtros y paginación en el servidor)
+# ==========================
+MOV_FILTROS = {"codigo": "codigo_barras", "bodega": "bodega", "movimiento": "movimiento", "usuario": "usuario"}
+RESUMEN_COLS = ["bodega","movimiento","movimientos","unidades","primera","ultima"]
+
+
+def _params_mov(desde: datetime, hasta: datetime, filtros: dict) -> dict:
+    params = {"p_desde": desde.isoformat(), "p_hasta": hasta.isoformat()}
+    params.update({f"p_{k}": filtros.get(k) or None for k in MOV_FILTROS})
+    return params
+
+
+def _movimientos_archivados(desde: datetime, hasta: datetime, filtros: dict) -> pd.DataFrame:
+    """Movimientos del archivo Parquet en [desde, hasta) con los filtros del explorador, más recientes primero."""
+    arch = particiones.leer_archivo(desde, hasta)
+    arch = arch[arch["fecha_hora"] < pd.Timestamp(hasta)]
+    for k, col in MOV_FILTROS.items():
+        if filtros.get(k):
+            arch = arch[arch[col] == filtros[k]]
+    return arch.sort_values(["fecha_hora","id"], ascending=False, kind="stable", ignore_index=True)
+
+
+def _pagina_bd(sb, desde: datetime, hasta: datetime, filtros: dict, cursor: tuple | None, n: int) -> list[dict]:
+    try:
+        params = _params_mov(desde, hasta, filtros) | {"p_limite": n}
+        if cursor:
+            params |= {"p_cursor_fecha": cursor[0], "p_cursor_id": cursor[1]}
+        return sb.rpc("sp_movimientos_pagina", params).execute().data or []
+    except Exception:
+        # Sin la RPC: mismo filtro y cursor por PostgREST (usa los mismos índices)
+        q = sb.table(TBL_MOV).select("*").gte("fecha_hora", desde.isoformat()).lt("fecha_hora", hasta.isoformat())
+        for k, col in MOV_FILTROS.items():
+            if filtros.get(k):
+                q = q.eq(col, filtros[k])
+        if cursor:
+            q = q.or_(f'fecha_hora.lt."{cursor[0]}",and(fecha_hora.eq."{cursor[0]}",id.lt.{cursor[1]})')
+        return q.order("fecha_hora", desc=True).order("id", desc=True).limit(n).execute().data or []
+
+
+def pagina_movimientos(sb, desde: datetime, hasta: datetime, filtros: dict | None = None,
+                       cursor: tuple | None = None, limite: int = 50) -> tuple[pd.DataFrame, tuple | None]:
+    """Una página (más recientes primero) y el cursor (fecha_hora, id) de la siguiente; None si no hay más.
+
+    Keyset: cada página pide las filas estrictamente anteriores al cursor, así el costo
+    no crece con el número de página. Se pide una fila de más para saber si hay siguiente.
+    Lo anterior al último mes archivado sale del Parquet: esas filas son todas más viejas que
+    las de la base, así que siguen a la última página de la base con el mismo cursor.
+    """
+    filtros = filtros or {}
+    corte = _corte_archivo(desde)
+    corte = pd.Timestamp(corte, tz="UTC") if corte else None
+    en_archivo = corte is not None and cursor is not None and pd.Timestamp(cursor[0]) < corte
+    filas = []
+    desde_bd = max(desde, corte) if corte is not None else desde
+    if not en_archivo and desde_bd < hasta:
+        filas = _pagina_bd(sb, desde_bd, hasta, filtros, cursor, limite + 1)
+    if corte is not None and len(filas) <= limite:
+        arch = _movimientos_archivados(desde, min(hasta, corte), filtros)
+        if en_archivo:
+            cf = pd.Timestamp(cursor[0])
+            arch = arch[(arch["fecha_hora"] < cf) | ((arch["fecha_hora"] == cf) & (arch["id"] < cursor[1]))]
+        arch = arch.head(limite + 1 - len(filas))
+        filas += arch.assign(fecha_hora=arch["fecha_hora"].map(pd.Timestamp.isoformat)).to_dict("records")
+    siguiente = (filas[limite - 1]["fecha_hora"], filas[limite - 1]["id"]) if len(filas) > limite else None
+    df = pd.DataFrame(filas[:limite])
+    if not df.empty:
+        df["fecha_hora"] = pd.to_datetime(df["fecha_hora"], utc=True, format="ISO8601")
+    return df, siguiente
+
+
+def resumen_movimientos(sb, desde: datetime, hasta: datetime, filtros: dict | None = None) -> pd.DataFrame:
+    """Conteo, unidades y primera/última fecha por bodega y tipo, agregados en SQL (y en el archivo)."""
+    filtros = filtros or {}
+    corte = _corte_archivo(desde)
+    corte = pd.Timestamp(corte, tz="UTC") if corte else None
+    desde_bd = max(desde, corte) if corte is not None else desde
+    filas = []
+    try:
+        if desde_bd < hasta:
+            filas = sb.rpc("sp_movimientos_resumen", _params_mov(desde_bd, hasta, filtros)).execute().data or []
+    except Exception:
+        pass  # No se agregan los movimientos de la base en pandas: sin la RPC esa parte queda vacía
+    df = pd.DataFrame(filas, columns=RESUMEN_COLS)
+    for c in ("primera","ultima"):
+        df[c] = pd.to_datetime(df[c], utc=True, format="ISO8601")
+    if corte is not None:
+        arch = _movimientos_archivados(desde, min(hasta, corte), filtros)
+        if not arch.empty:
+            arch = arch.groupby(["bodega","movimiento"], as_index=False).agg(
+                movimientos=("id", "size"), unidades=("cantidad", "sum"), primera=("fecha_hora", "min"), ultima=("fecha_hora", "max"))
+            df = (pd.concat([df, arch], ignore_index=True)
+                  .groupby(["bodega","movimiento"], as_index=False)
+                  .agg(movimientos=("movimientos", "sum"), unidades=("unidades", "sum"), primera=("primera", "min"), ultima=("ultima", "max")))
+    return df[RESUMEN_COLS]
+
+
+# ==========================
+# Operaciones (RPC)
+# ==========================
+
+# operación → (función RPC, parámetro del código, bodega cuyo stock devuelve la RPC)
+OPERACIONES = {
+    "entrada_crudo": ("sp_entrada_crudo", "p_codigo_crudo", "Bodega1"),
+    "producir_terminado": ("sp_producir_terminado", "p_codigo_terminado", "Bodega2"),
+    "salida_terminado": ("sp_salida_terminado", "p_codigo_terminado", "Bodega2"),
+    "devolucion_terminado": ("sp_devolucion_terminado", "p_codigo_terminado", "Bodega2"),
+    "correccion_terminado_a_crudo": ("sp_correccion_terminado_a_crudo", "p_codigo_terminado", "Bodega2"),
+    "correccion_crudo_descuento": ("sp_correccion_crudo_descuento", "p_codigo_crudo", "Bodega1"),
+}
+
+
+def rpc(sb, name: str, params: dict):
+    return sb.rpc(name, params).execute()
+
+
+def stock_nuevo(res, bodega: str, codigo: str) -> int | None:
+    """Cantidad nueva de (bodega, codigo) en la respuesta de una RPC de stock."""
+    for r in (res.data or []) if isinstance(res.data, list) else []:
+        if r.get("bodega") == bodega and r.get("codigo_barras") == codigo:
+            return int(r["cantidad"])
+    return None
+
+
+def movimientos_de(filas: list[dict] | None) -> pd.DataFrame:
+    """Movimientos insertados por una RPC de stock, con las columnas de la tabla movimientos."""
+    cols = ["id","fecha_hora","codigo_barras","movimiento","cantidad","bodega"]
+    filas = [f for f in (filas or []) if f.get("mov_id") is not None]
+    if not filas:
+        return pd.DataFrame(columns=cols)
+    df = pd.DataFrame(filas).rename(columns={"mov_id": "id", "mov_fecha": "fecha_hora", "mov_tipo": "movimiento", "cantidad": "stock", "mov_cantidad": "cantidad"})
+    df["fecha_hora"] = pd.to_datetime(df["fecha_hora"], utc=True, format="ISO8601")
+    return df[cols]
+
+
+def aplicar_stock(b1: pd.DataFrame, b2: pd.DataFrame, filas: list[dict] | None, dim: pd.DataFrame | None = None):
+    """Parchea b1/b2 con las cantidades nuevas que devuelve una RPC de stock.
+
+    Las filas existentes se actualizan en el lugar; un código nuevo en la bodega se agrega
+    (con detalle desde la dimensión de productos si se pasa). Devuelve (b1, b2).
+    """
+    out = []
+    nuevas = pd.DataFrame(filas or [], columns=["codigo_barras","bodega","cantidad"])
+    for bodega, df in (("Bodega1", b1), ("Bodega2", b2)):
+        cant = nuevas[nuevas["bodega"] == bodega].drop_duplicates("codigo_barras", keep="last").set_index("codigo_barras")["cantidad"]
+        if cant.empty:
+            out.append(df)
+            continue
+        if df.empty:
+            df = pd.DataFrame(columns=["codigo_barras","detalle","cantidad"])
+        existe = df["codigo_barras"].isin(cant.index)
+        df.loc[existe, "cantidad"] = df.loc[existe, "codigo_barras"].map(cant).to_numpy()
+        faltan = cant[~cant.index.isin(df.loc[existe, "codigo_barras"])]
+        if not faltan.empty:
+            det = faltan.index.map(detalles(dim, TIPO_BODEGA[bodega])) if dim is not None else None
+            df = pd.concat([df, pd.DataFrame({"codigo_barras": faltan.index, "detalle": det, "cantidad": faltan.to_numpy()})], ignore_index=True)
+        out.append(df)
+    return tuple(out)
+
+
+def registrar_movimiento(sb, operacion: str, codigo: str, cantidad: int, usuario: str = "system", obs: str | None = None) -> int | None:
+    """Ejecuta una operación de stock y devuelve el stock nuevo del código en su bodega."""
+    nombre, p_codigo, bodega = OPERACIONES[operacion]
+    params = {p_codigo: codigo, "p_cantidad": int(cantidad), "p_usuario": usuario}
+    if obs:
+        params["p_obs"] = obs  # sin obs rige el default de la función SQL
+    return stock_nuevo(rpc(sb, nombre, params), bodega, codigo)
+
+
+def crear_producto_crudo(sb, codigo: str, detalle: str):
+    return rpc(sb, "sp_crear_producto_crudo", {"p_codigo_crudo": codigo, "p_detalle_crudo": detalle})
+
+
+def crear_producto_terminado(sb, codigo: str, detalle: str, codigo_crudo: str):
+    return rpc(sb, "sp_crear_producto_terminado", {"p_codigo_terminado": codigo, "p_detalle": detalle, "p_codigo_crudo": codigo_crudo})
+
+
+def bom_set_componente(sb, codigo_terminado: str, codigo_crudo: str, cantidad: float):
+    return rpc(sb, "sp_bom_set_componente", {"p_codigo_terminado": codigo_terminado, "p_codigo_crudo": codigo_crudo, "p_cantidad": float(cantidad)})
+
+
+def bom_quitar_componente(sb, codigo_terminado: str, codigo_crudo: str):
+    return rpc(sb, "sp_bom_quitar_componente", {"p_codigo_terminado": codigo_terminado, "p_codigo_crudo": codigo_crudo})
+
+
+def set_umbral(sb, codigo: str, bodega: str, umbral: int):
+    return rpc(sb, "sp_set_umbral", {"p_codigo": codigo, "p_bodega": bodega, "p_umbral": int(umbral)})
+
+
+def set_umbral_default(sb, umbral: int):
+    """Umbral por defecto compartido: lo usan las alertas y es el valor inicial del dashboard."""
+    return rpc(sb, "sp_set_parametro", {"p_clave": "umbral_default", "p_valor": str(int(umbral))})
+
+
+def set_precio(sb, codigo: str, precio: float, vigente_desde: datetime | None = None, usuario: str | None = None):
+    params = {"p_codigo": codigo, "p_precio": float(precio), "p_usuario": usuario}
+    if vigente_desde is not None:
+        params["p_vigente_desde"] = vigente_desde.isoformat()
+    return rpc(sb, "sp_set_precio", params)
+
+
+# ==========================
+# Dimensión de productos
+# ==========================
+DIM_COLS = ["detalle","codigo_crudo","precio"]
+TIPO_BODEGA = {"Bodega1": "crudo", "Bodega2": "terminado"}
+
+
+def dimension_productos(crudos: pd.DataFrame, rela: pd.DataFrame, precios: pd.DataFrame | None = None) -> pd.DataFrame:
+    """Una fila por (tipo, código) (índice ordenado): detalle, crudo base y precio.
+
+    Crudos y terminados pueden compartir código, por eso el tipo es parte de la clave. Se arma
+    una vez por versión de catálogo/precios; los cruces se hacen con
+    `serie.map(detalles(dim, tipo))` o `detalle_por_bodega` en lugar de concat/merge.
+    """
+    partes = []
+    if not crudos.empty:
+        partes.append(pd.DataFrame({
+            "tipo": "crudo",
+            "codigo": crudos["codigo_crudo"].to_numpy(),
+            "detalle": crudos.get("detalle_crudo", pd.Series(index=crudos.index, dtype=object)).to_numpy(),
+            "codigo_crudo": crudos["codigo_crudo"].to_numpy(),
+        }))
+    if not rela.empty:
+        partes.append(pd.DataFrame({
+            "tipo": "terminado",
+            "codigo": rela["codigo_terminado"].to_numpy(),
+            "detalle": rela.get("detalle", pd.Series(index=rela.index, dtype=object)).to_numpy(),
+            "codigo_crudo": rela.get("codigo_crudo", pd.Series(index=rela.index, dtype=object)).to_numpy(),
+        }))
+    if not partes:
+        vacio = pd.MultiIndex.from_arrays([[], []], names=["tipo","codigo"])
+        return pd.DataFrame(columns=DIM_COLS, index=vacio)
+    dim = pd.concat(partes, ignore_index=True).set_index(["tipo","codigo"])
+    dim = dim[~dim.index.duplicated(keep="last")].sort_index()
+    codigos = dim.index.get_level_values("codigo")
+    dim["precio"] = codigos.map(_precio_por_codigo(precios)).fillna(0.0) if precios is not None else 0.0
+    return dim
+
+
+def detalles(dim: pd.DataFrame, tipo: str) -> pd.Series:
+    """detalle por código de un solo tipo ("crudo" o "terminado"), para `serie.map`."""
+    if tipo not in dim.index.get_level_values("tipo"):
+        return pd.Series(index=pd.Index([], dtype=object, name="codigo"), dtype=object)
+    return dim.xs(tipo, level="tipo")["detalle"]
+
+
+def detalle_por_bodega(dim: pd.DataFrame, bodegas: pd.Series, codigos: pd.Series) -> np.ndarray:
+    """detalle de cada (bodega, código): Bodega1 busca entre crudos y Bodega2 entre terminados."""
+    clave = pd.MultiIndex.from_arrays([pd.Series(bodegas).map(TIPO_BODEGA).to_numpy(), pd.Series(codigos).to_numpy()])
+    return dim["detalle"].reindex(clave).to_numpy()
+
+
+def etiquetas(dim: pd.DataFrame, tipo: str) -> dict:
+    """{"codigo — detalle": codigo} para los selectbox, sin iterrows."""
+    d = detalles(dim, tipo)
+    return dict(zip(d.index.astype(str) + " — " + d.fillna("").astype(str), d.index))
+
+
+def ultimo_mov_id(sb) -> int:
+    return alertas.ultimo_mov_id(sb)
+
+
+def clasificar_abc_xyz(sb, b1: pd.DataFrame, b2: pd.DataFrame, dim: pd.DataFrame, ventana_dias: int,
+                       bucket: str = "week", params: clasificacion.Parametros = clasificacion.Parametros()) -> pd.DataFrame:
+    """ABC/XYZ de ambas bodegas con la demanda de los períodos completos de los últimos
+    `ventana_dias` y el precio actual."""
+    desde, hasta = clasificacion.ventana_alineada(date.today(), ventana_dias, bucket)
+    demanda = cargar_demanda_sku(sb, desde, hasta, bucket)
+    precio = dim["precio"].droplevel("tipo")  # el precio es por código, igual para ambos tipos
+    out = clasificacion.clasificar({"Bodega1": b1, "Bodega2": b2}, demanda, precio[~precio.index.duplicated()],
+                                   clasificacion.n_periodos(desde, hasta, bucket), params)
+    return out.assign(detalle=detalle_por_bodega(dim, out["bodega"], out["codigo_barras"]))
+
+
+# ==========================
+# Analytics helpers (KPIs avanzados)
+# ==========================
+
+def compute_totales(b1: pd.DataFrame, b2: pd.DataFrame):
+    t_b1 = int(b1["cantidad"].sum()) if not b1.empty else 0
+    t_b2 = int(b2["cantidad"].sum()) if not b2.empty else 0
+    t_all = t_b1 + t_b2
+    p_b1 = (t_b1 / t_all * 100) if t_all else 0
+    p_b2 = (t_b2 / t_all * 100) if t_all else 0
+    skus_b1 = b1.shape[0]; skus_b2 = b2.shape[0]
+    return t_b1, t_b2, t_all, p_b1, p_b2, skus_b1, skus_b2
+
+
+def _precio_por_codigo(precios: pd.DataFrame) -> pd.Series:
+    """precio indexado por código (tabla de precios ya cargada o indexada por código)."""
+    if precios is None or precios.empty:
+        return pd.Series(dtype=float)
+    s = precios["precio"] if precios.index.name == "codigo" else precios.set_index("codigo")["precio"]
+    return pd.to_numeric(s, errors="coerce")
+
+
+def join_precios(inv_df: pd.DataFrame, precios: pd.DataFrame) -> pd.DataFrame:
+    if inv_df.empty:
+        inv_df = pd.DataFrame(columns=["codigo","cantidad","valor","precio"])
+        return inv_df
+    col = "codigo" if "codigo" in inv_df.columns else "codigo_barras"
+    out = inv_df.assign(precio=inv_df[col].map(_precio_por_codigo(precios)).fillna(0.0))
+    out["valor"] = out["cantidad"] * out["precio"]
+    return out
+
+
+def compute_rotacion_y_cobertura(mov: pd.DataFrame, ventana_dias=30):
+    """Rotación: unidades salidas/Venta en B2 en ventana.
+       Cobertura: días de stock (inventario_total / promedio diario de salidas).
+    """
+    if mov.empty:
+        return pd.DataFrame(columns=["codigo_barras","rotacion_30d","avg_diario","cobertura_dias"])
+    desde = pd.Timestamp.utcnow() - pd.Timedelta(days=ventana_dias)
+    d = mov[(mov["fecha_hora"] >= desde) & (mov["bodega"]=="Bodega2") & (mov["movimiento"].isin(["Salida","Venta"]))]
+    rot = d.groupby("codigo_barras")["cantidad"].sum().reset_index().rename(columns={"cantidad":"rotacion_30d"})
+    rot["avg_diario"] = rot["rotacion_30d"] / ventana_dias
+    return rot
+
+
+# ==========================
+# Exportar Excel
+# ==========================
+
+def sanitize_for_excel(df: pd.DataFrame) -> pd.DataFrame:
+    """Fechas sin tz y listas/dicts como texto (xlsxwriter no acepta ninguno de los dos)."""
+    out = df.copy()
+    for col in out.columns:
+        if pd.api.types.is_datetime64_any_dtype(out[col]):
+            out[col] = pd.to_datetime(out[col], errors="coerce")
+            if out[col].dt.tz is not None:
+                out[col] = out[col].dt.tz_convert(None)
+        out[col] = out[col].apply(lambda x: json.dumps(x) if isinstance(x, (list, dict)) else x)
+    return out
+
+
+def autosize(ws, df: pd.DataFrame, max_ancho: int = 40) -> None:
+    for idx, col in enumerate(df.columns):
+        try:
+            max_len = max([len(str(col))] + [len(str(x)) for x in df[col].astype(str).values])
+        except Exception:
+            max_len = len(str(col))
+        ws.set_column(idx, idx, min(max_len + 2, max_ancho))
+
+
+def movimientos_bodega2(mov: pd.DataFrame, dim: pd.DataFrame, desde: date, hasta: date) -> pd.DataFrame:
+    """Ingresos/salidas de Bodega2 entre desde y hasta (inclusive) con el detalle del terminado."""
+    cols = ["fecha","codigo_barras","detalle","movimiento","cantidad","usuario","observaciones"]
+    if mov.empty:
+        return pd.DataFrame(columns=cols)
+    m = mov[
+        (mov["bodega"] == "Bodega2") &
+        (mov["movimiento"].isin(["Producción", "Devolución", "Salida", "Venta"])) &
+        (mov["fecha_hora"].dt.date >= desde) &
+        (mov["fecha_hora"].dt.date <= hasta)
+    ]
+    m = m.assign(detalle=m["codigo_barras"].map(detalles(dim, "terminado"))).sort_values("fecha_hora")
+    return m.rename(columns={"fecha_hora": "fecha"})[cols]
+
+
+def excel_bodega2(b2: pd.DataFrame, mov: pd.DataFrame, dim: pd.DataFrame, desde: date, hasta: date) -> bytes:
+    """Libro con hojas Inventario_B2 (stock actual) y Movimientos_B2 (rango pedido)."""
+    inv_b2 = b2[["codigo_barras", "detalle", "cantidad"]].sort_values("codigo_barras") if not b2.empty else pd.DataFrame(columns=["codigo_barras","detalle","cantidad"])
+    hojas = {
+        "Inventario_B2": sanitize_for_excel(inv_b2),
+        "Movimientos_B2": sanitize_for_excel(movimientos_bodega2(mov, dim, desde, hasta)),
+    }
+    buffer = BytesIO()
+    with pd.ExcelWriter(buffer, engine="xlsxwriter", datetime_format="yyyy-mm-dd hh:mm:ss") as writer:
+        for nombre, df in hojas.items():
+            df.to_excel(writer, index=False, sheet_name=nombre)
+            autosize(writer.sheets[nombre], df)
+    return buffer.getvalue()
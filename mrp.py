@@ -0,0 +1,123 @@
+"""
+MRP: factibilidad de producción sobre la BOM (bom_terminados) con álgebra dispersa.
+
+La BOM se representa como una matriz dispersa A (terminados × crudos) donde
+A[i, j] = unidades del crudo j que consume una unidad del terminado i.
+
+- Máximo producible de cada terminado con el stock actual de Bodega1:
+  min_j floor(stock[j] / A[i, j]) sobre los componentes del terminado (cada uno por separado).
+- Faltantes de un plan de producción p (vector por terminado):
+  max(Aᵀ·p − stock, 0) por crudo.
+
+Todo se calcula de una vez para todos los terminados (sin bucles por producto).
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+BOM_COLS = ["codigo_terminado", "codigo_crudo", "cantidad"]
+
+# Tolerancia para ratios decimales (p. ej. 3 / 0.1 = 29.999…)
+_EPS = 1e-9
+
+
+def bom_desde_relacion(rela: pd.DataFrame) -> pd.DataFrame:
+    """BOM 1:1 derivada de relacion_crudo_terminado (si aún no existe bom_terminados)."""
+    if rela.empty or "codigo_crudo" not in rela.columns:
+        return pd.DataFrame(columns=BOM_COLS)
+    out = rela.loc[rela["codigo_crudo"].notna(), ["codigo_terminado", "codigo_crudo"]].copy()
+    out["cantidad"] = 1.0
+    return out
+
+
+def construir_matriz(bom: pd.DataFrame, terminados=None, crudos=None):
+    """Devuelve (A, idx_terminados, idx_crudos) con A en formato CSR.
+
+    `terminados` / `crudos` fijan el orden de filas/columnas (p. ej. todo el catálogo);
+    si no se pasan se usan los códigos presentes en la BOM.
+    """
+    idx_t = pd.Index(pd.unique(bom["codigo_terminado"]) if terminados is None else terminados, dtype=object)
+    idx_c = pd.Index(pd.unique(bom["codigo_crudo"]) if crudos is None else crudos, dtype=object)
+    filas = idx_t.get_indexer(bom["codigo_terminado"])
+    cols = idx_c.get_indexer(bom["codigo_crudo"])
+    ok = (filas >= 0) & (cols >= 0)
+    datos = pd.to_numeric(bom["cantidad"], errors="coerce").to_numpy(dtype=float)
+    ok &= np.isfinite(datos) & (datos > 0)
+    A = sparse.csr_matrix(
+        (datos[ok], (filas[ok], cols[ok])),
+        shape=(len(idx_t), len(idx_c)),
+    )
+    A.sum_duplicates()
+    return A, idx_t, idx_c
+
+
+def vector_stock(b1: pd.DataFrame, idx_crudos: pd.Index) -> np.ndarray:
+    """Stock de Bodega1 alineado a las columnas de la matriz (0 si no hay fila)."""
+    if b1.empty:
+        return np.zeros(len(idx_crudos))
+    s = b1.set_index("codigo_barras")["cantidad"]
+    s = s[~s.index.duplicated(keep="last")]
+    return s.reindex(idx_crudos).fillna(0).clip(lower=0).to_numpy(dtype=float)
+
+
+def max_producible(A: sparse.csr_matrix, stock: np.ndarray):
+    """Máximo producible por terminado y crudo cuello de botella (índice de columna, -1 si no hay BOM)."""
+    n = A.shape[0]
+    nnz_fila = np.diff(A.indptr)
+    con_bom = nnz_fila > 0
+    maximo = np.zeros(n)
+    cuello = np.full(n, -1, dtype=np.int64)
+    if A.nnz == 0:
+        return maximo, cuello
+
+    ratios = np.floor(stock[A.indices] / A.data + _EPS)
+    maximo[con_bom] = np.minimum.reduceat(ratios, A.indptr[:-1][con_bom])
+
+    # Primer componente que alcanza el mínimo de su fila = cuello de botella
+    fila_de = np.repeat(np.arange(n), nnz_fila)
+    es_min = ratios == maximo[fila_de]
+    filas_min, primero = np.unique(fila_de[es_min], return_index=True)
+    cuello[filas_min] = A.indices[es_min][primero]
+    return maximo, cuello
+
+
+def requerimientos(A: sparse.csr_matrix, plan: np.ndarray) -> np.ndarray:
+    """Crudo requerido por un plan (unidades por terminado): Aᵀ·plan."""
+    return np.ceil(A.T @ plan - _EPS)
+
+
+def factibilidad(bom: pd.DataFrame, b1: pd.DataFrame, terminados=None) -> pd.DataFrame:
+    """Máximo producible de TODOS los terminados con el stock actual de Bodega1."""
+    cols = ["codigo_terminado", "max_producible", "cuello_botella", "componentes"]
+    if bom.empty:
+        return pd.DataFrame(columns=cols)
+    A, idx_t, idx_c = construir_matriz(bom, terminados=terminados)
+    maximo, cuello = max_producible(A, vector_stock(b1, idx_c))
+    cuello_cod = np.where(cuello >= 0, idx_c.to_numpy()[np.maximum(cuello, 0)], None)
+    return pd.DataFrame({
+        "codigo_terminado": idx_t,
+        "max_producible": maximo.astype(np.int64),
+        "cuello_botella": cuello_cod,
+        "componentes": np.diff(A.indptr),
+    }, columns=cols)
+
+
+def faltantes_plan(bom: pd.DataFrame, b1: pd.DataFrame, plan: pd.Series) -> pd.DataFrame:
+    """Requerido vs stock por crudo para un plan {codigo_terminado: cantidad}."""
+    cols = ["codigo_crudo", "requerido", "stock", "faltante"]
+    plan = pd.to_numeric(pd.Series(plan, dtype=object), errors="coerce").fillna(0)
+    plan = plan[plan > 0]
+    if bom.empty or plan.empty:
+        return pd.DataFrame(columns=cols)
+    A, idx_t, idx_c = construir_matriz(bom)
+    p = plan.groupby(level=0).sum().reindex(idx_t).fillna(0).to_numpy(dtype=float)
+    req = requerimientos(A, p)
+    stock = vector_stock(b1, idx_c)
+    out = pd.DataFrame({
+        "codigo_crudo": idx_c,
+        "requerido": req.astype(np.int64),
+        "stock": stock.astype(np.int64),
+        "faltante": np.maximum(req - stock, 0).astype(np.int64),
+    }, columns=cols)
+    return out[out["requerido"] > 0].sort_values(["faltante", "requerido"], ascending=False, ignore_index=True)
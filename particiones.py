@@ -0,0 +1,254 @@
+"""
+Particionado mensual de `movimientos` + archivado de particiones viejas a Parquet.
+
+Uso (requiere conexión directa a Postgres, p. ej. la "Connection string" de Supabase en DATABASE_URL):
+    python particiones.py crear --meses 3          # asegura particiones hasta 3 meses adelante
+    python particiones.py listar                   # particiones y filas
+    python particiones.py archivar --horizonte 12  # exporta a Parquet y suelta particiones > 12 meses
+
+Variables de entorno:
+- DATABASE_URL       conexión Postgres (solo para esta herramienta; la app sigue usando SUPABASE_URL/KEY)
+- ARCHIVO_DIR        carpeta local del archivo Parquet (default: ./archivo)
+- HORIZONTE_MESES    meses que se mantienen en la base (default: 12)
+
+La app lee el archivo con `leer_archivo()` cuando la consulta pide fechas anteriores
+al horizonte, así el histórico sigue visible aunque ya no esté en la base.
+
+---
+SQL — MIGRACIÓN (ejecutar una vez en Supabase SQL Editor)
+-------------------------------------------------------------------
+begin;
+alter table movimientos rename to movimientos_legacy;
+
+create table movimientos (
+  id bigint generated by default as identity,
+  fecha_hora timestamptz not null default now(),
+  codigo_barras text not null,
+  movimiento text not null check (movimiento in ('Entrada','Salida','Producción','Venta','Devolución')),
+  cantidad int not null check (cantidad > 0),
+  bodega text not null check (bodega in ('Bodega1','Bodega2')),
+  usuario text,
+  observaciones text,
+  primary key (id, fecha_hora)
+) partition by range (fecha_hora);
+
+-- Los índices sobre la tabla padre se crean en cada partición
+create index if not exists idx_mov_codigo_fecha on movimientos (codigo_barras, fecha_hora);
+create index if not exists idx_mov_bodega_fecha on movimientos (bodega, fecha_hora);
+
+-- Red de seguridad: filas sin partición mensual caen aquí (mantener vacía con `crear`)
+create table if not exists movimientos_default partition of movimientos default;
+
+-- Crea (si no existe) la partición del mes de p_mes: movimientos_YYYY_MM
+create or replace function sp_crear_particion_mes(p_mes date)
+returns text language plpgsql as $$
+declare v_desde date := date_trunc('month', p_mes)::date; v_nombre text;
+begin
+  v_nombre := format('movimientos_%s', to_char(v_desde, 'YYYY_MM'));
+  execute format(
+    'create table if not exists %I partition of movimientos for values from (%L) to (%L)',
+    v_nombre, v_desde, (v_desde + interval '1 month')::date
+  );
+  return v_nombre;
+end;$$;
+
+-- Particiones para todo el histórico + 3 meses adelante
+select sp_crear_particion_mes(m::date)
+from generate_series(
+  date_trunc('month', (select coalesce(min(fecha_hora), now()) from movimientos_legacy)),
+  date_trunc('month', now()) + interval '3 months',
+  interval '1 month'
+) m;
+
+insert into movimientos(id, fecha_hora, codigo_barras, movimiento, cantidad, bodega, usuario, observaciones)
+overriding system value
+select id, fecha_hora, codigo_barras, movimiento, cantidad, bodega, usuario, observaciones from movimientos_legacy;
+
+select setval(pg_get_serial_sequence('movimientos', 'id'), (select coalesce(max(id), 1) from movimientos));
+commit;
+
+-- Verificar conteos y luego: drop table movimientos_legacy;
+-------------------------------------------------------------------
+"""
+
+import argparse
+import os
+import re
+from datetime import date, datetime
+from pathlib import Path
+
+import pandas as pd
+
+ARCHIVO_DIR = Path(os.getenv("ARCHIVO_DIR", "archivo"))
+HORIZONTE_MESES = int(os.getenv("HORIZONTE_MESES", "12"))
+
+MOV_COLS = ["id", "fecha_hora", "codigo_barras", "movimiento", "cantidad", "bodega", "usuario", "observaciones"]
+
+_RE_PARTICION = re.compile(r"^movimientos_(\d{4})_(\d{2})$")
+
+
+def _dir_movimientos(base: Path | None = None) -> Path:
+    return (base or ARCHIVO_DIR) / "movimientos"
+
+
+def mes_de_particion(nombre: str) -> date | None:
+    m = _RE_PARTICION.match(nombre)
+    return date(int(m.group(1)), int(m.group(2)), 1) if m else None
+
+
+def inicio_horizonte(horizonte_meses: int = HORIZONTE_MESES, hoy: date | None = None) -> date:
+    """Primer día del mes más antiguo que se mantiene en la base."""
+    hoy = hoy or date.today()
+    total = hoy.year * 12 + (hoy.month - 1) - horizonte_meses
+    return date(total // 12, total % 12 + 1, 1)
+
+
+def _utc(ts) -> pd.Timestamp:
+    ts = pd.Timestamp(ts)
+    return ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+
+
+# ==========================
+# Lectura del archivo (usada por la app)
+# ==========================
+
+def meses_archivados(base: Path | None = None) -> list[date]:
+    d = _dir_movimientos(base)
+    if not d.exists():
+        return []
+    meses = [mes_de_particion(p.stem) for p in d.glob("movimientos_*.parquet")]
+    return sorted(m for m in meses if m is not None)
+
+
+def leer_archivo(desde: datetime | None = None, hasta: datetime | None = None, base: Path | None = None) -> pd.DataFrame:
+    """Movimientos archivados en Parquet dentro de [desde, hasta] (solo abre los meses necesarios)."""
+    d = _dir_movimientos(base)
+    archivos = []
+    for mes in meses_archivados(base):
+        fin_mes = (pd.Timestamp(mes) + pd.offsets.MonthBegin(1)).date()
+        if desde is not None and fin_mes <= pd.Timestamp(desde).date():
+            continue
+        if hasta is not None and mes > pd.Timestamp(hasta).date():
+            continue
+        archivos.append(d / f"movimientos_{mes:%Y_%m}.parquet")
+    if not archivos:
+        return pd.DataFrame(columns=MOV_COLS)
+
+    df = pd.concat([pd.read_parquet(a) for a in archivos], ignore_index=True)
+    df["fecha_hora"] = pd.to_datetime(df["fecha_hora"], utc=True)
+    if desde is not None:
+        df = df[df["fecha_hora"] >= _utc(desde)]
+    if hasta is not None:
+        df = df[df["fecha_hora"] <= _utc(hasta)]
+    return df.reset_index(drop=True)
+
+
+def requiere_archivo(desde: datetime | None, base: Path | None = None) -> bool:
+    """True si el rango pedido empieza antes del mes más reciente archivado."""
+    meses = meses_archivados(base)
+    if not meses:
+        return False
+    if desde is None:
+        return True
+    ultimo_fin = (pd.Timestamp(meses[-1]) + pd.offsets.MonthBegin(1)).date()
+    return pd.Timestamp(desde).date() < ultimo_fin
+
+
+# ==========================
+# Herramienta de mantenimiento (Postgres directo)
+# ==========================
+
+def _conectar():
+    import psycopg
+
+    url = os.getenv("DATABASE_URL")
+    if not url:
+        raise SystemExit("Falta DATABASE_URL (conexión directa a Postgres)")
+    return psycopg.connect(url)
+
+
+def listar_particiones(conn) -> pd.DataFrame:
+    rows = conn.execute(
+        """
+        select c.relname, c.reltuples::bigint
+        from pg_inherits i
+        join pg_class c on c.oid = i.inhrelid
+        join pg_class p on p.oid = i.inhparent
+        where p.relname = 'movimientos'
+        order by c.relname
+        """
+    ).fetchall()
+    df = pd.DataFrame(rows, columns=["particion", "filas_aprox"])
+    df["mes"] = df["particion"].map(mes_de_particion)
+    return df
+
+
+def crear_particiones(conn, meses_adelante: int = 3) -> list[str]:
+    hoy = date.today()
+    creadas = []
+    for k in range(meses_adelante + 1):
+        total = hoy.year * 12 + (hoy.month - 1) + k
+        mes = date(total // 12, total % 12 + 1, 1)
+        creadas.append(conn.execute("select sp_crear_particion_mes(%s)", (mes,)).fetchone()[0])
+    conn.commit()
+    return creadas
+
+
+def archivar_particion(conn, nombre: str, base: Path | None = None) -> int:
+    """Exporta una partición a Parquet (zstd), verifica conteo y la suelta de la base."""
+    d = _dir_movimientos(base)
+    d.mkdir(parents=True, exist_ok=True)
+    destino = d / f"{nombre}.parquet"
+    tmp = destino.with_suffix(".parquet.tmp")
+
+    cur = conn.execute(f'select {", ".join(MOV_COLS)} from "{nombre}" order by fecha_hora, id')
+    df = pd.DataFrame(cur.fetchall(), columns=MOV_COLS)
+    df["fecha_hora"] = pd.to_datetime(df["fecha_hora"], utc=True)
+    df.to_parquet(tmp, compression="zstd", index=False)
+
+    if len(pd.read_parquet(tmp, columns=["id"])) != len(df):
+        tmp.unlink(missing_ok=True)
+        raise RuntimeError(f"Conteo inconsistente al archivar {nombre}")
+    os.replace(tmp, destino)
+
+    with conn.transaction():
+        conn.execute(f'alter table movimientos detach partition "{nombre}"')
+        conn.execute(f'drop table "{nombre}"')
+    return len(df)
+
+
+def archivar(conn, horizonte_meses: int = HORIZONTE_MESES, dry_run: bool = False, base: Path | None = None) -> list[tuple[str, int]]:
+    corte = inicio_horizonte(horizonte_meses)
+    parts = listar_particiones(conn)
+    parts = parts[parts["mes"].notna()]
+    viejas = parts[parts["mes"] < corte]
+    hechas = []
+    for nombre in viejas["particion"]:
+        hechas.append((nombre, 0 if dry_run else archivar_particion(conn, nombre, base)))
+    return hechas
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Particiones mensuales de movimientos + archivo Parquet")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p_crear = sub.add_parser("crear", help="Crear particiones del mes actual y siguientes")
+    p_crear.add_argument("--meses", type=int, default=3)
+    sub.add_parser("listar", help="Listar particiones")
+    p_arch = sub.add_parser("archivar", help="Exportar a Parquet y soltar particiones fuera del horizonte")
+    p_arch.add_argument("--horizonte", type=int, default=HORIZONTE_MESES, help="Meses a conservar en la base")
+    p_arch.add_argument("--dry-run", action="store_true")
+    args = ap.parse_args(argv)
+
+    with _conectar() as conn:
+        if args.cmd == "crear":
+            for nombre in crear_particiones(conn, args.meses):
+                print(nombre)
+        elif args.cmd == "listar":
+            print(listar_particiones(conn).to_string(index=False))
+        else:
+            for nombre, filas in archivar(conn, args.horizonte, args.dry_run):
+                print(f"{nombre}\t{'(dry-run)' if args.dry_run else filas}")
+
+
+if __name__ == "__main__":
+    main()
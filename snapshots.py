@@ -0,0 +1,247 @@
+"""
+Precálculo de KPIs del dashboard en segundo plano con publicación atómica.
+
+Un `Refrescador` (hilo dentro de la app o sidecar CLI) recalcula inventarios, totales,
+valorizado, rotación, críticos y la serie de evolución cuando cambian los movimientos
+(nuevo id máximo), cuando se invalida a mano o cuando el snapshot supera `max_edad`.
+
+Cada resultado es un `Snapshot` congelado que se arma COMPLETO antes de publicarse;
+publicar solo reemplaza una referencia (copy-on-write del diccionario), así que los
+lectores nunca bloquean ni ven datos a medio construir. Los DataFrames de un snapshot
+son de solo lectura por contrato: quien necesite modificarlos debe copiarlos.
+
+Sidecar (publica en disco con os.replace; la app los lee si SNAPSHOT_DIR está definido):
+    python snapshots.py --dir snapshots --ventana 30 --umbral 5 --horizonte 90
+
+Con sidecar la app igual corre su propio `Refrescador`, pero solo para las claves que el
+sidecar no publica (o dejó de publicar) y para los refrescos forzados con `invalidar()`.
+"""
+
+import argparse
+import os
+import pickle
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+import pandas as pd
+
+import inventario as inv
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR")
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    clave: tuple  # (ventana_dias, umbral, horizonte_evo)
+    version: int
+    creado_en: datetime
+    ultimo_mov_id: int
+    b1: pd.DataFrame
+    b2: pd.DataFrame
+    precios: pd.DataFrame
+    totales: tuple
+    valor_b1: float
+    valor_b2: float
+    rotacion: pd.DataFrame
+    criticos: pd.DataFrame
+    evolucion: pd.DataFrame  # neto diario del horizonte (sin acumular)
+    duracion_s: float = 0.0
+
+    @property
+    def edad_s(self) -> float:
+        return (datetime.now(timezone.utc) - self.creado_en).total_seconds()
+
+
+def calcular(sb, clave: tuple, version: int = 0) -> Snapshot:
+    ventana_dias, umbral, horizonte = clave
+    t0 = time.perf_counter()
+    mov_id = inv.ultimo_mov_id(sb)
+    b1, b2 = inv.cargar_inventarios(sb)
+    precios = inv.cargar_precios(sb)
+    mov = inv.cargar_movimientos(sb, datetime.now(timezone.utc) - timedelta(days=ventana_dias))
+    hoy = date.today()
+    return Snapshot(
+        clave=clave,
+        version=version,
+        creado_en=datetime.now(timezone.utc),
+        ultimo_mov_id=mov_id,
+        b1=b1,
+        b2=b2,
+        precios=precios,
+        totales=inv.compute_totales(b1, b2),
+        valor_b1=float(inv.join_precios(b1, precios)["valor"].sum()),
+        valor_b2=float(inv.join_precios(b2, precios)["valor"].sum()),
+        rotacion=inv.compute_rotacion_y_cobertura(mov, ventana_dias=ventana_dias),
+        criticos=inv.cargar_criticos(sb, umbral, b1, b2),
+        evolucion=inv.cargar_evolucion(sb, hoy - timedelta(days=horizonte), hoy + timedelta(days=1)),
+        duracion_s=time.perf_counter() - t0,
+    )
+
+
+class AlmacenSnapshots:
+    """Último snapshot por clave. Lectura sin bloqueo; escritura por reemplazo de referencia."""
+
+    def __init__(self, directorio: str | Path | None = None, max_claves: int = 8, escribir: bool = True):
+        self.directorio = Path(directorio) if directorio else None
+        self.escribir = escribir  # False: solo lee lo que publica el sidecar
+        self.max_claves = max_claves
+        self._snaps: dict[tuple, Snapshot] = {}
+        self._claves: dict[tuple, float] = {}  # clave → último pedido (para refrescar solo lo que se mira)
+        self._lock = threading.Lock()
+        self._version = 0
+        self.invalidado = threading.Event()
+
+    # Lectores ---------------------------------------------------------
+    def obtener(self, clave: tuple) -> Snapshot | None:
+        self.registrar(clave)
+        if self.directorio is not None:
+            self._leer_disco(clave)
+        return self._snaps.get(clave)
+
+    def actual(self, clave: tuple) -> Snapshot | None:
+        """Como `obtener` pero sin marcar la clave como pedida (uso interno del refrescador)."""
+        return self._snaps.get(clave)
+
+    def claves_activas(self) -> list[tuple]:
+        return list(self._claves)
+
+    def cubierta_por_sidecar(self, clave: tuple, max_edad_s: float) -> bool:
+        """True si otro proceso publica esta clave en disco y lo hizo hace menos de max_edad_s."""
+        if self.directorio is None or self.escribir:
+            return False
+        try:
+            return time.time() - self._ruta(clave).stat().st_mtime <= max_edad_s
+        except FileNotFoundError:
+            return False
+
+    # Escritores -------------------------------------------------------
+    def siguiente_version(self) -> int:
+        with self._lock:
+            self._version += 1
+            return self._version
+
+    def publicar(self, snap: Snapshot) -> None:
+        with self._lock:
+            nuevo = dict(self._snaps)
+            nuevo[snap.clave] = snap
+            self._snaps = nuevo  # swap atómico: los lectores ven el dict viejo o el nuevo, nunca uno a medias
+        if self.directorio is not None and self.escribir:
+            self._escribir_disco(snap)
+
+    def invalidar(self) -> None:
+        self.invalidado.set()
+
+    def registrar(self, clave: tuple) -> None:
+        """Marca la clave como pedida: el refrescador la mantiene al día (el sidecar fija las suyas así)."""
+        with self._lock:
+            self._claves[clave] = time.monotonic()
+            if len(self._claves) > self.max_claves:
+                viejas = sorted(self._claves, key=self._claves.get)[: len(self._claves) - self.max_claves]
+                for c in viejas:
+                    self._claves.pop(c, None)
+                # Los snapshots siguen a las claves: nada fuera de las max_claves más recientes
+                self._snaps = {c: s for c, s in self._snaps.items() if c in self._claves}
+
+    # Internos ---------------------------------------------------------
+    def _ruta(self, clave: tuple) -> Path:
+        return self.directorio / f"snapshot_{'_'.join(str(x) for x in clave)}.pkl"
+
+    def _escribir_disco(self, snap: Snapshot) -> None:
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        ruta = self._ruta(snap.clave)
+        tmp = ruta.with_suffix(f".tmp{os.getpid()}")
+        with open(tmp, "wb") as f:
+            pickle.dump(snap, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, ruta)
+
+    def _leer_disco(self, clave: tuple) -> None:
+        ruta = self._ruta(clave)
+        actual = self._snaps.get(clave)
+        try:
+            mtime = ruta.stat().st_mtime
+        except FileNotFoundError:
+            return
+        if actual is not None and actual.creado_en.timestamp() >= mtime - 1:
+            return
+        with open(ruta, "rb") as f:
+            snap = pickle.load(f)
+        with self._lock:
+            nuevo = dict(self._snaps)
+            nuevo[clave] = snap
+            self._snaps = nuevo
+
+
+class Refrescador(threading.Thread):
+    """Recalcula las claves activas cuando cambian los movimientos, al invalidar o por edad."""
+
+    def __init__(self, sb, almacen: AlmacenSnapshots, chequeo_s: float = 5, max_edad_s: float = 300):
+        super().__init__(name="snapshots-kpi", daemon=True)
+        self.sb = sb
+        self.almacen = almacen
+        self.chequeo_s = chequeo_s
+        self.max_edad_s = max_edad_s
+        self.ultimo_error: str | None = None
+        self._parar = threading.Event()
+
+    def stop(self):
+        self._parar.set()
+        self.almacen.invalidar()
+
+    def refrescar(self, clave: tuple) -> Snapshot:
+        snap = calcular(self.sb, clave, self.almacen.siguiente_version())
+        self.almacen.publicar(snap)
+        return snap
+
+    def _pendientes(self, mov_id: int, forzar: bool) -> list[tuple]:
+        out = []
+        for clave in self.almacen.claves_activas():
+            if not forzar and self.almacen.cubierta_por_sidecar(clave, 2 * self.max_edad_s):
+                continue
+            snap = self.almacen.actual(clave)
+            if forzar or snap is None or snap.ultimo_mov_id != mov_id or snap.edad_s > self.max_edad_s:
+                out.append(clave)
+        return out
+
+    def run(self):
+        while not self._parar.is_set():
+            forzar = self.almacen.invalidado.is_set()
+            self.almacen.invalidado.clear()
+            try:
+                mov_id = inv.ultimo_mov_id(self.sb)
+                for clave in self._pendientes(mov_id, forzar):
+                    self.refrescar(clave)
+                self.ultimo_error = None
+            except Exception as e:
+                self.ultimo_error = str(e)
+            self.almacen.invalidado.wait(self.chequeo_s)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Sidecar: precálculo de KPIs del dashboard")
+    ap.add_argument("--dir", default=SNAPSHOT_DIR or "snapshots", help="Carpeta donde se publican los snapshots")
+    ap.add_argument("--ventana", type=int, nargs="+", default=[30], help="Ventanas de rotación (días)")
+    ap.add_argument("--umbral", type=int, default=5)
+    ap.add_argument("--horizonte", type=int, default=90, help="Horizonte de evolución (días)")
+    ap.add_argument("--chequeo", type=float, default=5, help="Segundos entre chequeos de movimientos nuevos")
+    ap.add_argument("--max-edad", type=float, default=300)
+    args = ap.parse_args(argv)
+
+    almacen = AlmacenSnapshots(args.dir, max_claves=len(args.ventana))
+    for v in args.ventana:
+        almacen.registrar((v, args.umbral, args.horizonte))
+    ref = Refrescador(inv.get_client(), almacen, args.chequeo, args.max_edad)
+    ref.start()
+    try:
+        while True:
+            time.sleep(args.chequeo)
+            if ref.ultimo_error:
+                print(f"Error refrescando snapshots: {ref.ultimo_error}")
+    except KeyboardInterrupt:
+        ref.stop()
+
+
+if __name__ == "__main__":
+    main()
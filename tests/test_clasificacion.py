@@ -0,0 +1,86 @@
+"""
+Clasificación ABC/XYZ (clasificacion.py): cortes ABC, bandas de CV para XYZ y ventana de
+períodos completos. Datos fijos, resultados calculados a mano.
+"""
+
+import sys
+from datetime import date
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import clasificacion  # noqa: E402
+
+
+def _stocks(b1: list, b2: list | None = None) -> dict:
+    return {b: pd.DataFrame({"codigo_barras": cods, "cantidad": [1] * len(cods)})
+            for b, cods in (("Bodega1", b1), ("Bodega2", b2 or []))}
+
+
+def _demanda(filas: list) -> pd.DataFrame:
+    return pd.DataFrame(filas, columns=["fecha","bodega","codigo_barras","unidades"])
+
+
+def _por_sku(out: pd.DataFrame, bodega: str = "Bodega1") -> pd.DataFrame:
+    return out[out["bodega"] == bodega].set_index("codigo_barras")
+
+
+# Valores 60 / 30 / 6 / 4 (precio 1): participación previa 0, 0.6, 0.9 y 0.96
+DEM_ABC = _demanda([
+    (date(2025, 3, 3), "Bodega1", "S1", 60),
+    (date(2025, 3, 3), "Bodega1", "S2", 30),
+    (date(2025, 3, 3), "Bodega1", "S3", 6),
+    (date(2025, 3, 3), "Bodega1", "S4", 4),
+    (date(2025, 3, 3), "Bodega2", "S9", 10),
+])
+PRECIOS = pd.Series(1.0, index=["S1","S2","S3","S4","S5","S9"])
+
+
+def test_abc_cortes_por_defecto():
+    out = clasificacion.clasificar(_stocks(["S1","S2","S3","S4","S5"], ["S9"]), DEM_ABC, PRECIOS, periodos=1)
+    b1 = _por_sku(out)
+    assert b1["abc"].astype(str).to_dict() == {"S1": "A", "S2": "A", "S3": "B", "S4": "C", "S5": "C"}
+    assert b1.loc["S5", "valor"] == 0
+    assert b1["acumulado"].tolist() == pytest.approx([0.6, 0.9, 0.96, 1.0, 1.0])
+    # Cada bodega se clasifica por separado
+    assert _por_sku(out, "Bodega2").loc["S9", "abc"] == "A"
+
+
+def test_abc_cortes_configurables():
+    params = clasificacion.Parametros(corte_a=0.5, corte_b=0.95)
+    out = clasificacion.clasificar(_stocks(["S1","S2","S3","S4"]), DEM_ABC, PRECIOS, periodos=1, params=params)
+    assert _por_sku(out)["abc"].astype(str).to_dict() == {"S1": "A", "S2": "B", "S3": "B", "S4": "C"}
+
+
+def test_xyz_bandas_de_cv():
+    # 4 semanas; los períodos sin fila cuentan como 0
+    semanas = [date(2025, 2, 3), date(2025, 2, 10), date(2025, 2, 17), date(2025, 2, 24)]
+    serie = {
+        "P": [10, 10, 10, 10],  # cv 0
+        "Q": [15, 5, 15, 5],    # cv 0.5 (borde de X)
+        "R": [10, 0, 10, 0],    # cv 1.0 (borde de Y)
+        "S": [20, 0, 0, 0],     # cv √3
+    }
+    dem = _demanda([(f, "Bodega1", c, u) for c, us in serie.items() for f, u in zip(semanas, us) if u])
+    out = clasificacion.clasificar(_stocks(list(serie) + ["T"]), dem, pd.Series(1.0, index=list(serie)), periodos=4)
+    b1 = _por_sku(out)
+    assert b1["xyz"].astype(str).to_dict() == {"P": "X", "Q": "X", "R": "Y", "S": "Z", "T": "Z"}
+    assert b1.loc[["P","Q","R","S"], "cv"].tolist() == pytest.approx([0.0, 0.5, 1.0, 3 ** 0.5])
+    assert pd.isna(b1.loc["T", "cv"])
+    assert b1.loc["R", "media"] == 5
+
+
+@pytest.mark.parametrize("hoy, ventana, bucket, esperado, periodos", [
+    (date(2025, 3, 12), 30, "week", (date(2025, 2, 10), date(2025, 3, 10)), 4),   # el límite cae en lunes
+    (date(2025, 3, 12), 28, "week", (date(2025, 2, 17), date(2025, 3, 10)), 3),   # semana parcial descartada
+    (date(2025, 3, 12), 3, "week", (date(2025, 3, 3), date(2025, 3, 10)), 1),     # al menos un período
+    (date(2025, 3, 12), 90, "month", (date(2025, 1, 1), date(2025, 3, 1)), 2),
+])
+def test_ventana_alineada(hoy, ventana, bucket, esperado, periodos):
+    desde, hasta = clasificacion.ventana_alineada(hoy, ventana, bucket)
+    assert (desde, hasta) == esperado
+    assert clasificacion.n_periodos(desde, hasta, bucket) == periodos
+    if bucket == "week":
+        assert desde.weekday() == 0 and hasta.weekday() == 0
@@ -0,0 +1,97 @@
+"""
+Concurrencia de las RPC de stock contra un Postgres de pruebas (INVENTARIO_TEST_DATABASE_URL).
+
+Se omite si esa variable no está definida; nunca lee DATABASE_URL. ⚠️ Recrea el esquema
+`public` de esa base (concurrencia.preparar_bd), que además debe llamarse *_test.
+"""
+
+import os
+import random
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+psycopg = pytest.importorskip("psycopg")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import concurrencia  # noqa: E402
+
+URL = os.getenv(concurrencia.URL_ENV)
+pytestmark = pytest.mark.skipif(not URL, reason=f"{concurrencia.URL_ENV} no definido")
+
+SIGNO = {"Entrada": 1, "Producción": 1, "Devolución": 1, "Salida": -1, "Venta": -1}
+
+# (rpc, parámetro de código, códigos del catálogo sembrado)
+OPERACIONES = [
+    ("sp_salida_terminado", "p_codigo_terminado", "T"),
+    ("sp_producir_terminado", "p_codigo_terminado", "T"),
+    ("sp_devolucion_terminado", "p_codigo_terminado", "T"),
+    ("sp_correccion_terminado_a_crudo", "p_codigo_terminado", "T"),
+    ("sp_entrada_crudo", "p_codigo_crudo", "C"),
+    ("sp_correccion_crudo_descuento", "p_codigo_crudo", "C"),
+]
+
+
+def _stock(conn) -> dict:
+    filas = conn.execute(
+        "select 'Bodega1', codigo_barras, cantidad from bodega1_crudos "
+        "union all select 'Bodega2', codigo_barras, cantidad from bodega2_terminados"
+    ).fetchall()
+    return {(b, c): q for b, c, q in filas}
+
+
+def _operador(codigos: dict, intentos: int, semilla: int, barrera: threading.Barrier, vistos: list, fallas: list) -> None:
+    rnd = random.Random(semilla)
+    try:
+        with psycopg.connect(URL, autocommit=True) as conn:
+            barrera.wait()
+            for _ in range(intentos):
+                rpc, param, tipo = rnd.choice(OPERACIONES)
+                params = {param: rnd.choice(codigos[tipo]), "p_cantidad": rnd.randint(1, 5), "p_usuario": "pytest"}
+                sql = f"select cantidad from {rpc}(" + ", ".join(f"{k} => %({k})s" for k in params) + ")"
+                try:
+                    vistos.extend(q for (q,) in conn.execute(sql, params).fetchall())
+                except psycopg.errors.RaiseException:
+                    pass  # stock insuficiente: rechazo de negocio esperado
+    except Exception as e:  # deadlocks u otros errores inesperados
+        fallas.append(repr(e))
+
+
+@pytest.fixture
+def bd():
+    with psycopg.connect(URL) as conn:
+        concurrencia.preparar_bd(conn)
+        concurrencia.sembrar(conn, n_crudos=3, n_terminados=4, stock=30)
+        yield conn
+
+
+def test_mezcla_concurrente_consistente(bd):
+    inicial = _stock(bd)
+    codigos = {"T": sorted(c for b, c in inicial if b == "Bodega2"), "C": sorted(c for b, c in inicial if b == "Bodega1")}
+    hilos, intentos = 12, 40
+    vistos, fallas = [], []
+    barrera = threading.Barrier(hilos)
+    ths = [threading.Thread(target=_operador, args=(codigos, intentos, i, barrera, vistos, fallas)) for i in range(hilos)]
+    for t in ths:
+        t.start()
+    for t in ths:
+        t.join()
+
+    assert not fallas
+    assert vistos and min(vistos) >= 0  # ningún stock devuelto por una RPC fue negativo
+
+    final = _stock(bd)
+    assert min(final.values()) >= 0
+    neto = {}
+    for bod, cod, mov, cant in bd.execute("select bodega, codigo_barras, movimiento, cantidad from movimientos").fetchall():
+        neto[(bod, cod)] = neto.get((bod, cod), 0) + SIGNO[mov] * cant
+    for clave, cantidad in final.items():
+        assert inicial.get(clave, 0) + neto.get(clave, 0) == cantidad, clave
+
+
+def test_ventas_simultaneas_del_mismo_sku():
+    r = concurrencia.correr(URL, "actual", hilos=16, stock=100, intentos=20)
+    assert r["consistente"]
+    assert r["ok"] == 100 and r["stock_final"] == 0
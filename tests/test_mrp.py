@@ -0,0 +1,67 @@
+"""
+Motor CSR de mrp.py: máximo producible, cuello de botella, requerimientos y faltantes de un plan.
+
+BOM fija y pequeña, resultados calculados a mano.
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import mrp  # noqa: E402
+
+# T1 usa 2 de C1 y 0.1 de C2; T2 usa 1 de C2; T3 solo tiene una fila en cero;
+# T4 mezcla una fila en cero (C1) con una válida (C2)
+BOM = pd.DataFrame([
+    ("T1", "C1", 2), ("T1", "C2", 0.1),
+    ("T2", "C2", 1),
+    ("T3", "C1", 0),
+    ("T4", "C1", 0), ("T4", "C2", 1),
+], columns=mrp.BOM_COLS)
+
+B1 = pd.DataFrame({"codigo_barras": ["C1", "C2"], "cantidad": [5, 3]})
+
+
+def test_construir_matriz_descarta_cantidades_en_cero():
+    A, idx_t, idx_c = mrp.construir_matriz(BOM)
+    assert list(idx_t) == ["T1", "T2", "T3", "T4"]
+    assert list(idx_c) == ["C1", "C2"]
+    assert A.nnz == 4
+    assert list(np.diff(A.indptr)) == [2, 1, 0, 1]
+
+
+def test_max_producible_y_cuello():
+    A, _, idx_c = mrp.construir_matriz(BOM)
+    maximo, cuello = mrp.max_producible(A, mrp.vector_stock(B1, idx_c))
+    # T1: min(5 // 2, 3 // 0.1) = 2 por C1; 3 / 0.1 no debe redondear a 29
+    assert list(maximo) == [2, 3, 0, 3]
+    assert list(cuello) == [0, 1, -1, 1]
+
+
+def test_factibilidad_sin_bom_efectiva():
+    fact = mrp.factibilidad(BOM, B1).set_index("codigo_terminado")
+    assert fact.loc["T3", "max_producible"] == 0
+    assert pd.isna(fact.loc["T3", "cuello_botella"])
+    assert fact.loc["T3", "componentes"] == 0
+    assert fact.loc["T1", "cuello_botella"] == "C1"
+
+
+def test_requerimientos_redondea_hacia_arriba():
+    A, _, _ = mrp.construir_matriz(BOM)
+    # C1: 3·2; C2: 3·0.1 + 1 + 1 = 2.3 → 3
+    assert list(mrp.requerimientos(A, np.array([3.0, 1.0, 5.0, 1.0]))) == [6, 3]
+
+
+def test_faltantes_plan():
+    falt = mrp.faltantes_plan(BOM, B1, pd.Series({"T1": 3, "T2": 1, "T3": 5, "X": 4}))
+    assert falt.to_dict("records") == [
+        {"codigo_crudo": "C1", "requerido": 6, "stock": 5, "faltante": 1},
+        {"codigo_crudo": "C2", "requerido": 2, "stock": 3, "faltante": 0},
+    ]
+
+
+def test_faltantes_plan_vacio():
+    assert mrp.faltantes_plan(BOM, B1, pd.Series({"T1": 0})).empty
@@ -0,0 +1,122 @@
+"""
+Valorización del inventario en el tiempo con historial de precios (vigente_desde).
+
+- Precio vigente de todos los SKUs a una fecha: último tramo con vigente_desde <= fecha.
+- Serie de valor: matriz cortes × SKUs de precios (cambios ubicados con searchsorted y
+  ffill) y de cantidades (stock actual menos el neto posterior a cada corte, suma
+  acumulada inversa). Valor por corte = suma fila a fila de Q·P, sin bucles por SKU.
+- Las matrices se arman por bloques de BLOQUE_SKUS columnas y se acumula la suma por
+  corte: la memoria queda en cortes × BLOQUE_SKUS, no en cortes × catálogo completo.
+"""
+
+import numpy as np
+import pandas as pd
+
+HIST_COLS = ["codigo","precio","vigente_desde"]
+_EPOCA = pd.Timestamp("1970-01-01", tz="UTC")
+BLOQUE_SKUS = 2048  # 365 cortes × 2048 SKUs × 8 B ≈ 6 MB por matriz
+
+
+def _utc(x) -> pd.Timestamp:
+    t = pd.Timestamp(x)
+    return t.tz_localize("UTC") if t.tzinfo is None else t.tz_convert("UTC")
+
+
+def _ns(fechas) -> np.ndarray:
+    """datetime64[ns] UTC sin tz, para searchsorted entre índices de distinta resolución."""
+    return pd.DatetimeIndex(pd.to_datetime(fechas, utc=True)).tz_localize(None).to_numpy(dtype="datetime64[ns]")
+
+
+def normalizar_historial(hist: pd.DataFrame) -> pd.DataFrame:
+    """Historial limpio: tipos fijos y orden (codigo, vigente_desde) que esperan las funciones de abajo."""
+    if hist is None or hist.empty:
+        return pd.DataFrame({"codigo": pd.Series(dtype=str), "precio": pd.Series(dtype=float),
+                             "vigente_desde": pd.Series(dtype="datetime64[ns, UTC]")})
+    out = hist[HIST_COLS].copy()
+    out["precio"] = pd.to_numeric(out["precio"], errors="coerce")
+    out["vigente_desde"] = pd.to_datetime(out["vigente_desde"], utc=True, format="ISO8601")
+    out = out.dropna(subset=["codigo","precio","vigente_desde"])
+    return out.sort_values(["codigo","vigente_desde"], kind="stable", ignore_index=True)
+
+
+def historial_desde_precios(precios: pd.DataFrame) -> pd.DataFrame:
+    """Sin tabla de historial: cada precio actual cuenta como vigente desde su updated_at."""
+    if precios is None or precios.empty:
+        return normalizar_historial(None)
+    h = precios.rename(columns={"updated_at": "vigente_desde"})
+    if "vigente_desde" not in h.columns:
+        h = h.assign(vigente_desde=_EPOCA)
+    h = h.assign(vigente_desde=pd.to_datetime(h["vigente_desde"], utc=True).fillna(_EPOCA))
+    return normalizar_historial(h)
+
+
+def precios_a_fecha(hist: pd.DataFrame, fecha, codigos=None) -> pd.Series:
+    """Precio vigente por código a `fecha` (0 si el código no tenía precio aún)."""
+    h = hist[hist["vigente_desde"] <= _utc(fecha)]
+    p = h.groupby("codigo", sort=False)["precio"].last()  # hist viene ordenado por vigencia
+    return p if codigos is None else p.reindex(codigos, fill_value=0.0)
+
+
+def cortes(desde, hasta, freq: str = "D") -> pd.DatetimeIndex:
+    """Instantes de corte (fin de cada bucket, exclusivo) entre desde y hasta."""
+    ini = _utc(desde).floor("D")
+    fin = _utc(hasta).ceil("D")
+    return pd.date_range(ini, fin, freq=freq, tz="UTC")[1:]
+
+
+def matriz_precios(hist: pd.DataFrame, codigos: pd.Index, cortes_: pd.DatetimeIndex) -> np.ndarray:
+    """P[r, c] = precio de codigos[c] vigente antes del corte r."""
+    P = np.full((len(cortes_), len(codigos)), np.nan)
+    col = codigos.get_indexer(hist["codigo"])
+    fila = np.searchsorted(_ns(cortes_), _ns(hist["vigente_desde"]), side="right")
+    ok = (col >= 0) & (fila > 0) & (fila < len(cortes_))
+    cambios = pd.DataFrame({"fila": fila[ok], "col": col[ok], "precio": hist["precio"].to_numpy()[ok]})
+    cambios = cambios.drop_duplicates(["fila","col"], keep="last")  # gana el último tramo dentro del bucket
+    P[cambios["fila"].to_numpy(), cambios["col"].to_numpy()] = cambios["precio"].to_numpy()
+    if len(cortes_):
+        # Fila 0: último tramo anterior al primer corte (incluye los anteriores al rango)
+        P[0] = precios_a_fecha(hist, cortes_[0] - pd.Timedelta(1, "ns"), codigos).to_numpy()
+    return pd.DataFrame(P).ffill().fillna(0.0).to_numpy()
+
+
+def matriz_cantidades(actual: pd.Series, neto: pd.DataFrame, codigos: pd.Index, cortes_: pd.DatetimeIndex) -> np.ndarray:
+    """Q[r, c] = stock de codigos[c] en el corte r: actual − neto de los buckets posteriores.
+
+    neto: (fecha, codigo_barras, neto) con fecha = inicio del bucket.
+    """
+    Q = np.broadcast_to(actual.reindex(codigos, fill_value=0).to_numpy(dtype=float), (len(cortes_), len(codigos))).copy()
+    if neto.empty or not len(cortes_):
+        return Q
+    col = codigos.get_indexer(neto["codigo_barras"])
+    k = np.searchsorted(_ns(cortes_), _ns(neto["fecha"]), side="right")  # primer corte que ya incluye el bucket
+    ok = col >= 0
+    D = np.zeros((len(cortes_) + 1, len(codigos)))
+    np.add.at(D, (k[ok], col[ok]), neto["neto"].to_numpy(dtype=float)[ok])
+    posterior = np.cumsum(D[::-1], axis=0)[::-1][1:]  # posterior[r] = Σ D[k] con k > r
+    return Q - posterior
+
+
+def valor_en_el_tiempo(stocks: dict, neto: pd.DataFrame, hist: pd.DataFrame, desde, hasta, freq: str = "D") -> pd.DataFrame:
+    """Valor del inventario por bodega en cada bucket (fecha = inicio del bucket).
+
+    stocks: {"Bodega1": df, "Bodega2": df} con el stock actual (codigo_barras, cantidad).
+    neto:   neto por bucket, bodega y SKU (fecha, bodega, codigo_barras, neto).
+    """
+    cs = cortes(desde, hasta, freq)
+    out = pd.DataFrame({"fecha": cs - pd.tseries.frequencies.to_offset(freq)})
+    for bodega, df in stocks.items():
+        actual = df.set_index("codigo_barras")["cantidad"] if not df.empty else pd.Series(dtype=float)
+        nb = neto[neto["bodega"] == bodega] if not neto.empty else neto
+        codigos = pd.Index(actual.index.union(nb["codigo_barras"].unique()) if not nb.empty else actual.index)
+        col_neto = codigos.get_indexer(nb["codigo_barras"]) if not nb.empty else np.empty(0, dtype=int)
+        col_hist = codigos.get_indexer(hist["codigo"])
+        total = np.zeros(len(cs))
+        for ini in range(0, len(codigos), BLOQUE_SKUS):
+            fin = ini + BLOQUE_SKUS
+            bloque = codigos[ini:fin]
+            nb_b = nb[(col_neto >= ini) & (col_neto < fin)] if not nb.empty else nb
+            Q = matriz_cantidades(actual, nb_b, bloque, cs)
+            P = matriz_precios(hist[(col_hist >= ini) & (col_hist < fin)], bloque, cs)
+            total += np.einsum("ij,ij->i", Q, P)
+        out[bodega] = total
+    return out